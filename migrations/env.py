@@ -0,0 +1,37 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from src.datamodel.manager.sqldb_manager import Base, engine
+# register all tables on the metadata
+import src.datamodel.interview  # noqa: F401
+import src.datamodel.rating  # noqa: F401
+
+config = context.config
+
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    context.configure(url=engine.url, target_metadata=target_metadata, literal_binds=True, render_as_batch=True)
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    with engine.connect() as connection:
+        # batch mode lets sqlite alter tables by copying them
+        context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True)
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,202 @@
+"""baseline schema
+
+Creates every table that is missing, so databases that were set up with
+`Base.metadata.create_all` before migrations existed are upgraded in place.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+interview_state_type = sa.Enum('active', 'paused', 'stopped', 'completed', name='interviewstatetype')
+transcription_status_type = sa.Enum('pending', 'processing', 'done', 'failed', name='transcriptionstatustype')
+
+
+def create_table(name, *columns, indexes=()):
+    if sa.inspect(op.get_bind()).has_table(name):
+        return False
+    op.create_table(name, *columns)
+    for index_name, index_columns, unique in indexes:
+        op.create_index(index_name, name, index_columns, unique=unique)
+    return True
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        sa.Sequence('increment_sequence', start=1000, increment=1).create(bind=bind, checkfirst=True)
+
+    create_table(
+        'users',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('username', sa.String()),
+        indexes=[('ix_users_id', ['id'], False), ('ix_users_username', ['username'], True)])
+
+    create_table(
+        'interviews',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('title', sa.String(), nullable=True),
+        sa.Column('business_segment', sa.String(), nullable=True),
+        sa.Column('createdAt', sa.DateTime()),
+        sa.Column('updatedAt', sa.DateTime()))
+
+    create_table(
+        'user_interviews',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id')),
+        sa.Column('interview_id', sa.Integer(), sa.ForeignKey('interviews.id')),
+        sa.Column('title', sa.String(), nullable=True),
+        sa.Column('selected_wiki', sa.Integer(), nullable=True),
+        sa.Column('createdAt', sa.DateTime()),
+        indexes=[('ix_user_interviews_user_id', ['user_id'], False),
+                 ('ix_user_interviews_interview_id', ['interview_id'], False)])
+
+    create_table(
+        'questions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('text', sa.String()),
+        sa.Column('audio', sa.String()),
+        sa.Column('category', sa.String()),
+        sa.Column('order', sa.Integer()),
+        sa.Column('interview_id', sa.Integer(), sa.ForeignKey('interviews.id')),
+        indexes=[('ix_questions_id', ['id'], False),
+                 ('ix_questions_text', ['text'], False),
+                 ('ix_questions_category', ['category'], False)])
+
+    # additional_questions and responses reference each other, the second key is added once both exist.
+    # sqlite can't add it afterwards, but accepts a reference to a table that doesn't exist yet
+    response_fk = [sa.ForeignKey('responses.id')] if bind.dialect.name == 'sqlite' else []
+    created_additional_questions = create_table(
+        'additional_questions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('text', sa.String()),
+        sa.Column('order', sa.Integer()),
+        sa.Column('category', sa.String()),
+        sa.Column('audio', sa.String()),
+        sa.Column('createdAt', sa.DateTime()),
+        sa.Column('user_interview_id', sa.Integer(), sa.ForeignKey('user_interviews.id')),
+        sa.Column('response_id', sa.Integer(), *response_fk, nullable=True),
+        indexes=[('ix_additional_questions_text', ['text'], False),
+                 ('ix_additional_questions_user_interview_id', ['user_interview_id'], False)])
+
+    create_table(
+        'responses',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('text', sa.String(), nullable=True),
+        sa.Column('audio', sa.String(), nullable=True),
+        sa.Column('audio_text', sa.String(), nullable=True),
+        sa.Column('skipped', sa.Boolean()),
+        sa.Column('is_additional', sa.Boolean()),
+        sa.Column('by_user', sa.Boolean()),
+        sa.Column('question_id', sa.Integer(), sa.ForeignKey('questions.id')),
+        sa.Column('additional_question_id', sa.Integer(), sa.ForeignKey('additional_questions.id')),
+        sa.Column('user_interview_id', sa.Integer(), sa.ForeignKey('user_interviews.id')),
+        indexes=[('ix_responses_question_id', ['question_id'], False),
+                 ('ix_responses_additional_question_id', ['additional_question_id'], False),
+                 ('ix_responses_user_interview_id', ['user_interview_id'], False)])
+
+    if created_additional_questions and bind.dialect.name != 'sqlite':
+        op.create_foreign_key('additional_questions_response_id_fkey', 'additional_questions', 'responses', ['response_id'], ['id'])
+
+    create_table(
+        'wikis',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('prompt_id', sa.String()),
+        sa.Column('selected', sa.Boolean()),
+        sa.Column('version', sa.Integer()),
+        sa.Column('content', sa.String()),
+        sa.Column('filepath', sa.String()),
+        sa.Column('user_interview_id', sa.Integer(), sa.ForeignKey('user_interviews.id')),
+        sa.Column('createdAt', sa.DateTime()),
+        indexes=[('ix_wikis_user_interview_id', ['user_interview_id'], False)])
+
+    create_table(
+        'costs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('tokens', sa.Integer()),
+        sa.Column('model', sa.String()),
+        sa.Column('user_interview_id', sa.Integer(), sa.ForeignKey('user_interviews.id')),
+        indexes=[('ix_costs_user_interview_id', ['user_interview_id'], False)])
+
+    create_table(
+        'history_summaries',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('summary', sa.String()),
+        sa.Column('summarized_turns', sa.Integer()),
+        sa.Column('tokens', sa.Integer()),
+        sa.Column('updatedAt', sa.DateTime()),
+        sa.Column('user_interview_id', sa.Integer(), sa.ForeignKey('user_interviews.id')),
+        indexes=[('ix_history_summaries_user_interview_id', ['user_interview_id'], True)])
+
+    create_table(
+        'interview_state',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('category', sa.String()),
+        sa.Column('step', sa.Integer()),
+        sa.Column('state', interview_state_type),
+        sa.Column('user_interview_id', sa.Integer(), sa.ForeignKey('user_interviews.id')),
+        indexes=[('ix_interview_state_user_interview_id', ['user_interview_id'], False)])
+
+    create_table(
+        'question_plan',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('category', sa.String()),
+        sa.Column('answered', sa.Boolean()),
+        sa.Column('skipped', sa.Boolean()),
+        sa.Column('question_id', sa.Integer(), sa.ForeignKey('questions.id'), nullable=True),
+        sa.Column('additional_question_id', sa.Integer(), sa.ForeignKey('additional_questions.id'), nullable=True),
+        sa.Column('user_interview_id', sa.Integer(), sa.ForeignKey('user_interviews.id'), nullable=False),
+        sa.UniqueConstraint('user_interview_id', 'position', name='uq_question_plan_position'))
+
+    create_table(
+        'transcriptions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('status', transcription_status_type),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('createdAt', sa.DateTime()),
+        sa.Column('updatedAt', sa.DateTime()),
+        sa.Column('response_id', sa.Integer(), sa.ForeignKey('responses.id')),
+        indexes=[('ix_transcriptions_response_id', ['response_id'], True)])
+
+    create_table(
+        'raw_responses',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('json_obj', sa.String()),
+        sa.Column('model', sa.String()),
+        sa.Column('tokens', sa.Integer()),
+        sa.Column('response_id', sa.Integer(), sa.ForeignKey('responses.id'), nullable=True),
+        sa.Column('user_interview_id', sa.Integer(), sa.ForeignKey('user_interviews.id'), nullable=True),
+        indexes=[('ix_raw_responses_response_id', ['response_id'], False),
+                 ('ix_raw_responses_user_interview_id', ['user_interview_id'], False)])
+
+    create_table(
+        'ratings',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('score', sa.Integer()),
+        sa.Column('feedback', sa.String(), nullable=True),
+        sa.Column('createdAt', sa.DateTime()),
+        sa.Column('user_interview_id', sa.Integer()),
+        indexes=[('ix_ratings_id', ['id'], False),
+                 ('ix_ratings_user_interview_id', ['user_interview_id'], False)])
+
+
+def downgrade():
+    for name in ['ratings', 'raw_responses', 'transcriptions', 'question_plan', 'interview_state', 'history_summaries',
+                 'costs', 'wikis']:
+        op.drop_table(name)
+    if op.get_bind().dialect.name != 'sqlite':
+        op.drop_constraint('additional_questions_response_id_fkey', 'additional_questions', type_='foreignkey')
+    for name in ['responses', 'additional_questions', 'questions', 'user_interviews', 'interviews', 'users']:
+        op.drop_table(name)
+    interview_state_type.drop(op.get_bind(), checkfirst=True)
+    transcription_status_type.drop(op.get_bind(), checkfirst=True)
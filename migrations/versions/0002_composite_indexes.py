@@ -0,0 +1,45 @@
+"""composite indexes for the hot queries
+
+- responses are looked up per user interview and question (state, submit, plan updates)
+- questions and additional questions are listed per interview in their order
+- wikis are listed per user interview, newest first
+- user interviews are paged per user by (createdAt, id)
+
+Revision ID: 0002_composite_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002_composite_indexes'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+
+indexes = [
+    ('ix_responses_user_interview_question', 'responses', ['user_interview_id', 'question_id']),
+    ('ix_responses_user_interview_additional_question', 'responses', ['user_interview_id', 'additional_question_id']),
+    ('ix_questions_interview_order', 'questions', ['interview_id', 'order']),
+    ('ix_additional_questions_user_interview_order', 'additional_questions', ['user_interview_id', 'order']),
+    ('ix_wikis_user_interview_created', 'wikis', ['user_interview_id', 'createdAt', 'version']),
+    ('ix_user_interviews_user_created', 'user_interviews', ['user_id', 'createdAt', 'id']),
+]
+
+
+def existing_indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    for name, table, columns in indexes:
+        if name not in existing_indexes(table):
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(indexes):
+        if name in existing_indexes(table):
+            op.drop_index(name, table_name=table)
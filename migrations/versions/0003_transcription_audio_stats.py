@@ -0,0 +1,47 @@
+"""audio preprocessing stats on transcriptions
+
+Size and duration of the recording before and after preprocessing, and the time spent
+preprocessing and in whisper, to follow the savings in STT latency and cost.
+
+Revision ID: 0003_transcription_audio_stats
+Revises: 0002_composite_indexes
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003_transcription_audio_stats'
+down_revision = '0002_composite_indexes'
+branch_labels = None
+depends_on = None
+
+
+columns = [
+    ('audio_bytes', sa.Integer),
+    ('processed_bytes', sa.Integer),
+    ('audio_duration', sa.Float),
+    ('processed_duration', sa.Float),
+    ('preprocess_ms', sa.Integer),
+    ('stt_ms', sa.Integer),
+]
+
+
+def existing_columns():
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns('transcriptions')}
+
+
+def upgrade():
+    existing = existing_columns()
+    with op.batch_alter_table('transcriptions') as batch_op:
+        for name, type_ in columns:
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, type_(), nullable=True))
+
+
+def downgrade():
+    existing = existing_columns()
+    with op.batch_alter_table('transcriptions') as batch_op:
+        for name, _ in reversed(columns):
+            if name in existing:
+                batch_op.drop_column(name)
@@ -0,0 +1,38 @@
+"""transcript cache
+
+Transcripts keyed by the sha256 of the recording, whisper model and language, so
+resubmitted recordings are not transcribed again.
+
+Revision ID: 0004_transcript_cache
+Revises: 0003_transcription_audio_stats
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004_transcript_cache'
+down_revision = '0003_transcription_audio_stats'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('transcript_cache'):
+        return
+    op.create_table(
+        'transcript_cache',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('audio_hash', sa.String(64), nullable=False),
+        sa.Column('model', sa.String(), nullable=False),
+        sa.Column('language', sa.String(), nullable=False),
+        sa.Column('transcript', sa.String(), nullable=False),
+        sa.Column('stt_calls', sa.Integer()),
+        sa.Column('stt_ms', sa.Integer(), nullable=True),
+        sa.Column('createdAt', sa.DateTime()),
+        sa.UniqueConstraint('audio_hash', 'model', 'language', name='uq_transcript_cache_key'))
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('transcript_cache'):
+        op.drop_table('transcript_cache')
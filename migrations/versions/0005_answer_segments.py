@@ -0,0 +1,50 @@
+"""answer segments
+
+Parts of a recording that are uploaded and transcribed while the user is still answering.
+
+Revision ID: 0005_answer_segments
+Revises: 0004_transcript_cache
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0005_answer_segments'
+down_revision = '0004_transcript_cache'
+branch_labels = None
+depends_on = None
+
+
+# created by the baseline revision
+transcription_status_type = postgresql.ENUM('pending', 'processing', 'done', 'failed', name='transcriptionstatustype', create_type=False)
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('answer_segments'):
+        return
+    op.create_table(
+        'answer_segments',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('recording', sa.String(), nullable=False),
+        sa.Column('index', sa.Integer(), nullable=False),
+        sa.Column('audio', sa.String(), nullable=False),
+        sa.Column('status', transcription_status_type),
+        sa.Column('transcript', sa.String(), nullable=True),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('audio_bytes', sa.Integer(), nullable=True),
+        sa.Column('processed_bytes', sa.Integer(), nullable=True),
+        sa.Column('audio_duration', sa.Float(), nullable=True),
+        sa.Column('processed_duration', sa.Float(), nullable=True),
+        sa.Column('preprocess_ms', sa.Integer(), nullable=True),
+        sa.Column('stt_ms', sa.Integer(), nullable=True),
+        sa.Column('createdAt', sa.DateTime()),
+        sa.Column('updatedAt', sa.DateTime()),
+        sa.Column('user_interview_id', sa.Integer(), sa.ForeignKey('user_interviews.id'), nullable=False),
+        sa.UniqueConstraint('user_interview_id', 'recording', 'index', name='uq_answer_segments_recording_index'))
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('answer_segments'):
+        op.drop_table('answer_segments')
@@ -0,0 +1,59 @@
+"""answer segments of a response
+
+Submitting an answer binds its segments to the response, so a later answer to the same
+question does not pick them up. Only the segments of the answer in progress stay unique.
+
+Revision ID: 0006_answer_segment_responses
+Revises: 0005_answer_segments
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006_answer_segment_responses'
+down_revision = '0005_answer_segments'
+branch_labels = None
+depends_on = None
+
+
+open_where = sa.text('response_id IS NULL')
+
+
+def existing():
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('answer_segments')}
+    constraints = {constraint['name'] for constraint in inspector.get_unique_constraints('answer_segments')}
+    indexes = {index['name'] for index in inspector.get_indexes('answer_segments')}
+    return columns, constraints, indexes
+
+
+def upgrade():
+    columns, constraints, indexes = existing()
+    with op.batch_alter_table('answer_segments') as batch_op:
+        if 'response_id' not in columns:
+            batch_op.add_column(sa.Column('response_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key('fk_answer_segments_response_id', 'responses', ['response_id'], ['id'])
+        if 'uq_answer_segments_recording_index' in constraints:
+            batch_op.drop_constraint('uq_answer_segments_recording_index', type_='unique')
+    if 'uq_answer_segments_open_recording_index' not in indexes:
+        op.create_index('uq_answer_segments_open_recording_index', 'answer_segments', ['user_interview_id', 'recording', 'index'],
+                        unique=True, postgresql_where=open_where, sqlite_where=open_where)
+    if 'ix_answer_segments_response' not in indexes:
+        op.create_index('ix_answer_segments_response', 'answer_segments', ['response_id'])
+
+
+def downgrade():
+    columns, constraints, indexes = existing()
+    if 'ix_answer_segments_response' in indexes:
+        op.drop_index('ix_answer_segments_response', table_name='answer_segments')
+    if 'uq_answer_segments_open_recording_index' in indexes:
+        op.drop_index('uq_answer_segments_open_recording_index', table_name='answer_segments')
+    # submitted answers may share indexes of a recording, only the open segments fit the old constraint
+    op.execute(sa.text('DELETE FROM answer_segments WHERE response_id IS NOT NULL'))
+    with op.batch_alter_table('answer_segments') as batch_op:
+        if 'uq_answer_segments_recording_index' not in constraints:
+            batch_op.create_unique_constraint('uq_answer_segments_recording_index', ['user_interview_id', 'recording', 'index'])
+        if 'response_id' in columns:
+            batch_op.drop_constraint('fk_answer_segments_response_id', type_='foreignkey')
+            batch_op.drop_column('response_id')
@@ -0,0 +1,44 @@
+"""history summary by response
+
+The rolling history summary remembers the response of the last answer it covers instead of
+a number of turns, which shifted when an answer was left out of the history. Summaries built
+on the old count are cleared and built again on the next analysis.
+
+Revision ID: 0007_history_summary_response
+Revises: 0006_answer_segment_responses
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007_history_summary_response'
+down_revision = '0006_answer_segment_responses'
+branch_labels = None
+depends_on = None
+
+
+def existing_columns():
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns('history_summaries')}
+
+
+def upgrade():
+    existing = existing_columns()
+    if 'summarized_response_id' in existing:
+        return
+    with op.batch_alter_table('history_summaries') as batch_op:
+        batch_op.add_column(sa.Column('summarized_response_id', sa.Integer(), nullable=True))
+        if 'summarized_turns' in existing:
+            batch_op.drop_column('summarized_turns')
+    op.execute(sa.text("UPDATE history_summaries SET summary = '', tokens = 0"))
+
+
+def downgrade():
+    existing = existing_columns()
+    if 'summarized_turns' in existing:
+        return
+    with op.batch_alter_table('history_summaries') as batch_op:
+        batch_op.add_column(sa.Column('summarized_turns', sa.Integer(), nullable=True))
+        if 'summarized_response_id' in existing:
+            batch_op.drop_column('summarized_response_id')
+    op.execute(sa.text("UPDATE history_summaries SET summary = '', summarized_turns = 0, tokens = 0"))
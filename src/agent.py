@@ -1,18 +1,37 @@
+import asyncio
 from datetime import datetime
 from enum import Enum
-from openai import AsyncOpenAI
-from typing import Dict, List
+import hashlib
+import json
+import random
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
+from typing import Callable, Dict, List
 import httpx
 import os
+import uuid
 
 from src.datamodel.prompt import PromptModel
 
 from .datamodel.message import MessageModel, Role
 from .helper.utils import conversation_from_history, string_conversation_from_history
+from .helper.llm_cache import LLM_CACHE_ENABLED, LLMCacheSingleton, cache_key
 from .helper.logger import getLogger
-from .prompts.offboarding_prompt import p_followup_questions, p_wiki
+from .helper.rate_limiter import BATCH, INTERACTIVE, RateLimiterSingleton
+from .helper.tokens import count_tokens
+from .prompts.offboarding_prompt import p_followup_questions, p_history_summary, p_wiki
 
 logging = getLogger()
+llm_cache = LLMCacheSingleton()
+rate_limiter = RateLimiterSingleton()
+
+# the sdk retries on its own are disabled, retries go through the rate limiter so they respect the shared budget
+PROVIDER_RETRIES = int(os.getenv("BB_PROVIDER_RETRIES", 3))
+OPENAI_TIMEOUT = float(os.getenv("BB_OPENAI_TIMEOUT", 180))
+RETRY_STATUS = {408, 409, 429}
+
+
+def retry_delay(attempt: int) -> float:
+    return min(2 ** attempt, 30) * random.uniform(0.5, 1.0)
 
 
 class GPTModel(Enum):
@@ -27,6 +46,8 @@ class AgentSingleton:
     _client = None
     _dify_client: httpx.AsyncClient = None
     _settings = None
+    _tts_settings = None
+    _stt_settings = None
     _dify_api_url = None
 
     def __new__(cls, *args, **kwargs):
@@ -34,8 +55,8 @@ class AgentSingleton:
             cls._instance = super(AgentSingleton, cls).__new__(cls, *args, **kwargs)
             cls._instance._client = AsyncOpenAI(
                 api_key=os.environ.get("OPENAI_API_KEY"),
-                timeout=5000,
-                max_retries=3
+                timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=5.0),
+                max_retries=0
             )
             cls._instance._settings = {
                 "model": 'gpt-4o',
@@ -43,6 +64,15 @@ class AgentSingleton:
                 "temperature": .2,
                 "stream": False,
             }
+            cls._instance._tts_settings = {
+                "model": "tts-1-hd",
+                "voice": "fable",
+                "response_format": "mp3",
+            }
+            cls._instance._stt_settings = {
+                "model": "whisper-1",
+                "language": "de",
+            }
 
             # Initialize HTTPX async client for DIFY
             cls._instance._dify_api_url = os.environ.get("DIFY_API_URL")
@@ -51,6 +81,34 @@ class AgentSingleton:
 
         return cls._instance
 
+    async def _openai_call(self, create, lane: str = INTERACTIVE, tokens: int = 0, consume=None, **kwargs):
+        """
+        Calls `create` (a `with_raw_response` method of the client) within the limits of the model and retries transient failures.
+        `consume` reads a streamed result while the slot is still held, a stream that breaks off is not retried.
+        """
+        bucket = f"openai:{kwargs['model']}"
+        for attempt in range(PROVIDER_RETRIES + 1):
+            pause = 0
+            async with rate_limiter.limit(bucket, tokens, lane):
+                try:
+                    response = await create(**kwargs)
+                    await rate_limiter.observe(bucket, response.status_code, response.headers)
+                except APIStatusError as e:
+                    pause = await rate_limiter.observe(bucket, e.status_code, e.response.headers)
+                    if attempt == PROVIDER_RETRIES or (e.status_code < 500 and e.status_code not in RETRY_STATUS):
+                        raise
+                    logging.warning(f"openai - {bucket} status {e.status_code}, retry {attempt + 1}/{PROVIDER_RETRIES}")
+                except APIConnectionError as e:  # includes timeouts
+                    if attempt == PROVIDER_RETRIES:
+                        raise
+                    logging.warning(f"openai - {bucket} {e}, retry {attempt + 1}/{PROVIDER_RETRIES}")
+                else:
+                    result = response.parse()
+                    return await consume(result) if consume else result
+            # a reported pause is waited for by the limiter, before the next attempt takes a slot
+            if not pause:
+                await asyncio.sleep(retry_delay(attempt))
+
     def get_settings(self):
         return self._settings
 
@@ -58,7 +116,9 @@ class AgentSingleton:
         self._settings = settings
         logging.info(self._settings)
 
-    async def completion(self, history: List[MessageModel] = [], query: MessageModel = '', model: None | GPTModel = None, max_tokens=500, as_json=False):
+    async def completion(self, history: List[MessageModel] = [], query: MessageModel = '', model: None | GPTModel = None, max_tokens=500, as_json=False, use_cache=True, lane: str = INTERACTIVE,
+                         on_chunk: Callable[[str], None] | None = None):
+        """Streams the answer if `on_chunk` is given, it is called with every piece of text as it arrives."""
         # TODO: Implement properly
         if len(history) > 0:
             for msg in history:
@@ -76,19 +136,53 @@ class AgentSingleton:
         if as_json:
             settings["response_format"] = {"type": "json_object"}
 
-        chat_completion = await self._client.chat.completions.create(
-            messages=ctx,
-            **settings,
-        )
-
-        return MessageModel(
-            role=Role.SYSTEM,
-            content=chat_completion.choices[0].message.content,
-            model=chat_completion.model,
-            tokens=chat_completion.usage.total_tokens
-        )
-
-    async def generate(self, query: MessageModel, model=None | GPTModel):
+        use_cache = use_cache and LLM_CACHE_ENABLED
+        key = cache_key("completion", settings['model'], settings, ctx)
+        if use_cache:
+            cached = await asyncio.to_thread(llm_cache.get, key)
+            if cached is not None:
+                logging.info(f"completion - cache hit {key}")
+                # a cached answer did not cost any tokens
+                message = MessageModel.model_validate_json(cached).model_copy(update={"tokens": 0})
+                if on_chunk is not None:
+                    on_chunk(message.content)
+                return message
+        else:
+            await asyncio.to_thread(llm_cache.bypass)
+
+        estimated = count_tokens(query.content, settings['model']) + max_tokens
+        if on_chunk is None:
+            chat_completion = await self._openai_call(self._client.chat.completions.with_raw_response.create,
+                                                      lane=lane, tokens=estimated, messages=ctx, **settings)
+            message = MessageModel(
+                role=Role.SYSTEM,
+                content=chat_completion.choices[0].message.content,
+                model=chat_completion.model,
+                tokens=chat_completion.usage.total_tokens
+            )
+        else:
+            async def consume(stream):
+                parts, model, tokens = [], settings['model'], 0
+                async for chunk in stream:
+                    model = chunk.model or model
+                    if chunk.usage:
+                        tokens = chunk.usage.total_tokens
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        on_chunk(parts[-1])
+                return MessageModel(role=Role.SYSTEM, content="".join(parts), model=model, tokens=tokens)
+
+            stream_settings = {**settings, "stream": True, "stream_options": {"include_usage": True}}
+            message = await self._openai_call(self._client.chat.completions.with_raw_response.create,
+                                              lane=lane, tokens=estimated, consume=consume, messages=ctx, **stream_settings)
+        await rate_limiter.record_tokens(f"openai:{settings['model']}", estimated, message.tokens)
+
+        if use_cache:
+            await asyncio.to_thread(llm_cache.set, key, message.model_dump_json())
+
+        return message
+
+    async def generate(self, query: MessageModel, model=None | GPTModel, lane: str = BATCH):
         settings = self._settings.copy()
         if model is not None:
             settings['model'] = model.value
@@ -96,10 +190,10 @@ class AgentSingleton:
 
         logging.info(f"generate - settings - {settings}")
 
-        chat_completion = await self._client.completions.create(
-            prompt=query.content,
-            **settings,
-        )
+        estimated = count_tokens(query.content, settings['model']) + settings['max_tokens']
+        chat_completion = await self._openai_call(self._client.completions.with_raw_response.create,
+                                                  lane=lane, tokens=estimated, prompt=query.content, **settings)
+        await rate_limiter.record_tokens(f"openai:{settings['model']}", estimated, chat_completion.usage.total_tokens)
 
         logging.info(f"generate - {chat_completion}")
         return MessageModel(
@@ -173,13 +267,15 @@ Achte unbedingt darauf, dass die Variablen in "cypher_queries" eindeutige Namen
             # model=GPTModel.GPT3_5,
             model=GPTModel.GPT_4o,
             max_tokens=3000,
-            as_json=True)
+            as_json=True,
+            lane=BATCH)
 
         logging.info(f"generate_graph - {sys_message} \n\n{mm}")
 
         return sys_message
 
-    async def generate_wiki(self, business_segment: str, history: List[MessageModel] = [], prompt: PromptModel = None, generate_conversation: bool = True):
+    async def generate_wiki(self, business_segment: str, history: List[MessageModel] = [], prompt: PromptModel = None, generate_conversation: bool = True, use_cache: bool = True,
+                            on_chunk: Callable[[str], None] | None = None):
         conversation = history
         if generate_conversation:
             conversation = conversation_from_history(history)
@@ -200,42 +296,177 @@ Achte unbedingt darauf, dass die Variablen in "cypher_queries" eindeutige Namen
             query=mm,
             model=GPTModel.GPT3_5,
             max_tokens=3000,
-            as_json=False)
+            as_json=False,
+            use_cache=use_cache,
+            lane=BATCH,
+            on_chunk=on_chunk)
 
         logging.info(f"generate_wiki - {sys_message} \n\n{mm}")
 
         return sys_message
 
-    async def stt(self, path: str):
+    async def summarise_history(self, business_segment: str, summary: str, turns: List[str], max_tokens: int = 500):
+        mm = MessageModel(
+            role=Role.USER,
+            model="",
+            tokens=0,
+            content=p_history_summary.format(
+                business_segment=business_segment,
+                summary=summary or "-",
+                turns="\n\n".join(turns),
+                # roughly 0.75 words per token, leave some headroom
+                max_words=int(max_tokens * 0.6)
+            ))
+
+        sys_message = await self.completion(
+            history=[],
+            query=mm,
+            model=GPTModel.GPT_4o,
+            max_tokens=max_tokens,
+            as_json=False)
+
+        logging.info(f"summarise_history - {sys_message}")
+
+        return sys_message
+
+    async def stt(self, path: str, raise_errors: bool = False):
+        """Transcribes a german recording, failures give an empty transcript unless `raise_errors` is set."""
         try:
-            audio_file = open(path, "rb")
-            transcription = await self._client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                response_format="text",
-                language="de"
-            )
+            # read once so a retry uploads the whole file again
+            with open(path, "rb") as audio_file:
+                audio = (os.path.basename(path), audio_file.read())
+            transcription = await self._openai_call(self._client.audio.transcriptions.with_raw_response.create,
+                                                    file=audio,
+                                                    response_format="text",
+                                                    **self._stt_settings)
 
             logging.info(f"stt - {transcription}")
             return transcription
         except Exception as e:
             logging.error(f"Error in stt: {e}")
+            if raise_errors:
+                raise
             return ""
 
-    async def tts(self, query: str, path: str):
-        response = await self._client.audio.speech.create(
-            model="tts-1-hd",
-            voice="fable",
-            input=query,
-            response_format='mp3'
-        )
+    @property
+    def stt_settings(self) -> Dict[str, str]:
+        """Model and language of the transcriptions, part of the transcript cache key."""
+        return dict(self._stt_settings)
+
+    async def tts(self, query: str, path: str, lane: str = INTERACTIVE):
+        response = await self._openai_call(self._client.audio.speech.with_raw_response.create,
+                                           lane=lane, input=query, **self._tts_settings)
         response.stream_to_file(path)
 
         logging.info(f"tts - file saved to {path}")
         return path
 
+    def tts_cache_filename(self, query: str) -> str:
+        """Name of the shared audio file for a text, derived from the text and the tts settings."""
+        settings = self._tts_settings
+        key = "\n".join([query.strip(), settings["voice"], settings["model"], settings["response_format"]])
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return f"tts_{digest}.{settings['response_format']}"
+
+    async def cached_tts(self, query: str, path: str) -> str:
+        """Synthesizes `query` to `path` unless the file already exists."""
+        if os.path.exists(path):
+            logging.info(f"cached_tts - hit {path}")
+            return path
+
+        # write to a temporary file first so a concurrent reader never sees a partial mp3,
+        # concurrent jobs of one worker process synthesize the same text to their own file
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+        try:
+            await self.tts(query.strip(), tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    async def _dify_post(self, json_obj: Dict, headers: Dict, kwargs: Dict, on_chunk: Callable[[str], None] | None = None):
+        """Runs the workflow, a streamed run is collected into the body of a blocking run. Returns the response and the collected body."""
+        if on_chunk is None:
+            return await self._dify_client.post('/workflows/run', json=json_obj, headers=headers, **kwargs), None
+
+        async with self._dify_client.stream('POST', '/workflows/run', json={**json_obj, "response_mode": "streaming"}, headers=headers, **kwargs) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return response, None
+            data = None
+            try:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[5:])
+                    if event.get("event") == "text_chunk":
+                        on_chunk(event["data"]["text"])
+                    elif event.get("event") == "workflow_finished":
+                        data = {"workflow_run_id": event.get("workflow_run_id"), "task_id": event.get("task_id"), "data": event["data"]}
+                    elif event.get("event") == "error":
+                        raise RuntimeError(f"dify stream failed: {event.get('message')}")
+            except httpx.TransportError as e:
+                # the chunks were already relayed, a retry would repeat them
+                raise RuntimeError(f"dify stream broke off: {e!r}") from e
+            if data is None:
+                raise RuntimeError("dify stream ended without a result")
+            return response, data
+
+    async def _dify_run(self, api_key_name: str, json_obj: Dict, timeout: httpx.Timeout | None = None, use_cache: bool = True, lane: str = INTERACTIVE,
+                        on_chunk: Callable[[str], None] | None = None):
+        """Runs a Dify workflow, the result has the shape of a blocking run also if it is streamed to `on_chunk`."""
+        use_cache = use_cache and LLM_CACHE_ENABLED
+        key = cache_key("dify", api_key_name, {"response_mode": json_obj["response_mode"]}, json_obj["inputs"])
+        if use_cache:
+            cached = await asyncio.to_thread(llm_cache.get, key)
+            if cached is not None:
+                logging.info(f"dify - cache hit {key}")
+                data = json.loads(cached)
+                # a cached answer did not cost any tokens
+                data["cached"] = True
+                data["data"]["total_tokens"] = 0
+                return data
+        else:
+            await asyncio.to_thread(llm_cache.bypass)
+
+        headers = {'Authorization': f'Bearer {os.environ.get(api_key_name)}', 'Content-Type': 'application/json'}
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        bucket = f"dify:{api_key_name}"
+        estimated = count_tokens(json.dumps(json_obj["inputs"], ensure_ascii=False))
+        try:
+            for attempt in range(PROVIDER_RETRIES + 1):
+                pause = 0
+                async with rate_limiter.limit(bucket, estimated, lane):
+                    try:
+                        response, streamed = await self._dify_post(json_obj, headers, kwargs, on_chunk)
+                        pause = await rate_limiter.observe(bucket, response.status_code, response.headers)
+                        if attempt == PROVIDER_RETRIES or (response.status_code < 500 and response.status_code not in RETRY_STATUS):
+                            break
+                        logging.warning(f"dify - {bucket} status {response.status_code}, retry {attempt + 1}/{PROVIDER_RETRIES}")
+                    except httpx.TransportError as e:  # includes timeouts
+                        if attempt == PROVIDER_RETRIES:
+                            raise
+                        logging.warning(f"dify - {bucket} {e!r}, retry {attempt + 1}/{PROVIDER_RETRIES}")
+                if not pause:
+                    await asyncio.sleep(retry_delay(attempt))
+            data = streamed if streamed is not None else response.json()
+            logging.info(f"response: {data}")
+        except Exception as e:
+            logging.error(f"An error occurred: {e}")
+            return None
+
+        if isinstance(data.get("data"), dict):
+            await rate_limiter.record_tokens(bucket, estimated, data["data"].get("total_tokens"))
+
+        # only successful workflow runs are worth replaying
+        if use_cache and data.get("data", {}).get("status") == "succeeded":
+            await asyncio.to_thread(llm_cache.set, key, json.dumps(data))
+        return data
+
     async def dify_analyse(
-            self, business_segment: str, question: str, message: str, history=[], mandatory_upcoming_questions=[], optional_upcoming_questions=[], skipped_questions=[]):
+            self, business_segment: str, question: str, message: str, history=[], mandatory_upcoming_questions=[], optional_upcoming_questions=[], skipped_questions=[], use_cache: bool = True):
 
         json_obj = {"response_mode": "blocking",
                     "user": "zy_mvp",
@@ -250,21 +481,14 @@ Achte unbedingt darauf, dass die Variablen in "cypher_queries" eindeutige Namen
                     }}
 
         logging.info(f"dify_analyse: {json_obj}\n{self._dify_client.headers}")
-        headers = {'Authorization': f'Bearer {os.environ.get("DIFY_QUESTIONS_API_KEY")}', 'Content-Type': 'application/json'}
-        try:
-            response = await self._dify_client.post('/workflows/run', json=json_obj, headers=headers)
-            data = response.json()
-            logging.info(f"response: {data}")
-            return data
-        except Exception as e:
-            logging.error(f"An error occurred: {e}")
-            return None
+        return await self._dify_run("DIFY_QUESTIONS_API_KEY", json_obj, use_cache=use_cache)
 
     async def generate_dify_summery(
             self,
             business_segment: str,
             history: List[MessageModel] = [],
-            generate_conversation_string: bool = True):
+            generate_conversation_string: bool = True,
+            use_cache: bool = True):
         conversation = history
         if generate_conversation_string:
             conversation = string_conversation_from_history(history)
@@ -275,18 +499,10 @@ Achte unbedingt darauf, dass die Variablen in "cypher_queries" eindeutige Namen
                         "interview": conversation,
                         "business_segment": business_segment,
                     }}
-        headers = {'Authorization': f'Bearer {os.environ.get("DIFY_SUMMERY_API_KEY")}', 'Content-Type': 'application/json'}
         logging.info(f"generate_dify_summery: {json_obj}")
 
-        try:
-            timeout = httpx.Timeout(60.0)
-            response = await self._dify_client.post('/workflows/run', json=json_obj, timeout=timeout, headers=headers)
-            data = response.json()
-            logging.info(f"response: {data}")
-            return data
-        except Exception as e:
-            logging.error(f"An error occurred: {e}")
-            return None
+        timeout = httpx.Timeout(60.0)
+        return await self._dify_run("DIFY_SUMMERY_API_KEY", json_obj, timeout=timeout, use_cache=use_cache, lane=BATCH)
 
     async def generate_dify_wiki(
             self,
@@ -294,7 +510,9 @@ Achte unbedingt darauf, dass die Variablen in "cypher_queries" eindeutige Namen
             history: List[MessageModel] = [],
             prompt_id: int = 1,
             interview_date: str = datetime.now().strftime("%Y-%m-%dT%H:%M"),
-            generate_conversation_string: bool = True):
+            generate_conversation_string: bool = True,
+            use_cache: bool = True,
+            on_chunk: Callable[[str], None] | None = None):
 
         conversation = history
         if generate_conversation_string:
@@ -308,15 +526,7 @@ Achte unbedingt darauf, dass die Variablen in "cypher_queries" eindeutige Namen
                         "business_segment": business_segment,
                         "date": interview_date
                     }}
-        headers = {'Authorization': f'Bearer {os.environ.get("DIFY_WIKI_API_KEY")}', 'Content-Type': 'application/json'}
         logging.info(f"generate_dify_wiki: {json_obj}")
 
-        try:
-            timeout = httpx.Timeout(300.0)  # 300 Sekunden (5 min) Gesamttimeout
-            response = await self._dify_client.post('/workflows/run', json=json_obj, timeout=timeout, headers=headers)
-            data = response.json()
-            logging.info(f"response: {data}")
-            return data
-        except Exception as e:
-            logging.error(f"An error occurred: {e}")
-            return None
+        timeout = httpx.Timeout(300.0)  # 300 Sekunden (5 min) Gesamttimeout
+        return await self._dify_run("DIFY_WIKI_API_KEY", json_obj, timeout=timeout, use_cache=use_cache, lane=BATCH, on_chunk=on_chunk)
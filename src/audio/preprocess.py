@@ -0,0 +1,183 @@
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+import os
+import re
+import shutil
+import tempfile
+import time
+from typing import List, Tuple
+
+import ffmpeg
+from pydub import AudioSegment
+from pydub.silence import detect_leading_silence, detect_silence
+
+from ..helper.logger import getLogger
+
+logging = getLogger()
+
+AUDIO_PREPROCESS_ENABLED = os.getenv("BB_AUDIO_PREPROCESS", "true").lower() in ("1", "true", "yes")
+SAMPLE_RATE = 16000
+# speech stays intelligible for whisper far below this, browsers record with 64-128k
+OPUS_BITRATE = os.getenv("BB_AUDIO_OPUS_BITRATE", "24k")
+SILENCE_DBFS = float(os.getenv("BB_AUDIO_SILENCE_DBFS", -45))
+# silence kept around the speech so the first and last syllables are not cut
+SILENCE_PADDING_MS = int(os.getenv("BB_AUDIO_SILENCE_PADDING_MS", 300))
+# shorter recordings after trimming are treated as silent, whisper tends to invent text for silence
+MIN_SPEECH_MS = int(os.getenv("BB_AUDIO_MIN_SPEECH_MS", 300))
+# longer recordings are split into chunks that are transcribed concurrently
+STT_CHUNK_SECONDS = float(os.getenv("BB_STT_CHUNK_SECONDS", 60))
+STT_CHUNK_MIN_SECONDS = float(os.getenv("BB_STT_CHUNK_MIN_SECONDS", 20))
+# pauses at least this long are preferred as cuts, without one a chunk is cut hard and overlaps the next one
+STT_CHUNK_PAUSE_MS = int(os.getenv("BB_STT_CHUNK_PAUSE_MS", 400))
+STT_CHUNK_OVERLAP_MS = int(os.getenv("BB_STT_CHUNK_OVERLAP_MS", 1500))
+# words compared at the border of two overlapping chunks
+STITCH_WINDOW_WORDS = 12
+
+
+@dataclass
+class AudioChunk:
+    path: str
+    start_ms: int
+    end_ms: int
+    # audio shared with the previous chunk, 0 if the chunks were cut in a pause
+    overlap_ms: int = 0
+
+
+@dataclass
+class PreprocessedAudio:
+    chunks: List[AudioChunk]
+    audio_bytes: int
+    processed_bytes: int
+    audio_duration: float
+    processed_duration: float
+    preprocess_ms: int
+    silent: bool
+
+
+def run(stream, **kwargs) -> bytes:
+    try:
+        out, _ = stream.run(capture_stdout=True, capture_stderr=True, **kwargs)
+        return out
+    except ffmpeg.Error as e:
+        # the last line of ffmpeg's output names the actual problem
+        detail = e.stderr.decode("utf-8", errors="replace").strip().splitlines()[-1:] if e.stderr else []
+        raise RuntimeError(f"ffmpeg failed: {' '.join(detail)}") from e
+
+
+def decode(path: str) -> AudioSegment:
+    """Decodes any format ffmpeg reads to 16 kHz mono."""
+    pcm = run(ffmpeg.input(path).output("pipe:", format="s16le", acodec="pcm_s16le", ac=1, ar=SAMPLE_RATE))
+    return AudioSegment(data=pcm, sample_width=2, frame_rate=SAMPLE_RATE, channels=1)
+
+
+def trim_silence(audio: AudioSegment) -> AudioSegment:
+    start = detect_leading_silence(audio, silence_threshold=SILENCE_DBFS, chunk_size=10)
+    end = detect_leading_silence(audio.reverse(), silence_threshold=SILENCE_DBFS, chunk_size=10)
+    if start + end >= len(audio):
+        return audio[:0]
+    return audio[max(start - SILENCE_PADDING_MS, 0):len(audio) - max(end - SILENCE_PADDING_MS, 0)]
+
+
+def encode_opus(audio: AudioSegment, path: str):
+    # whisper accepts opus in an ogg container, not as .opus
+    run(ffmpeg.input("pipe:", format="s16le", ac=1, ar=SAMPLE_RATE)
+        .output(path, format="ogg", acodec="libopus", audio_bitrate=OPUS_BITRATE, application="voip")
+        .overwrite_output(), input=audio.raw_data)
+
+
+def preprocessed_path(directory: str, index: int = 0) -> str:
+    return os.path.join(directory, f"{index}.ogg")
+
+
+def remove_chunks(chunks: List[AudioChunk], path: str):
+    """Removes the chunks `preprocess_audio` wrote for the recording at `path`, the original is kept."""
+    for directory in {os.path.dirname(chunk.path) for chunk in chunks if chunk.path != path}:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def chunk_bounds(audio: AudioSegment) -> List[Tuple[int, int, int]]:
+    """
+    (start_ms, end_ms, overlap_ms) of chunks of at most `BB_STT_CHUNK_SECONDS`. Every chunk is cut in the middle
+    of the longest pause after `BB_STT_CHUNK_MIN_SECONDS`, if there is none it is cut hard and the next chunk
+    starts `BB_STT_CHUNK_OVERLAP_MS` earlier so no word is lost.
+    """
+    max_ms, min_ms = int(STT_CHUNK_SECONDS * 1000), int(STT_CHUNK_MIN_SECONDS * 1000)
+    if len(audio) <= max_ms:
+        return [(0, len(audio), 0)]
+
+    pauses = detect_silence(audio, min_silence_len=STT_CHUNK_PAUSE_MS, silence_thresh=SILENCE_DBFS, seek_step=50)
+    bounds = []
+    start, overlap = 0, 0
+    while len(audio) - start > max_ms:
+        candidates = [(s, e) for s, e in pauses if start + min_ms <= (s + e) // 2 <= start + max_ms]
+        if candidates:
+            s, e = max(candidates, key=lambda pause: pause[1] - pause[0])
+            cut = (s + e) // 2
+            bounds.append((start, cut, overlap))
+            start, overlap = cut, 0
+        else:
+            cut = start + max_ms
+            bounds.append((start, cut, overlap))
+            start, overlap = cut - STT_CHUNK_OVERLAP_MS, STT_CHUNK_OVERLAP_MS
+    bounds.append((start, len(audio), overlap))
+    return bounds
+
+
+def _normalize(word: str) -> str:
+    return re.sub(r"\W", "", word.lower())
+
+
+def stitch_transcripts(transcripts: List[str], chunks: List[AudioChunk]) -> str:
+    """
+    Joins the transcripts of consecutive chunks. Where chunks overlap, the words both transcripts share
+    at the border are kept once, words after the shared part of the earlier chunk were cut off and are dropped.
+    """
+    words: List[str] = []
+    for text, chunk in zip(transcripts, chunks):
+        current = (text or "").split()
+        if chunk.overlap_ms and words and current:
+            tail, head = words[-STITCH_WINDOW_WORDS:], current[:STITCH_WINDOW_WORDS]
+            match = SequenceMatcher(None, [_normalize(w) for w in tail], [_normalize(w) for w in head], autojunk=False) \
+                .find_longest_match(0, len(tail), 0, len(head))
+            # a single common word may be chance, two in a row are the overlap
+            if match.size >= 2:
+                del words[len(words) - len(tail) + match.a + match.size:]
+                current = current[match.b + match.size:]
+        words.extend(current)
+    return " ".join(words)
+
+
+def preprocess_audio(path: str) -> PreprocessedAudio:
+    """
+    Prepares a recording for whisper: mono, 16 kHz, leading and trailing silence trimmed, split into chunks
+    for long recordings, encoded as opus. The original file is left untouched, the chunks are written to a
+    directory of their own that `remove_chunks` removes. Blocks on ffmpeg, run it in a thread from async code.
+    """
+    start = time.perf_counter()
+    audio = decode(path)
+    trimmed = trim_silence(audio)
+    silent = len(trimmed) < MIN_SPEECH_MS
+
+    chunks = []
+    if not silent:
+        # concurrent transcriptions of the same recording must not overwrite each other's chunks
+        directory = tempfile.mkdtemp(prefix=f"{os.path.basename(os.path.splitext(path)[0])}.stt.", dir=os.path.dirname(path))
+        try:
+            for index, (chunk_start, chunk_end, overlap) in enumerate(chunk_bounds(trimmed)):
+                chunk = AudioChunk(path=preprocessed_path(directory, index), start_ms=chunk_start, end_ms=chunk_end, overlap_ms=overlap)
+                encode_opus(trimmed[chunk_start:chunk_end], chunk.path)
+                chunks.append(chunk)
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+    result = PreprocessedAudio(chunks=chunks,
+                               audio_bytes=os.path.getsize(path),
+                               processed_bytes=sum(os.path.getsize(chunk.path) for chunk in chunks),
+                               audio_duration=len(audio) / 1000,
+                               processed_duration=len(trimmed) / 1000 if not silent else 0,
+                               preprocess_ms=int((time.perf_counter() - start) * 1000),
+                               silent=silent)
+    logging.info(f"preprocess_audio - {path}: {result.audio_bytes}B/{result.audio_duration:.1f}s -> "
+                 f"{result.processed_bytes}B/{result.processed_duration:.1f}s in {len(chunks)} chunks, {result.preprocess_ms}ms")
+    return result
@@ -0,0 +1,198 @@
+"""
+Drives the FastAPI `api` in-process against a fixture database and reports latency percentiles,
+queries and memory per endpoint. Results are written as JSON so runs can be compared.
+
+    BB_BENCHMARK_DATABASE_URL=sqlite:///bench.db python -m src.benchmark.fixtures --user-interviews 100000 --users 5000
+    BB_BENCHMARK_DATABASE_URL=sqlite:///bench.db python -m src.benchmark.endpoints --requests 200 --output data/benchmarks/run.json
+    python -m src.benchmark.endpoints --baseline data/benchmarks/before.json --generate 2000
+"""
+import argparse
+import asyncio
+import gc
+from collections import Counter
+from datetime import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from src.benchmark.utils import QueryCounter, percentiles, use_app_environment, use_benchmark_database
+
+url = use_benchmark_database()
+use_app_environment()
+
+import httpx  # noqa: E402
+import jwt  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from src.benchmark.fixtures import FixtureSpec, generate  # noqa: E402
+from src.datamodel.interview import InterviewState, InterviewStateType, UserInterview  # noqa: E402
+from src.datamodel.manager.sqldb_manager import SessionLocal, async_engine, engine, run_migrations  # noqa: E402
+from src.server.auth.user_middleware import SECRET_KEY  # noqa: E402
+from src.server.server import api  # noqa: E402
+
+# name -> (method, path), `ui` is a user interview of one of the states the endpoint accepts
+ENDPOINTS = {
+    "user_interviews": ("GET", "/user_interviews/", None),
+    "user_interviews_page": ("GET", "/user_interviews/page", None),
+    "history": ("GET", "/user_interviews/{ui}/history", None),
+    "current_question": ("GET", "/user_interviews/{ui}/current_question", [InterviewStateType.active, InterviewStateType.paused]),
+    "next_question": ("POST", "/user_interviews/{ui}/next_question", [InterviewStateType.active]),
+    "wikis": ("GET", "/user_interviews/{ui}/wikis", [InterviewStateType.completed, InterviewStateType.stopped]),
+}
+
+
+def token(user_id: int) -> str:
+    return jwt.encode({"sub": str(user_id)}, SECRET_KEY, algorithm="HS256")
+
+
+def sample_targets(per_endpoint: int, seed: int):
+    """Random user interviews per endpoint and the users with the most interviews for the listings."""
+    rnd = random.Random(seed)
+    targets = {}
+    with SessionLocal() as db:
+        heavy_users = db.execute(select(UserInterview.user_id).group_by(UserInterview.user_id)
+                                 .order_by(func.count(UserInterview.id).desc()).limit(per_endpoint)).scalars().all()
+        for name, (_, path, states) in ENDPOINTS.items():
+            if "{ui}" not in path:
+                targets[name] = [(user_id, None) for user_id in heavy_users]
+                continue
+            query = select(UserInterview.user_id, UserInterview.id).join(InterviewState, InterviewState.user_interview_id == UserInterview.id)
+            if states:
+                query = query.filter(InterviewState.state.in_(states))
+            rows = db.execute(query.order_by(UserInterview.id)).all()
+            targets[name] = [tuple(row) for row in rnd.sample(rows, min(per_endpoint, len(rows)))]
+    return targets
+
+
+async def call(client: httpx.AsyncClient, name: str, user_id: int, ui: int):
+    method, path, _ = ENDPOINTS[name]
+    start = time.perf_counter()
+    response = await client.request(method, path.format(ui=ui), headers={"Authorization": f"Bearer {token(user_id)}"})
+    return response, (time.perf_counter() - start) * 1000
+
+
+async def measure(name: str, targets, requests: int, memory_samples: int):
+    transport = httpx.ASGITransport(app=api)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        # warm up the connection pools and the import caches
+        await call(client, name, *targets[0])
+
+        latencies = []
+        statuses = Counter()
+        sizes = []
+        with QueryCounter(engine) as sync_queries, QueryCounter(async_engine.sync_engine) as async_queries:
+            for i in range(requests):
+                response, ms = await call(client, name, *targets[i % len(targets)])
+                latencies.append(ms)
+                statuses[response.status_code] += 1
+                sizes.append(len(response.content))
+        queries = (sync_queries.count + async_queries.count) / requests
+
+        # tracemalloc slows everything down, so memory has a pass of its own
+        peaks = []
+        for i in range(memory_samples):
+            tracemalloc.start()
+            await call(client, name, *targets[i % len(targets)])
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.stop()
+
+    return {
+        "requests": requests,
+        "status": {str(code): count for code, count in sorted(statuses.items())},
+        **{f"{k}_ms": round(v, 3) for k, v in percentiles(latencies).items()},
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "queries_per_request": round(queries, 2),
+        "response_kib_p50": round(percentiles(sizes, (50,))["p50"] / 1024, 2),
+        "peak_memory_kib_p50": round(percentiles(peaks, (50,))["p50"], 1) if peaks else None,
+        "peak_memory_kib_max": round(max(peaks), 1) if peaks else None,
+    }
+
+
+async def measure_all(endpoints, targets, requests: int, memory_samples: int):
+    # one event loop for all endpoints, pooled async connections are bound to the loop that opened them
+    results = {}
+    for name in endpoints:
+        if not targets[name]:
+            print(f"skip {name:22} no matching user interviews")
+            continue
+        results[name] = r = await measure(name, targets[name], requests, memory_samples)
+        # collect the garbage of one endpoint before the next one is measured
+        gc.collect()
+        print(f"{name:22} p50={r['p50_ms']:8.2f}ms p95={r['p95_ms']:8.2f}ms p99={r['p99_ms']:8.2f}ms "
+              f"queries={r['queries_per_request']:5.1f} peak={r['peak_memory_kib_max']}KiB status={r['status']}")
+    await async_engine.dispose()
+    return results
+
+
+def table_sizes():
+    from src.datamodel.interview import AdditionalQuestion, Response, UserInterview, Wiki
+    with SessionLocal() as db:
+        return {model.__tablename__: db.execute(select(func.count(model.id))).scalar_one()
+                for model in (UserInterview, Response, AdditionalQuestion, Wiki)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path: str):
+    with open(baseline_path) as file:
+        baseline = json.load(file)["endpoints"]
+    print(f"\n{'endpoint':22} {'p95 before':>11} {'p95 after':>10} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["p95_ms"], result["p95_ms"]
+        change = (after - before) / before * 100 if before else 0
+        print(f"{name:22} {before:11.2f} {after:10.2f} {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--targets", type=int, default=50, help="distinct user interviews or users per endpoint")
+    parser.add_argument("--memory-samples", type=int, default=20)
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--generate", type=int, default=0, help="add this many user interviews before measuring")
+    parser.add_argument("--output", default=f"data/benchmarks/endpoints_{datetime.now():%Y%m%d_%H%M%S}.json")
+    parser.add_argument("--baseline", help="earlier result file to compare the p95 latencies with")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    run_migrations()
+    if args.generate:
+        with SessionLocal() as db:
+            generate(db, FixtureSpec(user_interviews=args.generate, users=max(args.generate // 20, 1), seed=args.seed))
+
+    results = asyncio.run(measure_all(args.endpoints, sample_targets(args.targets, args.seed), args.requests, args.memory_samples))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "dialect": engine.dialect.name,
+            "python": sys.version.split()[0],
+            "requests": args.requests,
+            "targets": args.targets,
+            "rows": table_sizes(),
+        },
+        "endpoints": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nwrote {args.output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Runs EXPLAIN on the hot statements against a seeded database migrated to head and reports full table scans.
+Exits with status 1 if a statement scans one of the large tables instead of using an index.
+
+    python -m src.benchmark.explain --interviews 200 --questions 50
+"""
+import argparse
+from datetime import datetime
+import json
+import re
+import sys
+
+from src.benchmark.utils import seed_user_interview, use_benchmark_database
+
+use_benchmark_database()
+
+from sqlalchemy import desc, select, text  # noqa: E402
+from src.datamodel.interview import InterviewState, InterviewStateType, UserInterview, Wiki  # noqa: E402
+from src.datamodel.manager.db_helper import page_user_interviews, select_history, select_user_interview_state  # noqa: E402
+from src.datamodel.manager.question_plan import build_question_plan, select_next_plan_question, select_plan_question_at  # noqa: E402
+from src.datamodel.manager.sqldb_manager import SessionLocal, engine, run_migrations  # noqa: E402
+
+# tables that grow with usage, small lookup tables may be scanned
+LARGE_TABLES = {"responses", "questions", "additional_questions", "question_plan", "wikis", "user_interviews", "interview_state"}
+
+
+def statements(user_interview_id: int, user_id: int):
+    interviews = select(UserInterview.id, UserInterview.title, InterviewState.state, UserInterview.selected_wiki, UserInterview.createdAt) \
+        .join(InterviewState, InterviewState.user_interview_id == UserInterview.id) \
+        .filter(UserInterview.user_id == user_id, InterviewState.state.in_([InterviewStateType.active]))
+    page = page_user_interviews(interviews, 20)
+    next_page = page_user_interviews(interviews, 20, (datetime.now(), user_interview_id))
+    wikis = select(Wiki).filter(Wiki.user_interview_id == user_interview_id).order_by(desc(Wiki.createdAt), desc(Wiki.version))
+
+    return {
+        "state": select_user_interview_state(user_interview_id),
+        "history": select_history(user_interview_id),
+        "plan_question_at": select_plan_question_at(user_interview_id, 3),
+        "next_plan_question": select_next_plan_question(user_interview_id, 3),
+        "user_interviews_page": page,
+        "user_interviews_next_page": next_page,
+        "wikis": wikis,
+    }
+
+
+def explain(db, statement):
+    sql = str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+    if engine.dialect.name == "postgresql":
+        plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar_one()
+        return plan, postgres_scans(plan[0]["Plan"])
+    plan = [row.detail for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()]
+    return plan, sqlite_scans(plan)
+
+
+def sqlite_scans(plan):
+    scans = []
+    for detail in plan:
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and match.group(1) in LARGE_TABLES and "INDEX" not in detail:
+            scans.append(match.group(1))
+    return scans
+
+
+def postgres_scans(node):
+    scans = [node["Relation Name"]] if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in LARGE_TABLES else []
+    for child in node.get("Plans", []):
+        scans.extend(postgres_scans(child))
+    return scans
+
+
+def seed(interviews: int, questions: int):
+    user_interview_ids = []
+    with SessionLocal() as db:
+        for i in range(interviews):
+            user_interview_id = seed_user_interview(db, questions, seed=i)
+            build_question_plan(db, user_interview_id)
+            db.commit()
+            user_interview_ids.append(user_interview_id)
+        user_id = db.get(UserInterview, user_interview_ids[-1]).user_id
+        db.execute(text("ANALYZE"))
+        db.commit()
+    return user_interview_ids[len(user_interview_ids) // 2], user_id
+
+
+def run(interviews: int, questions: int):
+    run_migrations()
+    user_interview_id, user_id = seed(interviews, questions)
+
+    results = []
+    with SessionLocal() as db:
+        for name, statement in statements(user_interview_id, user_id).items():
+            plan, scans = explain(db, statement)
+            results.append({"statement": name, "full_scans": scans, "plan": plan})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interviews", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--verbose", action="store_true", help="print the plans")
+    args = parser.parse_args()
+
+    results = run(args.interviews, args.questions)
+    for result in results:
+        status = "FAIL" if result["full_scans"] else "ok"
+        print(f"{status:4} {result['statement']:26} full scans: {', '.join(result['full_scans']) or '-'}")
+        if args.verbose:
+            print(json.dumps(result["plan"], indent=2))
+
+    return 1 if any(result["full_scans"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
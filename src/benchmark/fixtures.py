@@ -0,0 +1,216 @@
+"""
+Fills the interview tables with a synthetic dataset of realistic size and shape, on SQLite or Postgres.
+
+Rows are written with bulk inserts and explicit ids in chunks of user interviews, so millions of
+responses fit in memory and the relations stay consistent without reading anything back.
+
+    BB_BENCHMARK_DATABASE_URL=postgresql://... python -m src.benchmark.fixtures --user-interviews 100000 --users 5000
+"""
+import argparse
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+import json
+import random
+import time
+from typing import Dict, List
+
+from sqlalchemy import func, insert, select, text
+
+# share of user interviews per state, the app mostly lists completed and stopped ones
+STATE_WEIGHTS = {"completed": 0.55, "stopped": 0.15, "active": 0.2, "paused": 0.1}
+CATEGORIES = ["general", "process", "tools", "people", "risks"]
+WORDS = ("Prozess Kunde Abteilung Übergabe Dokumentation System Pflege Termin Schicht Wissen Ablauf "
+         "Kollegen Software Rechnung Lager Auftrag Qualität Prüfung Schulung Erfahrung wichtig immer "
+         "manchmal häufig selten zuerst danach dann weil wenn aber und oder nicht auch noch").split()
+
+
+@dataclass
+class FixtureSpec:
+    users: int = 1000
+    user_interviews: int = 10000
+    interviews: int = 12
+    min_questions: int = 20
+    max_questions: int = 60
+    skip_ratio: float = 0.08
+    follow_up_ratio: float = 0.3
+    wiki_prompts: int = 3
+    chunk: int = 500
+    seed: int = 42
+
+
+def words(rnd: random.Random, mean: int) -> str:
+    # answers are mostly short with a long tail, a lognormal fits the production data best
+    count = max(1, int(rnd.lognormvariate(0, 0.8) * mean))
+    return " ".join(rnd.choice(WORDS) for _ in range(count))
+
+
+def next_ids(db, tables) -> Dict[str, int]:
+    return {table.name: (db.execute(select(func.max(table.c.id))).scalar() or 0) + 1 for table in tables}
+
+
+def bulk_insert(db, table, rows: List[Dict]):
+    if rows:
+        db.execute(insert(table), rows)
+
+
+def reset_sequences(db, tables):
+    """Explicit ids don't advance the postgres sequences, the app would collide with them otherwise."""
+    if db.bind.dialect.name != "postgresql":
+        return
+    for table in tables:
+        db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                        f"(SELECT COALESCE(MAX(id), 1) FROM {table.name}))"))
+
+
+def generate(db, spec: FixtureSpec) -> Dict[str, int]:
+    """Adds `spec.user_interviews` user interviews of `spec.users` users and returns the row counts per table."""
+    from src.datamodel.interview import (AdditionalQuestion, Cost, Interview, InterviewState, Question, QuestionPlanItem,
+                                         Response, User, UserInterview, Wiki)
+
+    tables = [model.__table__ for model in (User, Interview, Question, UserInterview, InterviewState, AdditionalQuestion,
+                                            Response, QuestionPlanItem, Wiki, Cost)]
+    ids = next_ids(db, tables)
+    counts = {table.name: 0 for table in tables}
+    rnd = random.Random(spec.seed)
+    now = datetime.now()
+
+    def take(table, rows):
+        counts[table.name] += len(rows)
+        bulk_insert(db, table, rows)
+
+    # users and interview templates
+    user_ids = list(range(ids["users"], ids["users"] + spec.users))
+    take(User.__table__, [{"id": id, "username": f"fixture_{spec.seed}_{id}"} for id in user_ids])
+
+    templates = []
+    question_rows = []
+    question_id = ids["questions"]
+    for i in range(spec.interviews):
+        interview_id = ids["interviews"] + i
+        questions = []
+        for order in range(rnd.randint(spec.min_questions, spec.max_questions)):
+            category = CATEGORIES[min(order * len(CATEGORIES) // spec.max_questions, len(CATEGORIES) - 1)]
+            questions.append((question_id, category))
+            question_rows.append({"id": question_id, "text": f"Frage {order}: {words(rnd, 12)}?", "audio": f"q_{question_id}.mp3",
+                                  "category": category, "order": order, "interview_id": interview_id})
+            question_id += 1
+        templates.append((interview_id, questions))
+    take(Interview.__table__, [{"id": interview_id, "title": f"Interview {interview_id}", "business_segment": rnd.choice(["Pflege", "Handwerk", "Verwaltung"]),
+                                "createdAt": now, "updatedAt": now} for interview_id, _ in templates])
+    take(Question.__table__, question_rows)
+    db.commit()
+
+    # a few heavy users own most of the interviews
+    user_weights = [rnd.paretovariate(1.2) for _ in user_ids]
+    states, state_weights = zip(*STATE_WEIGHTS.items())
+
+    next_id = {name: ids[name] for name in ("user_interviews", "interview_state", "additional_questions", "responses",
+                                            "question_plan", "wikis", "costs")}
+    for start in range(0, spec.user_interviews, spec.chunk):
+        rows = {name: [] for name in next_id}
+        for _ in range(min(spec.chunk, spec.user_interviews - start)):
+            ui_id = next_id["user_interviews"]
+            next_id["user_interviews"] += 1
+            interview_id, questions = rnd.choice(templates)
+            state = rnd.choices(states, state_weights)[0]
+            created_at = now - timedelta(seconds=rnd.randint(0, 365 * 24 * 3600))
+            rows["user_interviews"].append({"id": ui_id, "user_id": rnd.choices(user_ids, user_weights)[0], "interview_id": interview_id,
+                                            "title": f"Interview {interview_id}", "selected_wiki": None, "createdAt": created_at})
+
+            # finished interviews went through every question, the others stopped somewhere on the way
+            progress = len(questions) if state in ("completed", "stopped") else rnd.randint(0, len(questions) - 1)
+            plan = []
+            follow_ups = []
+            follow_up_order = 1000
+            for position, (question_id, category) in enumerate(questions):
+                if position >= progress:
+                    plan.append({"question_id": question_id, "additional_question_id": None, "category": category,
+                                 "answered": False, "skipped": False})
+                    continue
+
+                skipped = rnd.random() < spec.skip_ratio
+                response_id = next_id["responses"]
+                next_id["responses"] += 1
+                rows["responses"].append({"id": response_id, "text": "" if skipped else words(rnd, 40), "audio": None,
+                                          "audio_text": "" if skipped or rnd.random() < 0.5 else words(rnd, 60),
+                                          "skipped": skipped, "is_additional": False, "by_user": True,
+                                          "question_id": question_id, "additional_question_id": None, "user_interview_id": ui_id})
+                plan.append({"question_id": question_id, "additional_question_id": None, "category": category,
+                             "answered": not skipped, "skipped": skipped})
+
+                if skipped or rnd.random() >= spec.follow_up_ratio:
+                    continue
+                # a follow-up to this answer, answered right away in most cases
+                additional_id = next_id["additional_questions"]
+                next_id["additional_questions"] += 1
+                rows["additional_questions"].append({"id": additional_id, "text": f"Folgefrage: {words(rnd, 10)}?", "order": follow_up_order,
+                                                     "category": "additional", "audio": f"aq_{additional_id}.mp3", "createdAt": created_at,
+                                                     "user_interview_id": ui_id, "response_id": response_id})
+                follow_up_order += 1
+                answered = rnd.random() < 0.8
+                if answered:
+                    rows["responses"].append({"id": next_id["responses"], "text": words(rnd, 30), "audio": None, "audio_text": "",
+                                              "skipped": False, "is_additional": True, "by_user": True, "question_id": None,
+                                              "additional_question_id": additional_id, "user_interview_id": ui_id})
+                    next_id["responses"] += 1
+                follow_ups.append({"question_id": None, "additional_question_id": additional_id, "category": "additional",
+                                   "answered": answered, "skipped": False})
+
+            # follow-ups are appended to the plan after the interview questions
+            plan.extend(follow_ups)
+            step = progress if progress < len(questions) else len(plan) - 1
+            for position, item in enumerate(plan):
+                rows["question_plan"].append({"id": next_id["question_plan"], "position": position, "user_interview_id": ui_id, **item})
+                next_id["question_plan"] += 1
+
+            rows["interview_state"].append({"id": next_id["interview_state"], "category": plan[step]["category"], "step": step,
+                                            "state": state, "user_interview_id": ui_id})
+            next_id["interview_state"] += 1
+
+            rows["costs"].append({"id": next_id["costs"], "tokens": rnd.randint(500, 4000) * max(progress, 1), "model": "gpt-4o",
+                                  "user_interview_id": ui_id})
+            next_id["costs"] += 1
+
+            if state in ("completed", "stopped"):
+                for prompt_id in range(1, spec.wiki_prompts + 1):
+                    for version in range(1, rnd.choice([1, 1, 1, 2, 3]) + 1):
+                        rows["wikis"].append({"id": next_id["wikis"], "prompt_id": str(prompt_id), "selected": False, "version": version,
+                                              "content": f"# Wiki {prompt_id}\n\n{words(rnd, 400)}", "filepath": f"wiki_{ui_id}_{prompt_id}_{version}.md",
+                                              "user_interview_id": ui_id, "createdAt": created_at + timedelta(minutes=version)})
+                        next_id["wikis"] += 1
+                rows["user_interviews"][-1]["selected_wiki"] = rows["wikis"][-1]["id"]
+
+        # parents first, responses and follow-ups reference each other but sqlite and postgres don't check that per row
+        for model in (UserInterview, InterviewState, AdditionalQuestion, Response, QuestionPlanItem, Wiki, Cost):
+            take(model.__table__, rows[model.__tablename__])
+        db.commit()
+        print(f"fixtures - {start + len(rows['user_interviews'])}/{spec.user_interviews} user interviews, {counts['responses']} responses")
+
+    reset_sequences(db, tables)
+    db.execute(text("ANALYZE"))
+    db.commit()
+    return counts
+
+
+def main():
+    from src.benchmark.utils import use_benchmark_database
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    defaults = FixtureSpec()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    url = use_benchmark_database()
+    from src.datamodel.manager.sqldb_manager import SessionLocal, run_migrations
+    run_migrations()
+
+    spec = FixtureSpec(**{name: getattr(args, name) for name in asdict(defaults)})
+    start = time.perf_counter()
+    with SessionLocal() as db:
+        counts = generate(db, spec)
+    print(json.dumps({"database": url, "seconds": round(time.perf_counter() - start, 1), "rows": counts}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+End-to-end load generator for a running server and worker, ideally pointed at `src.benchmark.mock_providers`.
+
+Every virtual user runs full interviews: create, answer (with uploaded audio for a share of the answers),
+follow the follow-ups, stop and wait for the wikis. Reports throughput and tail latency per route and
+the time from stop to finished wikis. Users `loadtest_<n>` are created in the database of BB_DATABASE_URL.
+
+    python -m src.benchmark.load --base-url http://localhost:8001 --users 20 --duration 300 --record data/benchmarks/traffic.jsonl
+
+Recorded traffic is replayed with its original timing (or faster with --speed) against the same dataset:
+
+    python -m src.benchmark.load --replay data/benchmarks/traffic.jsonl --speed 2
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
+import io
+import json
+import math
+import os
+import random
+import re
+import struct
+import time
+import wave
+
+import httpx
+
+from src.benchmark.utils import percentiles
+
+ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def route_name(method: str, path: str) -> str:
+    return f"{method} {ID_SEGMENT.sub('/{id}', path)}"
+
+
+def answer_wav(seconds: float, rate: int = 16000, seed: int = 0) -> bytes:
+    """A spoken answer stand-in: tone bursts with pauses and silence at both ends."""
+    rnd = random.Random(seed)
+    frames = bytearray()
+    frames += struct.pack("<h", 0) * int(rate * 0.8)
+    while len(frames) < seconds * rate * 2:
+        frequency = rnd.uniform(120, 280)
+        for i in range(int(rate * rnd.uniform(0.3, 1.2))):
+            frames += struct.pack("<h", int(6000 * math.sin(2 * math.pi * frequency * i / rate)))
+        frames += struct.pack("<h", 0) * int(rate * rnd.uniform(0.1, 0.6))
+    frames += struct.pack("<h", 0) * int(rate * 0.8)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(rate)
+        file.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+class Recorder:
+    """Latency samples per route and, optionally, every request as a replayable jsonl line."""
+
+    def __init__(self, record_path: str = None):
+        self.start = time.perf_counter()
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.record = open(record_path, "w") if record_path else None
+
+    def add(self, route: str, status: int, ms: float):
+        self.samples[route].append(ms)
+        self.statuses[route][str(status)] += 1
+
+    def log(self, entry):
+        if self.record:
+            self.record.write(json.dumps({"t": round(time.perf_counter() - self.start, 3), **entry}) + "\n")
+
+    def close(self):
+        if self.record:
+            self.record.close()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        routes = {}
+        for route, samples in sorted(self.samples.items()):
+            errors = sum(count for status, count in self.statuses[route].items() if status.startswith("5") or status == "0")
+            routes[route] = {
+                "requests": len(samples),
+                "throughput_rps": round(len(samples) / elapsed, 3),
+                "errors": errors,
+                "status": dict(self.statuses[route]),
+                **{f"{k}_ms": round(v, 1) for k, v in percentiles(samples, (50, 95, 99)).items()},
+                "max_ms": round(max(samples), 1),
+            }
+        total = sum(len(samples) for route, samples in self.samples.items() if not route.startswith("flow "))
+        return {"seconds": round(elapsed, 1), "requests": total, "throughput_rps": round(total / elapsed, 3), "routes": routes}
+
+
+async def send(client: httpx.AsyncClient, recorder: Recorder, user_id: int, method: str, path: str, json_body=None, form=None, audio: bytes = None):
+    files = {"file": ("answer.webm", audio, "audio/webm")} if audio is not None else None
+    recorder.log({"user_id": user_id, "method": method, "path": path, "json": json_body, "form": form,
+                  "audio_bytes": len(audio) if audio is not None else None})
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, path, json=json_body, data=form, files=files, headers={"Authorization": f"Bearer {token(user_id)}"})
+        status = response.status_code
+    except httpx.HTTPError:
+        response, status = None, 0
+    recorder.add(route_name(method, path), status, (time.perf_counter() - start) * 1000)
+    return response
+
+
+@lru_cache(maxsize=None)
+def token(user_id: int) -> str:
+    import jwt
+    from src.server.auth.user_middleware import SECRET_KEY
+    return jwt.encode({"sub": str(user_id)}, SECRET_KEY, algorithm="HS256")
+
+
+def ensure_users(count: int):
+    from src.datamodel.interview import User
+    from src.datamodel.manager.sqldb_manager import SessionLocal
+
+    with SessionLocal() as db:
+        users = []
+        for i in range(count):
+            username = f"loadtest_{i}"
+            user = db.query(User).filter(User.username == username).one_or_none()
+            if user is None:
+                user = User(username=username)
+                db.add(user)
+                db.flush()
+            users.append(user.id)
+        db.commit()
+    return users
+
+
+async def create_interview(client: httpx.AsyncClient, recorder: Recorder, user_id: int, questions: int) -> int:
+    categories = ["general", "process", "tools", "people"]
+    body = {"title": "Lasttest", "business_segment": "Pflege",
+            "questions": {category: [f"Frage {category} {i}: Wie läuft das bei Ihnen ab?" for i in range(questions // len(categories) + 1)]
+                          for category in categories}}
+    response = await send(client, recorder, user_id, "POST", "/interviews/", json_body=body)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def run_interview(client: httpx.AsyncClient, recorder: Recorder, user_id: int, interview_id: int, args, rnd: random.Random):
+    started = time.perf_counter()
+    response = await send(client, recorder, user_id, "POST", "/user_interviews/", json_body={"interview_id": interview_id})
+    if response is None or response.status_code != 200:
+        return False
+    user_interview_id = response.json()["id"]
+    base = f"/user_interviews/{user_interview_id}"
+
+    response = await send(client, recorder, user_id, "GET", f"{base}/current_question")
+    question = response.json() if response is not None and response.status_code == 200 else None
+    answers = 0
+    while question and answers < args.max_answers:
+        is_additional = "user_interview_id" in question
+        answer = {"id": 0, "text": "", "audio": None, "audio_text": None, "is_additional": is_additional,
+                  "question_id": None if is_additional else question["id"],
+                  "additional_question_id": question["id"] if is_additional else None,
+                  "skipped": rnd.random() < args.skip_ratio}
+        if not answer["skipped"]:
+            if rnd.random() < args.audio_ratio:
+                uploaded = await send(client, recorder, user_id, "POST", "/user_interviews/upload_audio",
+                                      form={"interview_id": str(user_interview_id), "question_id": str(question["id"])},
+                                      audio=answer_wav(args.audio_seconds, seed=rnd.randint(0, 1 << 30)))
+                if uploaded is not None and uploaded.status_code == 200:
+                    answer["audio"] = uploaded.json()["url"]
+            if not answer["audio"]:
+                answer["text"] = "Das machen wir meistens so, dass zuerst das Team informiert wird und dann die Übergabe erfolgt."
+        await send(client, recorder, user_id, "POST", f"{base}/submit_answer", json_body=answer)
+        answers += 1
+
+        await asyncio.sleep(rnd.expovariate(1 / args.think_time) if args.think_time > 0 else 0)
+        response = await send(client, recorder, user_id, "POST", f"{base}/next_question")
+        question = response.json() if response is not None and response.status_code == 200 else None
+
+    stopped = time.perf_counter()
+    await send(client, recorder, user_id, "POST", f"{base}/stop")
+    while time.perf_counter() - stopped < args.wiki_timeout:
+        await asyncio.sleep(args.poll_interval)
+        response = await send(client, recorder, user_id, "GET", f"{base}/wikis/status")
+        if response is not None and response.status_code == 200 and response.json()["status"] in ("finished", "failed"):
+            recorder.add("flow wiki_ready", 200 if response.json()["status"] == "finished" else 500, (time.perf_counter() - stopped) * 1000)
+            break
+    else:
+        recorder.add("flow wiki_ready", 0, (time.perf_counter() - stopped) * 1000)
+
+    recorder.add("flow interview", 200, (time.perf_counter() - started) * 1000)
+    return True
+
+
+async def virtual_user(client: httpx.AsyncClient, recorder: Recorder, user_id: int, interview_id: int, args, deadline: float, delay: float):
+    rnd = random.Random(user_id * 7919 + args.seed)
+    await asyncio.sleep(delay)
+    completed = 0
+    while time.perf_counter() < deadline and (not args.interviews or completed < args.interviews):
+        if await run_interview(client, recorder, user_id, interview_id, args, rnd):
+            completed += 1
+    return completed
+
+
+async def run_load(args):
+    recorder = Recorder(args.record)
+    limits = httpx.Limits(max_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        users = ensure_users(args.users)
+        interview_id = args.interview_id or await create_interview(client, recorder, users[0], args.questions)
+        deadline = time.perf_counter() + args.duration
+        completed = await asyncio.gather(*[virtual_user(client, recorder, user_id, interview_id, args, deadline, i * args.ramp_up / args.users)
+                                           for i, user_id in enumerate(users)])
+    recorder.close()
+    report = recorder.report()
+    report["interviews_completed"] = sum(completed)
+    report["interviews_per_minute"] = round(sum(completed) / report["seconds"] * 60, 2)
+    return report
+
+
+async def run_replay(args):
+    with open(args.replay) as file:
+        entries = [json.loads(line) for line in file if line.strip()]
+    recorder = Recorder(args.record)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        async def replay(entry):
+            await asyncio.sleep(max(0, entry["t"] / args.speed - (time.perf_counter() - recorder.start)))
+            async with semaphore:
+                audio = answer_wav(entry["audio_bytes"] / 32000) if entry.get("audio_bytes") else None
+                await send(client, recorder, entry["user_id"], entry["method"], entry["path"],
+                           json_body=entry.get("json"), form=entry.get("form"), audio=audio)
+
+        await asyncio.gather(*[replay(entry) for entry in entries])
+    recorder.close()
+    return recorder.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=f"http://localhost:{os.getenv('BB_PORT', 8001)}")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=120, help="seconds to start new interviews")
+    parser.add_argument("--interviews", type=int, default=0, help="interviews per user, 0 for as many as fit the duration")
+    parser.add_argument("--ramp-up", type=float, default=10)
+    parser.add_argument("--interview-id", type=int, help="existing interview, otherwise one is created")
+    parser.add_argument("--questions", type=int, default=12)
+    parser.add_argument("--max-answers", type=int, default=8)
+    parser.add_argument("--audio-ratio", type=float, default=0.7)
+    parser.add_argument("--audio-seconds", type=float, default=20)
+    parser.add_argument("--skip-ratio", type=float, default=0.05)
+    parser.add_argument("--think-time", type=float, default=3, help="mean seconds between answer and next question")
+    parser.add_argument("--wiki-timeout", type=float, default=600)
+    parser.add_argument("--poll-interval", type=float, default=2)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--replay", help="jsonl recorded with --record")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor")
+    parser.add_argument("--concurrency", type=int, default=100, help="max requests in flight during a replay")
+    parser.add_argument("--record", help="write every request as jsonl")
+    parser.add_argument("--output", default=f"data/benchmarks/load_{datetime.now():%Y%m%d_%H%M%S}.json")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    report = asyncio.run(run_replay(args) if args.replay else run_load(args))
+    report["meta"] = {"timestamp": datetime.now().isoformat(timespec="seconds"), "base_url": args.base_url,
+                      "mode": "replay" if args.replay else "load", "args": vars(args)}
+
+    for route, result in report["routes"].items():
+        print(f"{route:55} n={result['requests']:6} rps={result['throughput_rps']:7.2f} p50={result['p50_ms']:9.1f} "
+              f"p95={result['p95_ms']:9.1f} p99={result['p99_ms']:9.1f} errors={result['errors']}")
+    print(f"\n{report['requests']} requests in {report['seconds']}s, {report['throughput_rps']} rps")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
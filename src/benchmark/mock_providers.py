@@ -0,0 +1,327 @@
+"""
+Local stand-in for the OpenAI and Dify endpoints the agent calls, with configurable latency
+distributions and failure rates, so the interview flow can be load tested without tokens or rate limits.
+
+    python -m src.benchmark.mock_providers --port 8900 --latency-scale 0.2 --config mock.json
+
+Point the app and the worker at it with
+
+    OPENAI_BASE_URL=http://localhost:8900/v1
+    DIFY_API_URL=http://localhost:8900/v1
+
+The config file overrides the default profile per route, e.g.
+
+    {"chat": {"distribution": "lognormal", "median_ms": 800, "sigma": 0.4, "error_rate": 0.02},
+     "dify_wiki": {"distribution": "uniform", "min_ms": 5000, "max_ms": 20000, "rate_limit_rate": 0.05}}
+
+Distributions are `fixed` (ms), `uniform` (min_ms, max_ms), `normal` (mean_ms, stddev_ms),
+`lognormal` (median_ms, sigma) and `exponential` (mean_ms). Failures are `error_rate` (HTTP 500),
+`rate_limit_rate` (HTTP 429 with retry-after and x-ratelimit headers) and `timeout_rate` (the request hangs).
+
+Streamed chat completions (`stream: true`) and Dify runs (`response_mode: streaming`) send the first chunk after
+`first_token_share` of the sampled latency and the following chunks every `chunk_ms`.
+"""
+import argparse
+import asyncio
+from collections import Counter
+import copy
+import io
+import json
+import math
+import random
+import struct
+import time
+import uuid
+import wave
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+
+PROFILES = {
+    "chat": {"distribution": "lognormal", "median_ms": 1200, "sigma": 0.5},
+    "completion": {"distribution": "lognormal", "median_ms": 800, "sigma": 0.5},
+    "transcription": {"distribution": "lognormal", "median_ms": 1500, "sigma": 0.6},
+    "speech": {"distribution": "lognormal", "median_ms": 900, "sigma": 0.4},
+    "dify_analyse": {"distribution": "lognormal", "median_ms": 4000, "sigma": 0.5},
+    "dify_summary": {"distribution": "lognormal", "median_ms": 8000, "sigma": 0.5},
+    "dify_wiki": {"distribution": "lognormal", "median_ms": 25000, "sigma": 0.4},
+}
+TIMEOUT_SECONDS = 600
+FIRST_TOKEN_SHARE = 0.1
+CHUNK_MS = 30
+
+WORDS = "Ablauf Kunde Übergabe Schicht Wissen Prozess Dokumentation Termin Team Erfahrung wichtig zuerst danach".split()
+
+mock = FastAPI(title="zy mock providers")
+config = {"profiles": copy.deepcopy(PROFILES), "latency_scale": 1.0, "seed": None}
+stats = Counter()
+rnd = random.Random()
+
+
+def sample_ms(profile) -> float:
+    distribution = profile.get("distribution", "fixed")
+    if distribution == "fixed":
+        ms = profile.get("ms", 0)
+    elif distribution == "uniform":
+        ms = rnd.uniform(profile["min_ms"], profile["max_ms"])
+    elif distribution == "normal":
+        ms = rnd.gauss(profile["mean_ms"], profile["stddev_ms"])
+    elif distribution == "lognormal":
+        ms = profile["median_ms"] * math.exp(rnd.gauss(0, profile.get("sigma", 0.5)))
+    elif distribution == "exponential":
+        ms = rnd.expovariate(1 / profile["mean_ms"])
+    else:
+        raise ValueError(f"unknown distribution {distribution}")
+    return max(ms, 0) * config["latency_scale"]
+
+
+async def simulate(route: str, stream: bool = False):
+    """Waits like the provider would and returns an error response if a failure was drawn, a stream only waits for its first chunk."""
+    profile = config["profiles"][route]
+    stats[f"{route}.requests"] += 1
+    share = profile.get("first_token_share", FIRST_TOKEN_SHARE) if stream else 1
+    await asyncio.sleep(sample_ms(profile) * share / 1000)
+
+    roll = rnd.random()
+    if roll < profile.get("timeout_rate", 0):
+        stats[f"{route}.timeouts"] += 1
+        await asyncio.sleep(TIMEOUT_SECONDS)
+    roll -= profile.get("timeout_rate", 0)
+    if roll < profile.get("rate_limit_rate", 0):
+        stats[f"{route}.rate_limited"] += 1
+        retry_after = rnd.randint(1, 20)
+        return JSONResponse(status_code=429,
+                            headers={"retry-after": str(retry_after),
+                                     "x-ratelimit-remaining-requests": "0",
+                                     "x-ratelimit-reset-requests": f"{retry_after}s",
+                                     "x-ratelimit-remaining-tokens": "0",
+                                     "x-ratelimit-reset-tokens": f"{retry_after}s"},
+                            content={"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}})
+    roll -= profile.get("rate_limit_rate", 0)
+    if roll < profile.get("error_rate", 0):
+        stats[f"{route}.errors"] += 1
+        return JSONResponse(status_code=500, content={"error": {"message": "The server had an error (mock)", "type": "server_error"}})
+    return None
+
+
+def sse(events, route: str):
+    """Server-sent events of `events`, paced like tokens arriving. A callable event is built when it is sent."""
+    delay = config["profiles"][route].get("chunk_ms", CHUNK_MS) * config["latency_scale"] / 1000
+
+    async def generate():
+        for i, event in enumerate(events):
+            if i:
+                await asyncio.sleep(delay)
+            event = event() if callable(event) else event
+            yield f"data: {event if isinstance(event, str) else json.dumps(event, ensure_ascii=False)}\n\n"
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+
+def pieces(content: str, words: int = 3):
+    split = content.split(" ")
+    return [" ".join(split[i:i + words]) + (" " if i + words < len(split) else "") for i in range(0, len(split), words)]
+
+
+def text(words: int) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(max(words, 1)))
+
+
+def tokens(value) -> int:
+    # close enough to tiktoken for load numbers
+    return len(json.dumps(value, ensure_ascii=False)) // 4 + 1
+
+
+def silent_wav(seconds: float = 1.0, rate: int = 16000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(rate)
+        file.writeframes(struct.pack("<h", 0) * int(seconds * rate))
+    return buffer.getvalue()
+
+
+@mock.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    error = await simulate("chat", stream=body.get("stream", False))
+    if error:
+        return error
+
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        content = json.dumps({"additional_questions": [f"{text(8)}?"], "removed_optional_questions": [], "text": text(40)}, ensure_ascii=False)
+    else:
+        content = text(min(body.get("max_tokens") or 200, 400) // 2)
+    prompt_tokens, completion_tokens = tokens(body.get("messages")), tokens(content)
+    stats["tokens"] += prompt_tokens + completion_tokens
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+    head = {"id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": body.get("model")}
+
+    if body.get("stream"):
+        chunk = {**head, "object": "chat.completion.chunk"}
+        events = [{**chunk, "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}, "finish_reason": None}]} for piece in pieces(content)]
+        events.append({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            events.append({**chunk, "choices": [], "usage": usage})
+        return sse(events + ["[DONE]"], "chat")
+
+    return {
+        **head,
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop", "logprobs": None}],
+        "usage": usage,
+    }
+
+
+@mock.post("/v1/completions")
+async def completions(request: Request):
+    body = await request.json()
+    error = await simulate("completion")
+    if error:
+        return error
+
+    content = text(min(body.get("max_tokens") or 200, 400) // 2)
+    prompt_tokens, completion_tokens = tokens(body.get("prompt")), tokens(content)
+    stats["tokens"] += prompt_tokens + completion_tokens
+    return {
+        "id": f"cmpl-mock-{uuid.uuid4().hex[:12]}",
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"index": 0, "text": content, "finish_reason": "stop", "logprobs": None}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+@mock.post("/v1/audio/transcriptions")
+async def transcriptions(request: Request):
+    form = await request.form()
+    upload = form.get("file")
+    size = len(await upload.read()) if upload is not None else 0
+    error = await simulate("transcription")
+    if error:
+        return error
+
+    # longer recordings give longer transcripts
+    transcript = text(20 + size // 4000)
+    stats["audio_bytes"] += size
+    if form.get("response_format", "json") == "text":
+        return PlainTextResponse(transcript)
+    return {"text": transcript}
+
+
+@mock.post("/v1/audio/speech")
+async def speech(request: Request):
+    body = await request.json()
+    error = await simulate("speech")
+    if error:
+        return error
+
+    media_type = "audio/wav" if body.get("response_format") == "wav" else "audio/mpeg"
+    return Response(content=silent_wav(min(len(body.get("input", "")) / 15, 30)), media_type=media_type)
+
+
+@mock.post("/v1/workflows/run")
+async def workflows_run(request: Request):
+    body = await request.json()
+    inputs = body.get("inputs", {})
+    # the three workflows are told apart by their inputs
+    if "question" in inputs:
+        route = "dify_analyse"
+        outputs = {"text": json.dumps({"additional_questions": [f"{text(8)}?" for _ in range(rnd.choice([0, 0, 1, 1, 2]))],
+                                       "removed_optional_questions": []}, ensure_ascii=False)}
+    elif "prompt_id" in inputs:
+        route = "dify_wiki"
+        outputs = {"markdown": f"# {text(4)}\n\n## {text(3)}\n\n{text(300)}\n\n## {text(3)}\n\n{text(300)}"}
+    else:
+        route = "dify_summary"
+        outputs = {"text": text(200)}
+
+    started = time.time()
+    stream = body.get("response_mode") == "streaming"
+    error = await simulate(route, stream=stream)
+    if error:
+        return error
+
+    total_tokens = tokens(inputs) + tokens(outputs)
+    stats["tokens"] += total_tokens
+    run_id, task_id = str(uuid.uuid4()), str(uuid.uuid4())
+
+    def data():
+        return {
+            "id": run_id,
+            "workflow_id": route,
+            "status": "succeeded",
+            "outputs": outputs,
+            "error": None,
+            "elapsed_time": round(time.time() - started, 3),
+            "total_tokens": total_tokens,
+            "total_steps": 3,
+            "created_at": int(started),
+            "finished_at": int(time.time()),
+        }
+
+    if stream:
+        head = {"task_id": task_id, "workflow_run_id": run_id}
+        output = next(iter(outputs))
+        events = [{**head, "event": "workflow_started", "data": {"id": run_id, "workflow_id": route, "created_at": int(started)}}]
+        events += [{**head, "event": "text_chunk", "data": {"text": piece, "from_variable_selector": ["llm", output]}} for piece in pieces(outputs[output])]
+        # the result is built when the last chunk is sent, like the elapsed time of a real run
+        events.append(lambda: {**head, "event": "workflow_finished", "data": data()})
+        return sse(events, route)
+
+    return {"workflow_run_id": run_id, "task_id": task_id, "data": data()}
+
+
+@mock.get("/mock/stats")
+async def get_stats():
+    return {"latency_scale": config["latency_scale"], "profiles": config["profiles"], "counters": dict(stats)}
+
+
+@mock.post("/mock/config")
+async def set_config(request: Request):
+    """Changes profiles while a load test is running, e.g. to inject an outage."""
+    body = await request.json()
+    configure(body.get("profiles", {}), body.get("latency_scale"))
+    return await get_stats()
+
+
+def configure(profiles, latency_scale=None, seed=None):
+    for route, profile in profiles.items():
+        if route not in config["profiles"]:
+            raise ValueError(f"unknown route {route}, expected one of {', '.join(PROFILES)}")
+        config["profiles"][route].update(profile)
+    if latency_scale is not None:
+        config["latency_scale"] = latency_scale
+    if seed is not None:
+        rnd.seed(seed)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--config", help="json file with profile overrides per route")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplies every sampled latency")
+    parser.add_argument("--error-rate", type=float, help="HTTP 500 rate for every route")
+    parser.add_argument("--rate-limit-rate", type=float, help="HTTP 429 rate for every route")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    profiles = {}
+    if args.config:
+        with open(args.config) as file:
+            profiles = json.load(file)
+    for name in ("error_rate", "rate_limit_rate"):
+        if getattr(args, name) is not None:
+            for route in PROFILES:
+                profiles.setdefault(route, {}).setdefault(name, getattr(args, name))
+    configure(profiles, args.latency_scale, args.seed)
+
+    uvicorn.run(mock, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
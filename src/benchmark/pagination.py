@@ -0,0 +1,74 @@
+"""
+Checks that the keyset pagination of `GET /user_interviews/page` returns every interview exactly once and newest first,
+also when the interviews were created within the same second. Exits with status 1 otherwise.
+
+    python -m src.benchmark.pagination --interviews 25 --limit 2
+"""
+import argparse
+import asyncio
+import sys
+
+from src.benchmark.utils import use_app_environment, use_benchmark_database
+
+use_benchmark_database()
+use_app_environment()
+
+from sqlalchemy import desc  # noqa: E402
+from src.datamodel.interview import Interview, InterviewState, InterviewStateType, User, UserInterview, UserModel  # noqa: E402
+from src.datamodel.manager.sqldb_manager import AsyncSessionLocal, SessionLocal, run_migrations  # noqa: E402
+from src.server.routers.user_interviews import get_user_interviews_page  # noqa: E402
+
+
+def seed(num_interviews: int) -> int:
+    """Creates a user with `num_interviews` completed interviews in one transaction, so they share their createdAt."""
+    with SessionLocal() as db:
+        user = User(username=f"pagination_{num_interviews}")
+        interview = Interview(title="Pagination", business_segment="Pflege")
+        db.add_all([user, interview])
+        db.flush()
+        user_interviews = [UserInterview(user_id=user.id, interview_id=interview.id, title=f"Pagination {i}") for i in range(num_interviews)]
+        db.add_all(user_interviews)
+        db.flush()
+        db.add_all([InterviewState(user_interview_id=user_interview.id, category="general", step=0, state=InterviewStateType.completed)
+                    for user_interview in user_interviews])
+        db.commit()
+        return user.id
+
+
+async def page_through(user_id: int, limit: int, max_pages: int) -> list[int]:
+    ids, cursor = [], None
+    async with AsyncSessionLocal() as db:
+        for _ in range(max_pages):
+            page = await get_user_interviews_page(user=UserModel(id=user_id, username=""), states=[InterviewStateType.completed],
+                                                  limit=limit, cursor=cursor, projection="summary", include_responses=False, db=db)
+            ids.extend(item.id for item in page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interviews", type=int, default=25)
+    parser.add_argument("--limit", type=int, default=2)
+    args = parser.parse_args()
+
+    run_migrations()
+    user_id = seed(args.interviews)
+    with SessionLocal() as db:
+        expected = [row.id for row in db.query(UserInterview.id).filter(UserInterview.user_id == user_id)
+                    .order_by(desc(UserInterview.createdAt), desc(UserInterview.id))]
+
+    # a cursor that does not move would page forever
+    ids = asyncio.run(page_through(user_id, args.limit, max_pages=args.interviews + 1))
+    status = "ok" if ids == expected else "FAIL"
+    print(f"{status:4} interviews={args.interviews} limit={args.limit} pages={-(-len(ids) // args.limit)}")
+    if status != "ok":
+        print(f"     expected {expected}\n     got      {ids}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
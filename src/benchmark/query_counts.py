@@ -0,0 +1,63 @@
+"""
+Checks that the hot read paths stay O(1) in database round trips, independent of the interview size.
+Exits with status 1 if a path needs more queries than allowed.
+
+    python -m src.benchmark.query_counts
+"""
+import asyncio
+import sys
+
+from src.benchmark.utils import QueryCounter, seed_user_interview, use_benchmark_database
+
+use_benchmark_database()
+
+from src.datamodel.manager.db_helper import get_user_interview_state, history_pairs, select_history  # noqa: E402
+from src.datamodel.manager.sqldb_manager import AsyncSessionLocal, SessionLocal, async_engine, engine, run_migrations  # noqa: E402
+from src.helper.wiki import generate_summary  # noqa: E402
+
+SIZES = [10, 60, 300]
+
+# path -> max queries per call
+BUDGETS = {
+    "history": 1,
+    "summary": 1,
+    "state": 1,
+}
+
+
+async def count_history(user_interview_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        with QueryCounter(async_engine.sync_engine) as counter:
+            history_pairs((await db.execute(select_history(user_interview_id))).all())
+        return counter.count
+
+
+def count_sync(fn, *args) -> int:
+    with SessionLocal() as db, QueryCounter(engine) as counter:
+        fn(*args, db)
+        return counter.count
+
+
+def main():
+    run_migrations()
+    failures = []
+    for size in SIZES:
+        with SessionLocal() as db:
+            user_interview_id = seed_user_interview(db, size, seed=size)
+
+        counts = {
+            "history": asyncio.run(count_history(user_interview_id)),
+            "summary": count_sync(generate_summary, user_interview_id),
+            "state": count_sync(get_user_interview_state, user_interview_id, ""),
+        }
+        for path, count in counts.items():
+            status = "ok" if count <= BUDGETS[path] else "FAIL"
+            print(f"{status:4} {path:8} questions={size:5} queries={count} (max {BUDGETS[path]})")
+            if status != "ok":
+                failures.append(path)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Query count and latency of `get_user_interview_state` for interviews of different sizes.
+`--check` exits with status 1 if the p50 per question at the largest size, 1000 questions by default, exceeds
+the one at the smallest size, the state has to grow linearly with the questions and their responses.
+
+    python -m src.benchmark.state_builder --sizes 50 200 1000 --repeat 20 [--check]
+"""
+import argparse
+import json
+import sys
+
+from src.benchmark.utils import QueryCounter, percentiles, seed_user_interview, timed, use_benchmark_database
+
+use_benchmark_database()
+
+from src.datamodel.manager.db_helper import get_user_interview_state  # noqa: E402
+from src.datamodel.manager.sqldb_manager import SessionLocal, engine, run_migrations  # noqa: E402
+
+
+def run(sizes, repeat):
+    run_migrations()
+    results = []
+    for size in sizes:
+        with SessionLocal() as db:
+            user_interview_id = seed_user_interview(db, size)
+
+        latencies = []
+        with SessionLocal() as db, QueryCounter(engine) as counter:
+            for _ in range(repeat):
+                state, ms = timed(get_user_interview_state, user_interview_id, "Frage 0?", db)
+                latencies.append(ms)
+            queries = counter.count / repeat
+
+        results.append({
+            "questions": size,
+            "queries": queries,
+            "answered": len(state.answered_questions),
+            "skipped": len(state.skipped_questions),
+            **{f"{k}_ms": round(v, 3) for k, v in percentiles(latencies).items()}
+        })
+    return results
+
+
+def check(results) -> bool:
+    smallest, largest = results[0], results[-1]
+    per_question = {result["questions"]: result["p50_ms"] / result["questions"] for result in (smallest, largest)}
+    ok = per_question[largest["questions"]] <= per_question[smallest["questions"]]
+    print(f"{'ok' if ok else 'FAIL':4} p50 per question: {per_question[smallest['questions']]:.4f}ms at {smallest['questions']} questions, "
+          f"{per_question[largest['questions']]:.4f}ms at {largest['questions']}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--check", action="store_true", help="fail if the state grows faster than the interview")
+    args = parser.parse_args()
+
+    results = run(sorted(args.sizes), args.repeat)
+    print(json.dumps(results, indent=2))
+    if args.check and not check(results):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
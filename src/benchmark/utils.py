@@ -0,0 +1,118 @@
+import math
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List
+
+from sqlalchemy import event
+
+
+def use_benchmark_database():
+    """
+    Points the app at the benchmark database before any model is imported. Benchmarks write data,
+    so they never fall back to BB_DATABASE_URL from the .env file.
+    """
+    url = os.getenv("BB_BENCHMARK_DATABASE_URL")
+    if not url:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='zy_bench_'), 'bench.db')}"
+    os.environ["BB_DATABASE_URL"] = url
+    os.environ["BB_DB_TYPE"] = "postgresql" if url.startswith("postgresql") else "sqlite"
+    # modules create their clients on import, none of them is called by the database benchmarks
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("DIFY_API_URL", "http://localhost")
+    os.environ.setdefault("REDIS_HOST", "localhost")
+    os.environ.setdefault("REDIS_PORT", "6379")
+    return url
+
+
+# the app requires these on import, none of the benchmarked endpoints calls dify, auth0 or uses the session
+APP_ENV = {
+    "SESSION_SECRET_KEY": "benchmark",
+    "DIFY_API_URL": "http://localhost/v1",
+    "DIFY_MAX_PROMPT_ID": "4",
+    "AUTH0_DOMAIN": "localhost",
+    "AUTH0_CLIENT_ID": "benchmark",
+    "AUTH0_CLIENT_SECRET": "benchmark",
+    "BB_URI": "http://localhost:8001",
+    "FRONTEND_URI": "http://localhost:3000",
+}
+
+
+def use_app_environment():
+    """Settings the server modules read on import, for benchmarks that import routers or the app."""
+    for name, value in APP_ENV.items():
+        os.environ.setdefault(name, value)
+
+
+class QueryCounter:
+    """Counts the statements an engine executes while the context is active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self.engine, "before_cursor_execute", self._count)
+
+
+def percentiles(samples: List[float], points=(50, 95, 99)) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {f"p{p}": 0.0 for p in points}
+    return {f"p{p}": ordered[min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1)] for p in points}
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def seed_user_interview(db, num_questions: int, additional_ratio=0.2, answered_ratio=0.6, skipped_ratio=0.1, seed=42):
+    """Creates one user interview with `num_questions` questions, a share of them follow-ups, and responses to them."""
+    from src.datamodel.interview import AdditionalQuestion, Interview, InterviewState, InterviewStateType, Question, Response, User, UserInterview
+
+    rnd = random.Random(seed)
+    user = User(username=f"bench_{seed}_{num_questions}_{rnd.random()}")
+    interview = Interview(title=f"Benchmark {num_questions}", business_segment="Pflege")
+    db.add_all([user, interview])
+    db.flush()
+
+    user_interview = UserInterview(user_id=user.id, interview_id=interview.id, title=interview.title)
+    db.add(user_interview)
+    db.flush()
+    db.add(InterviewState(user_interview_id=user_interview.id, category="general", step=0, state=InterviewStateType.active))
+
+    num_additional = int(num_questions * additional_ratio)
+    questions = [Question(text=f"Frage {i}?", category="general", order=i, interview_id=interview.id)
+                 for i in range(num_questions - num_additional)]
+    additional = [AdditionalQuestion(text=f"Folgefrage {i}?", order=1000 + i, user_interview_id=user_interview.id)
+                  for i in range(num_additional)]
+    db.add_all(questions + additional)
+    db.flush()
+
+    for question in questions + additional:
+        roll = rnd.random()
+        if roll > answered_ratio + skipped_ratio:
+            continue
+        is_additional = isinstance(question, AdditionalQuestion)
+        db.add(Response(
+            user_interview_id=user_interview.id,
+            question_id=None if is_additional else question.id,
+            additional_question_id=question.id if is_additional else None,
+            is_additional=is_additional,
+            skipped=roll > answered_ratio,
+            text="" if roll > answered_ratio else f"Antwort auf {question.text} " + "bla " * rnd.randint(5, 60),
+            audio_text=""
+        ))
+    db.commit()
+    return user_interview.id
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import BaseModel
 
 
@@ -6,3 +7,25 @@ class AudioModel(BaseModel):
     user_id: int
     interview_id: int
     question_id: int
+    sha256: Optional[str] = None
+
+
+class UploadCreate(BaseModel):
+    interview_id: int
+    question_id: int
+    # expected size in bytes, completing checks that all of it arrived
+    size: Optional[int] = None
+
+
+class UploadModel(BaseModel):
+    upload_id: str
+    offset: int
+    size: Optional[int]
+    max_size: int
+
+
+class SegmentModel(BaseModel):
+    # the answer's audio to submit
+    url: str
+    index: int
+    status: str
@@ -2,7 +2,7 @@ from datetime import datetime
 import enum
 from typing import Dict, List, Optional
 from pydantic import BaseModel
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, Sequence, String, func, Enum
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, Sequence, String, UniqueConstraint, func, text, Enum, Index
 from sqlalchemy.orm import relationship
 
 from .manager.sqldb_manager import Base, engine
@@ -19,6 +19,13 @@ class InterviewStateType(enum.Enum):
     completed = "completed"
 
 
+class TranscriptionStatusType(enum.Enum):
+    pending = "pending"
+    processing = "processing"
+    done = "done"
+    failed = "failed"
+
+
 class User(Base):
     __tablename__ = 'users'
 
@@ -39,6 +46,7 @@ class Interview(Base):
 
 class AdditionalQuestion(Base):
     __tablename__ = 'additional_questions'
+    __table_args__ = (Index('ix_additional_questions_user_interview_order', 'user_interview_id', 'order'),)
     id = Column(Integer, primary_key=True)
     text = Column(String, index=True)
     order = Column(Integer, Sequence('increment_sequence', start=1000, increment=1), default=Sequence('increment_sequence').next_value())
@@ -51,6 +59,7 @@ class AdditionalQuestion(Base):
 
 class Wiki(Base):
     __tablename__ = "wikis"
+    __table_args__ = (Index('ix_wikis_user_interview_created', 'user_interview_id', 'createdAt', 'version'),)
     id = Column(Integer, primary_key=True)
     prompt_id = Column(String)
     selected = Column(Boolean, default=False)
@@ -73,6 +82,7 @@ class Cost(Base):
 
 class UserInterview(Base):
     __tablename__ = 'user_interviews'
+    __table_args__ = (Index('ix_user_interviews_user_created', 'user_id', 'createdAt', 'id'),)
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), index=True)
@@ -83,12 +93,25 @@ class UserInterview(Base):
     wikis = relationship("Wiki", back_populates="user_interview", uselist=False)
     responses = relationship("Response", back_populates="user_interview")
     costs = relationship("Cost", back_populates="user_interview", uselist=False)
+    history_summary = relationship("HistorySummary", back_populates="user_interview", uselist=False)
     title = Column(String, nullable=True)
 
     selected_wiki = Column(Integer, nullable=True)
     createdAt = Column(DateTime(), default=func.now())
 
 
+class HistorySummary(Base):
+    __tablename__ = 'history_summaries'
+    id = Column(Integer, primary_key=True)
+    summary = Column(String, default="")
+    # response of the last answer folded into the summary, answers are summarized in the order of their responses
+    summarized_response_id = Column(Integer, nullable=True)
+    tokens = Column(Integer, default=0)
+    updatedAt = Column(DateTime(), default=func.now(), onupdate=func.now())
+    user_interview_id = Column(Integer, ForeignKey('user_interviews.id'), index=True, unique=True)
+    user_interview = relationship("UserInterview", back_populates="history_summary")
+
+
 class InterviewState(Base):
     __tablename__ = 'interview_state'
     id = Column(Integer, primary_key=True)
@@ -101,6 +124,7 @@ class InterviewState(Base):
 
 class Question(Base):
     __tablename__ = 'questions'
+    __table_args__ = (Index('ix_questions_interview_order', 'interview_id', 'order'),)
     id = Column(Integer, primary_key=True, index=True)
     text = Column(String, index=True)
     audio = Column(String)
@@ -111,8 +135,27 @@ class Question(Base):
     responses = relationship("Response", back_populates="question")
 
 
+class QuestionPlanItem(Base):
+    """
+    One entry of the ordered question plan of a user interview. Positions match `InterviewState.step`:
+    the interview questions by order followed by the additional questions in the order they were added.
+    """
+    __tablename__ = 'question_plan'
+    __table_args__ = (UniqueConstraint('user_interview_id', 'position', name='uq_question_plan_position'),)
+    id = Column(Integer, primary_key=True)
+    position = Column(Integer, nullable=False)
+    category = Column(String)
+    answered = Column(Boolean, default=False)
+    skipped = Column(Boolean, default=False)
+    question_id = Column(Integer, ForeignKey('questions.id'), nullable=True)
+    additional_question_id = Column(Integer, ForeignKey('additional_questions.id'), nullable=True)
+    user_interview_id = Column(Integer, ForeignKey('user_interviews.id'), nullable=False)
+
+
 class Response(Base):
     __tablename__ = 'responses'
+    __table_args__ = (Index('ix_responses_user_interview_question', 'user_interview_id', 'question_id'),
+                      Index('ix_responses_user_interview_additional_question', 'user_interview_id', 'additional_question_id'))
     id = Column(Integer, primary_key=True)
     text = Column(String, nullable=True)
     audio = Column(String, nullable=True)
@@ -125,6 +168,67 @@ class Response(Base):
     user_interview_id = Column(Integer, ForeignKey('user_interviews.id'), index=True)
     question = relationship("Question", back_populates="responses")
     user_interview = relationship("UserInterview", back_populates="responses", foreign_keys=[user_interview_id])
+    transcription = relationship("Transcription", back_populates="response", uselist=False)
+
+
+class AudioStats:
+    """Recording before and after preprocessing, durations in seconds."""
+    audio_bytes = Column(Integer, nullable=True)
+    processed_bytes = Column(Integer, nullable=True)
+    audio_duration = Column(Float, nullable=True)
+    processed_duration = Column(Float, nullable=True)
+    preprocess_ms = Column(Integer, nullable=True)
+    stt_ms = Column(Integer, nullable=True)
+
+
+class Transcription(AudioStats, Base):
+    __tablename__ = 'transcriptions'
+    id = Column(Integer, primary_key=True)
+    status = Column(Enum(TranscriptionStatusType), default=TranscriptionStatusType.pending)
+    error = Column(String, nullable=True)
+    createdAt = Column(DateTime(), default=func.now())
+    updatedAt = Column(DateTime(), default=func.now(), onupdate=func.now())
+    response_id = Column(Integer, ForeignKey('responses.id'), index=True, unique=True)
+    response = relationship("Response", back_populates="transcription")
+
+
+class AnswerSegment(AudioStats, Base):
+    """
+    Part of a recording uploaded while the user is still answering, transcribed in the background.
+    Submitting the answer binds its segments to the response, later answers to the question start new ones.
+    """
+    __tablename__ = 'answer_segments'
+    # only the segments of the answer in progress are unique, submitted answers keep theirs
+    __table_args__ = (Index('uq_answer_segments_open_recording_index', 'user_interview_id', 'recording', 'index', unique=True,
+                            postgresql_where=text('response_id IS NULL'), sqlite_where=text('response_id IS NULL')),
+                      Index('ix_answer_segments_response', 'response_id'))
+    id = Column(Integer, primary_key=True)
+    # filename of the whole answer, the response refers to it once the answer is submitted
+    recording = Column(String, nullable=False)
+    index = Column(Integer, nullable=False)
+    audio = Column(String, nullable=False)
+    status = Column(Enum(TranscriptionStatusType), default=TranscriptionStatusType.pending)
+    transcript = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    createdAt = Column(DateTime(), default=func.now())
+    updatedAt = Column(DateTime(), default=func.now(), onupdate=func.now())
+    user_interview_id = Column(Integer, ForeignKey('user_interviews.id'), nullable=False)
+    response_id = Column(Integer, ForeignKey('responses.id'), nullable=True)
+
+
+class TranscriptCache(Base):
+    """Transcripts by content hash of the recording, backs the redis transcript cache."""
+    __tablename__ = 'transcript_cache'
+    __table_args__ = (UniqueConstraint('audio_hash', 'model', 'language', name='uq_transcript_cache_key'),)
+    id = Column(Integer, primary_key=True)
+    audio_hash = Column(String(64), nullable=False)
+    model = Column(String, nullable=False)
+    language = Column(String, nullable=False)
+    transcript = Column(String, nullable=False)
+    # whisper requests and time the transcript took, saved on every hit
+    stt_calls = Column(Integer, default=1)
+    stt_ms = Column(Integer, nullable=True)
+    createdAt = Column(DateTime(), default=func.now())
 
 
 class RawResponse(Base):
@@ -155,11 +259,19 @@ class ResponseModel(BaseModel):
     is_additional: bool = False
     by_user: bool = True
     skipped: bool = False
+    transcription_status: Optional[TranscriptionStatusType] = None
 
     class Config:
         from_attributes = True
 
 
+class TranscriptionModel(BaseModel):
+    response_id: int
+    status: TranscriptionStatusType
+    audio_text: Optional[str]
+    error: Optional[str]
+
+
 class RawResponseModel(BaseModel):
     id: int
     json_obj: str
@@ -254,6 +366,22 @@ class UserInterviewModel(BaseModel):
         from_attributes = True
 
 
+class UserInterviewSummaryModel(BaseModel):
+    id: int
+    title: Optional[str]
+    state: Optional[InterviewStateType]
+    selected_wiki: Optional[int]
+    createdAt: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class UserInterviewPage(BaseModel):
+    items: List[UserInterviewSummaryModel] | List[UserInterviewModel]
+    next_cursor: Optional[str]
+
+
 class AdditionalQuestionModel(BaseModel):
     id: int
     text: str
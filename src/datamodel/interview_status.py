@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, Optional
 from pydantic import BaseModel
 
 from src.datamodel.interview import WikiModel
@@ -7,3 +7,11 @@ from src.datamodel.interview import WikiModel
 class InterviewStatusModel(BaseModel):
     status: str
     wikis: Optional[list[WikiModel]]
+    job_id: Optional[str] = None
+
+
+class WikiGenerationStatusModel(BaseModel):
+    job_id: str
+    status: str
+    progress: Dict[str, str]
+    wikis: list[WikiModel] = []
@@ -1,87 +1,163 @@
-
+from datetime import datetime
 from logging import getLogger
+from typing import List, NamedTuple, Optional, Tuple
+from sqlalchemy import Integer, and_, case, desc, func, literal, or_, select, union_all
 from sqlalchemy.orm import Session
 from .sqldb_manager import engine
-from src.datamodel.interview import AdditionalQuestion, Interview, Question, QuestionModel, Response, ResponseModel, UserInterview, AdditionalQuestionModel
+from src.datamodel.interview import AdditionalQuestion, Interview, Question, Response, UserInterview
 
 
 logging = getLogger()
 
 
-def get_user_interview_state(user_interview_id: int, user_question: str):
+class StateQuestion(NamedTuple):
+    id: int
+    text: str
+    is_additional: bool
+
+
+class AnsweredQuestion(NamedTuple):
+    id: int
+    text: str
+    is_additional: bool
+    response_id: int
+    response_text: Optional[str]
+    audio_text: Optional[str]
+
+
+class UserInterviewState(NamedTuple):
+    business_segment: str
+    answered_questions: List[AnsweredQuestion]
+    skipped_questions: List[StateQuestion]
+    unanswered_mandatory_questions: List[StateQuestion]
+    unanswered_optional_questions: List[StateQuestion]
+
+
+def select_user_interview_state(user_interview_id: int):
+    """
+    One row per question of the user interview and its response, if any, classified as
+    'answered', 'skipped' or 'unanswered'. Questions and additional questions are joined to their
+    responses before the union, so each side looks its responses up by the composite index of its key.
+    """
+    interview_id = select(UserInterview.interview_id).filter(UserInterview.id == user_interview_id).scalar_subquery()
+    business_segment = select(Interview.business_segment) \
+        .join(UserInterview, UserInterview.interview_id == Interview.id) \
+        .filter(UserInterview.id == user_interview_id).scalar_subquery()
+
+    def with_responses(question, kind: int, key):
+        return select(question.id, question.text, literal(kind, Integer).label("kind"), question.order,
+                      Response.id.label("response_id"), Response.text.label("response_text"), Response.audio_text, Response.skipped) \
+            .outerjoin(Response, and_(Response.user_interview_id == user_interview_id, key == question.id))
+
+    questions = union_all(
+        with_responses(Question, 0, Response.question_id).filter(Question.interview_id == interview_id),
+        with_responses(AdditionalQuestion, 1, Response.additional_question_id).filter(AdditionalQuestion.user_interview_id == user_interview_id)
+    ).subquery()
+
+    status = case((questions.c.response_id.is_(None), "unanswered"),
+                  (questions.c.skipped.is_(True), "skipped"),
+                  else_="answered")
+
+    return select(questions.c.id, questions.c.text, questions.c.kind, status.label("status"),
+                  questions.c.response_id, questions.c.response_text, questions.c.audio_text,
+                  business_segment.label("business_segment")) \
+        .order_by(questions.c.kind, questions.c.order, questions.c.response_id)
+
+
+def select_business_segment(user_interview_id: int):
+    return select(Interview.business_segment).join(UserInterview, UserInterview.interview_id == Interview.id) \
+        .filter(UserInterview.id == user_interview_id)
+
+
+def get_user_interview_state(user_interview_id: int, user_question: str, db: Session = None) -> Optional[UserInterviewState]:
     logging.debug("get_user_interview_state - Fetching user interview state for user_interview_id: %s", user_interview_id)
-    with Session(bind=engine) as session:
-        user_interview = session.query(UserInterview).filter_by(id=user_interview_id).one_or_none()
-        if not user_interview:
-            return {"error": "User interview not found"}
-
-        interview_id = user_interview.interview_id
-        interview = session.query(Interview).filter_by(id=interview_id).one_or_none()
-        if not interview:
-            logging.error("Interview not found, setting default")
-            business_segment = "Allgemein"
-        else:
-            business_segment = interview.business_segment
-
-        # Fetch all questions for the interview
-        mandatory_questions = session.query(Question).filter_by(interview_id=interview_id).all()
-        optional_questions = session.query(AdditionalQuestion).filter_by(user_interview_id=user_interview_id).all()
-
-        # Mapping of question IDs to question objects
-        all_questions = {q.id: q for q in mandatory_questions + optional_questions}
-
-        # Fetch all responses given by the user in this interview
-        responses = session.query(Response).filter_by(user_interview_id=user_interview_id).all()
-        answered_questions_with_responses = []
-        skipped_questions = []
-
-        # Classify each response
-        for response in responses:
-            if response.skipped:
-                if response.question_id in all_questions:
-                    skipped_questions.append(all_questions[response.question_id])
-            else:
-                if response.question_id in all_questions:
-                    answered_questions_with_responses.append((all_questions[response.question_id], response))
-
-        # Determine unanswered questions
-        all_responded_ids = {q.id for q, _ in answered_questions_with_responses}.union({q.id for q in skipped_questions})
-
-        # Remove the question with the same text as 'user_question'
-        user_question_text = user_question.strip().lower()  # Normalize the user question text
-        questions_to_remove = set()
-        for q in mandatory_questions + optional_questions:
-            if q.text.strip().lower() == user_question_text:
-                questions_to_remove.add(q.id)
-
-        unanswered_mandatory = [q for q in mandatory_questions if q.id not in all_responded_ids and q.id not in questions_to_remove]
-        unanswered_optional = [q for q in optional_questions if q.id not in all_responded_ids and q.id not in questions_to_remove]
-
-        # Prepare the data to return
-        result = {
-            "business_segment": business_segment,
-            # Prepare a list of answered questions with their corresponding responses, excluding the question that matches the user's provided question text
-            "answered_questions": [{"question": QuestionModel.model_validate(q).model_dump(),
-                                    "response": ResponseModel.model_validate(r).model_dump()}
-                                   for q, r in answered_questions_with_responses
-                                   if q.text.strip().lower() != user_question.strip().lower()],
-            "unanswered_mandatory_questions": [QuestionModel.model_validate(q).model_dump() for q in unanswered_mandatory],
-            "unanswered_optional_questions": [AdditionalQuestionModel.model_validate(q).model_dump() for q in unanswered_optional],
-            "skipped_questions": [QuestionModel.model_validate(q).model_dump() for q in skipped_questions]
-        }
-        logging.debug("get_user_interview_state - ", result)
-        print("get_user_interview_state - ", result)
-        return result
-
-
-def generate_history(answered_questions):
+    if db is None:
+        with Session(bind=engine) as session:
+            return get_user_interview_state(user_interview_id, user_question, session)
+
+    rows = db.execute(select_user_interview_state(user_interview_id)).all()
+    if rows:
+        business_segment = rows[0].business_segment
+    else:
+        # an interview without questions has no rows, but a state all the same
+        found = db.execute(select_business_segment(user_interview_id)).first()
+        if found is None:
+            return None
+        business_segment = found.business_segment
+    if business_segment is None:
+        logging.error("Interview not found, setting default")
+        business_segment = "Allgemein"
+
+    # a question can have more than one response, an answer wins over a skip
+    statuses = {}
+    answered = {}
+    for row in rows:
+        key = (row.kind, row.id)
+        if row.status == "answered":
+            answered.setdefault(key, AnsweredQuestion(row.id, row.text, row.kind == 1, row.response_id, row.response_text, row.audio_text))
+            statuses[key] = StateQuestion(row.id, row.text, row.kind == 1), "answered"
+        elif key not in statuses or statuses[key][1] != "answered":
+            statuses[key] = StateQuestion(row.id, row.text, row.kind == 1), row.status
+
+    # the question that is being analysed is neither history nor upcoming
+    user_question_text = user_question.strip().lower()
+
+    state = UserInterviewState(business_segment, [], [], [], [])
+    for question, status in statuses.values():
+        if status == "skipped":
+            state.skipped_questions.append(question)
+        elif status == "unanswered" and question.text.strip().lower() != user_question_text:
+            (state.unanswered_optional_questions if question.is_additional else state.unanswered_mandatory_questions).append(question)
+
+    # answers in the order they were given
+    state.answered_questions.extend(sorted((a for a in answered.values() if a.text.strip().lower() != user_question_text),
+                                           key=lambda a: a.response_id))
+
+    logging.debug(f"get_user_interview_state - {len(state.answered_questions)} answered, {len(state.skipped_questions)} skipped, "
+                  f"{len(state.unanswered_mandatory_questions)}/{len(state.unanswered_optional_questions)} unanswered")
+    return state
+
+
+def select_history(user_interview_id: int):
+    """All responses of a user interview with their question or additional question, in the order they were given."""
+    return select(Response, Question, AdditionalQuestion) \
+        .outerjoin(Question, Question.id == Response.question_id) \
+        .outerjoin(AdditionalQuestion, AdditionalQuestion.id == Response.additional_question_id) \
+        .filter(Response.user_interview_id == user_interview_id) \
+        .order_by(Response.id)
+
+
+def page_user_interviews(query, limit: int, cursor: Optional[Tuple[datetime, int]] = None):
+    """
+    Newest first page of user interviews after `cursor`, the (createdAt, id) of the last interview of the previous page.
+    createdAt is compared with the value stored for that interview, SQLite stores it without fraction of a second and a
+    bound datetime never equals it. The cursor's createdAt is only used if the interview was deleted.
+    """
+    if cursor:
+        created_at, last_id = cursor
+        last_created_at = func.coalesce(select(UserInterview.createdAt).where(UserInterview.id == last_id).scalar_subquery(), created_at)
+        query = query.filter(or_(UserInterview.createdAt < last_created_at,
+                                 and_(UserInterview.createdAt == last_created_at, UserInterview.id < last_id)))
+    return query.order_by(desc(UserInterview.createdAt), desc(UserInterview.id)).limit(limit + 1)
+
+
+def history_pairs(rows) -> List[Tuple[Question | AdditionalQuestion, Response]]:
+    pairs = []
+    for response, question, additional_question in rows:
+        question = additional_question if response.is_additional else question
+        if question is None:
+            logging.error(f"history_pairs - no question found for response {response.id}")
+            continue
+        pairs.append((question, response))
+    return pairs
+
+
+def generate_history(answered_questions: List[AnsweredQuestion]):
     history = []
 
     for qa in answered_questions:
-        response_dump = ResponseModel.model_validate(qa["response"]).model_dump()
-        # for question, response in answered_questions:
-        formatted_question = QuestionModel.model_validate(qa["question"]).model_dump()["text"]
-        formatted_response = response_dump["text"] + ("\n" if response_dump["text"] else "") + response_dump["audio_text"]
-        history.append(f"System: {formatted_question}\nUser: {formatted_response}")
+        response_text = qa.response_text or ""
+        formatted_response = response_text + ("\n" if response_text else "") + (qa.audio_text or "")
+        history.append(f"System: {qa.text}\nUser: {formatted_response}")
 
     return history
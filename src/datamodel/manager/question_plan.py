@@ -0,0 +1,136 @@
+from logging import getLogger
+from typing import List, Optional
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src.datamodel.interview import AdditionalQuestion, InterviewState, Question, QuestionPlanItem, Response, UserInterview
+
+logging = getLogger()
+
+# attempts to append follow-ups after another analysis took the same positions, only on databases without row locks
+APPEND_RETRIES = 3
+
+
+def select_plan_questions(user_interview_id: int):
+    return select(QuestionPlanItem, Question, AdditionalQuestion) \
+        .outerjoin(Question, Question.id == QuestionPlanItem.question_id) \
+        .outerjoin(AdditionalQuestion, AdditionalQuestion.id == QuestionPlanItem.additional_question_id) \
+        .filter(QuestionPlanItem.user_interview_id == user_interview_id)
+
+
+def select_plan_question_at(user_interview_id: int, position: int):
+    return select_plan_questions(user_interview_id).filter(QuestionPlanItem.position == position)
+
+
+def select_next_plan_question(user_interview_id: int, after: int):
+    return select_plan_questions(user_interview_id) \
+        .filter(QuestionPlanItem.position > after,
+                QuestionPlanItem.answered.is_(False),
+                QuestionPlanItem.skipped.is_(False)) \
+        .order_by(QuestionPlanItem.position) \
+        .limit(1)
+
+
+def lock_plan(user_interview_id: int):
+    """Locks the interview state row until commit, plan changes of one user interview take it first. SQLite ignores it."""
+    return select(InterviewState.id).filter(InterviewState.user_interview_id == user_interview_id).with_for_update()
+
+
+def select_plan_size(user_interview_id: int):
+    return select(func.count(QuestionPlanItem.id)).filter(QuestionPlanItem.user_interview_id == user_interview_id)
+
+
+def update_plan_response(user_interview_id: int, is_additional: bool, question_id: int, skipped: bool):
+    column = QuestionPlanItem.additional_question_id if is_additional else QuestionPlanItem.question_id
+    values = {"skipped": True} if skipped else {"answered": True}
+    return update(QuestionPlanItem).filter(QuestionPlanItem.user_interview_id == user_interview_id, column == question_id).values(**values)
+
+
+def plan_items(user_interview_id: int, questions: List[Question], additional_questions: List[AdditionalQuestion], responses: List[Response], start: int = 0):
+    answered = set()
+    skipped = set()
+    for response in responses:
+        key = (True, response.additional_question_id) if response.is_additional else (False, response.question_id)
+        (skipped if response.skipped else answered).add(key)
+
+    items = []
+    for position, question in enumerate(list(questions) + list(additional_questions), start=start):
+        key = (isinstance(question, AdditionalQuestion), question.id)
+        items.append(QuestionPlanItem(
+            user_interview_id=user_interview_id,
+            position=position,
+            category=question.category,
+            question_id=None if key[0] else question.id,
+            additional_question_id=question.id if key[0] else None,
+            answered=key in answered,
+            skipped=key in skipped
+        ))
+    return items
+
+
+def plan_question(row) -> Optional[Question | AdditionalQuestion]:
+    if row is None:
+        return None
+    return row.Question if row.Question is not None else row.AdditionalQuestion
+
+
+def build_question_plan(db: Session, user_interview_id: int):
+    """Creates the plan of a user interview from its questions and responses, used on creation and for older interviews."""
+    interview_id = db.execute(select(UserInterview.interview_id).filter(UserInterview.id == user_interview_id)).scalar_one()
+    questions = db.execute(select(Question).filter(Question.interview_id == interview_id).order_by(Question.order)).scalars().all()
+    additional_questions = db.execute(select(AdditionalQuestion).filter(AdditionalQuestion.user_interview_id == user_interview_id).order_by(AdditionalQuestion.order)).scalars().all()
+    responses = db.execute(select(Response).filter(Response.user_interview_id == user_interview_id)).scalars().all()
+
+    items = plan_items(user_interview_id, questions, additional_questions, responses)
+    db.add_all(items)
+    logging.info(f"build_question_plan - {len(items)} items for user interview {user_interview_id}")
+    return items
+
+
+async def build_question_plan_async(db: AsyncSession, user_interview_id: int):
+    await db.run_sync(lambda session: build_question_plan(session, user_interview_id))
+    await db.commit()
+
+
+async def ensure_question_plan_async(db: AsyncSession, user_interview_id: int) -> int:
+    """Returns the size of the plan, building it first for interviews that were started without one."""
+    size = (await db.execute(select_plan_size(user_interview_id))).scalar_one()
+    if size == 0:
+        await db.execute(lock_plan(user_interview_id))
+        # a concurrent request may have built it while this one waited for the lock
+        size = (await db.execute(select_plan_size(user_interview_id))).scalar_one()
+        if size == 0:
+            try:
+                await build_question_plan_async(db, user_interview_id)
+            except IntegrityError:
+                # built by a concurrent request on a database without row locks
+                await db.rollback()
+        else:
+            # releases the lock
+            await db.commit()
+        size = (await db.execute(select_plan_size(user_interview_id))).scalar_one()
+    return size
+
+
+def append_to_plan(db: Session, user_interview_id: int, additional_questions: List[AdditionalQuestion]):
+    """
+    Appends follow-ups to an existing plan, interviews without a plan get them when it is built. The plan stays locked
+    until the caller commits, so concurrent analyses of one interview append one after the other.
+    """
+    db.execute(lock_plan(user_interview_id))
+    for attempt in range(APPEND_RETRIES):
+        last = db.execute(select(func.max(QuestionPlanItem.position)).filter(QuestionPlanItem.user_interview_id == user_interview_id)).scalar_one()
+        if last is None:
+            return []
+
+        items = plan_items(user_interview_id, [], additional_questions, [], start=last + 1)
+        try:
+            with db.begin_nested():
+                db.add_all(items)
+            return items
+        except IntegrityError:
+            if attempt == APPEND_RETRIES - 1:
+                raise
+            logging.warning(f"append_to_plan - positions after {last} of user interview {user_interview_id} were taken, retrying")
@@ -2,6 +2,8 @@ from contextlib import asynccontextmanager
 import os
 from fastapi import FastAPI
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 from ...helper.logger import getLogger
 from dotenv import load_dotenv
@@ -20,6 +22,19 @@ def get_database_url():
     return database_url
 
 
+def get_async_database_url():
+    url = make_url(get_database_url())
+    if db_type == 'postgresql':
+        url = url.set(drivername="postgresql+asyncpg")
+        # asyncpg does not understand the libpq only options
+        if "sslmode" in url.query:
+            url = url.update_query_dict({"ssl": url.query["sslmode"]})
+        url = url.difference_update_query(["sslmode", "gssencmode"])
+    else:
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url
+
+
 try:
     if db_type == 'postgresql':
         engine = create_engine(get_database_url())
@@ -29,13 +44,35 @@ except SQLAlchemyError as e:
     logging.error(f"Failed to create engine: {e}")
     raise SystemExit("Failed to create database engine")
 
+try:
+    async_engine = create_async_engine(get_async_database_url())
+except SQLAlchemyError as e:
+    logging.error(f"Failed to create async engine: {e}")
+    raise SystemExit("Failed to create async database engine")
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# objects stay usable after commit, async sessions can't lazy load expired attributes
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False, bind=async_engine)
 
 Base = declarative_base()
 
 
+def run_migrations(revision: str = "head"):
+    """Brings the schema up to date, databases created before migrations existed are picked up by the baseline."""
+    from alembic import command
+    from alembic.config import Config
+
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+    config = Config(os.path.join(root, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(root, "migrations"))
+    # keep the logging setup of the application
+    config.attributes["configure_logger"] = False
+    command.upgrade(config, revision)
+
+
 @asynccontextmanager
 async def create_tables(app: FastAPI):
-    # This will create the tables on application startup
-    Base.metadata.create_all(bind=engine)
+    # This will migrate the tables on application startup
+    run_migrations()
     yield
+    await async_engine.dispose()
@@ -0,0 +1,106 @@
+import os
+from typing import List
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from src.agent import AgentSingleton
+from src.datamodel.interview import Cost, HistorySummary
+from src.datamodel.manager.db_helper import AnsweredQuestion, generate_history
+from src.helper.logger import getLogger
+from src.helper.tokens import count_tokens, truncate_tokens
+
+logging = getLogger()
+agent = AgentSingleton()
+
+# "full" sends every answered turn to the analysis, "rolling" keeps the last turns verbatim
+# and folds everything older into a running summary stored per user interview
+HISTORY_MODE = os.getenv("BB_HISTORY_MODE", "full")
+HISTORY_VERBATIM_TURNS = int(os.getenv("BB_HISTORY_VERBATIM_TURNS", 6))
+HISTORY_TOKEN_BUDGET = int(os.getenv("BB_HISTORY_TOKEN_BUDGET", 2000))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("BB_HISTORY_SUMMARY_TOKENS", 500))
+
+summary_prefix = "Zusammenfassung des bisherigen Gesprächs:"
+
+
+async def build_history(answered_questions: List[AnsweredQuestion], user_interview_id: int, business_segment: str, db: Session) -> List[str]:
+    turns = generate_history(answered_questions)
+    if HISTORY_MODE != "rolling":
+        return turns
+    return await rolling_history(turns, [answer.response_id for answer in answered_questions], user_interview_id, business_segment, db)
+
+
+def get_history_summary(db: Session, user_interview_id: int) -> HistorySummary:
+    stored = db.query(HistorySummary).filter_by(user_interview_id=user_interview_id).one_or_none()
+    if stored is None:
+        # committed right away, a concurrent analysis inserting the same row would wait for the summary otherwise
+        db.add(HistorySummary(user_interview_id=user_interview_id, summary="", tokens=0))
+        try:
+            db.commit()
+        except IntegrityError:
+            # created by a concurrent analysis
+            db.rollback()
+        stored = db.query(HistorySummary).filter_by(user_interview_id=user_interview_id).one()
+    return stored
+
+
+def summarized_count(response_ids: List[int], stored: HistorySummary) -> int:
+    """Number of leading turns that are part of the summary, the turns are ordered by their response."""
+    if stored.summarized_response_id is None:
+        return 0
+    return sum(1 for response_id in response_ids if response_id <= stored.summarized_response_id)
+
+
+async def rolling_history(turns: List[str], response_ids: List[int], user_interview_id: int, business_segment: str, db: Session) -> List[str]:
+    """
+    Returns the summary of all older turns followed by the most recent turns verbatim, within the token budget.
+
+    The summary is only extended by the turns that dropped out of the verbatim window since the last call,
+    so every answer costs one small summary update instead of re-sending the whole interview. It remembers the
+    response of the last turn it covers, a turn missing from `turns` does not shift what counts as summarized.
+    """
+    stored = get_history_summary(db, user_interview_id)
+    summarized = summarized_count(response_ids, stored)
+
+    # turns that are not part of the summary yet and their token sizes
+    split = max(len(turns) - HISTORY_VERBATIM_TURNS, summarized)
+    verbatim_budget = max(HISTORY_TOKEN_BUDGET - HISTORY_SUMMARY_TOKENS, 0)
+    sizes = [count_tokens(turn) for turn in turns]
+    while split < len(turns) - 1 and sum(sizes[split:]) > verbatim_budget:
+        split += 1
+
+    if split > summarized:
+        new_turns = turns[summarized:split]
+        logging.info(f"rolling_history - folding {len(new_turns)} turns into summary of {user_interview_id}")
+        summary = await agent.summarise_history(business_segment=business_segment,
+                                                summary=stored.summary,
+                                                turns=new_turns,
+                                                max_tokens=HISTORY_SUMMARY_TOKENS)
+        content = summary.content.strip()
+        previous = HistorySummary.summarized_response_id
+        # only extends the summary it was built on, a concurrent analysis may have folded the same turns
+        updated = db.execute(update(HistorySummary)
+                             .where(HistorySummary.id == stored.id,
+                                    previous.is_(None) if stored.summarized_response_id is None else previous == stored.summarized_response_id)
+                             .values(summary=content, summarized_response_id=response_ids[split - 1], tokens=count_tokens(content))
+                             .execution_options(synchronize_session=False)).rowcount
+
+        db.add(Cost(
+            tokens=summary.tokens,
+            model="zy_history_summary",
+            user_interview_id=user_interview_id
+        ))
+        db.commit()
+        db.refresh(stored)
+        if not updated:
+            logging.info(f"rolling_history - summary of {user_interview_id} was extended concurrently, keeping that one")
+        split = summarized_count(response_ids, stored)
+    else:
+        db.commit()
+
+    history = [truncate_tokens(turn, verbatim_budget) for turn in turns[split:]]
+    if stored.summary:
+        history.insert(0, f"{summary_prefix}\n{stored.summary}")
+
+    logging.debug(f"rolling_history - {stored.tokens} summary tokens, {len(history)} entries for {user_interview_id}")
+    return history
@@ -0,0 +1,135 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from redis.exceptions import RedisError
+
+from .logger import getLogger
+
+logging = getLogger()
+
+LLM_CACHE_ENABLED = os.getenv("BB_LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_LRU_SIZE = int(os.getenv("BB_LLM_CACHE_LRU_SIZE", 256))
+LLM_CACHE_TTL = int(os.getenv("BB_LLM_CACHE_TTL", 60 * 60 * 24 * 7))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("BB_LLM_CACHE_MAX_ENTRIES", 10000))
+
+KEY_PREFIX = "llm_cache:"
+INDEX_KEY = "llm_cache_index"
+STATS_KEY = "llm_cache_stats"
+
+
+def cache_key(kind: str, model: str, settings: Dict[str, Any], payload: Any) -> str:
+    """Content address of a provider call: identical requests map to the same key."""
+    raw = json.dumps({"kind": kind, "model": model, "settings": settings, "payload": payload},
+                     sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCacheSingleton:
+    """
+    Two tier response cache for LLM calls: an in-process LRU in front of Redis.
+
+    Values are JSON strings. Redis entries expire after `BB_LLM_CACHE_TTL` seconds and the
+    least recently used entries are evicted once more than `BB_LLM_CACHE_MAX_ENTRIES` are stored.
+    The methods block on Redis, async callers run them in a thread.
+    """
+    _instance = None
+    _lru: OrderedDict = None
+    _lock: threading.Lock = None
+    _redis = None
+    _stats: Dict[str, int] = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(LLMCacheSingleton, cls).__new__(cls, *args, **kwargs)
+            cls._instance._lru = OrderedDict()
+            cls._instance._lock = threading.Lock()
+            cls._instance._stats = {"lru_hits": 0, "redis_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+        return cls._instance
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            # imported lazily, the cli uses the agent without a server environment
+            from src.server.utils import get_redis
+            self._redis = get_redis()
+        return self._redis
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._lru.get(key)
+            if value is not None:
+                self._lru.move_to_end(key)
+        if value is not None:
+            self._count("lru_hits")
+            return value
+
+        try:
+            value = self.redis.get(KEY_PREFIX + key)
+        except RedisError as e:
+            logging.warning(f"llm_cache - redis get failed: {e}")
+        if value is None:
+            self._count("misses")
+            return None
+
+        value = value.decode("utf-8")
+        self._remember(key, value)
+        self._stats["redis_hits"] += 1
+        try:
+            # refresh the entry for the eviction and count the hit in one round trip
+            pipe = self.redis.pipeline()
+            pipe.zadd(INDEX_KEY, {key: time.time()})
+            pipe.hincrby(STATS_KEY, "redis_hits", 1)
+            pipe.execute()
+        except RedisError:
+            pass
+        return value
+
+    def set(self, key: str, value: str):
+        self._remember(key, value)
+        self._count("stores")
+        try:
+            now = time.time()
+            pipe = self.redis.pipeline()
+            pipe.setex(KEY_PREFIX + key, LLM_CACHE_TTL, value)
+            pipe.zadd(INDEX_KEY, {key: now})
+            pipe.zremrangebyscore(INDEX_KEY, 0, now - LLM_CACHE_TTL)
+            pipe.zcard(INDEX_KEY)
+            size = pipe.execute()[-1]
+
+            overflow = size - LLM_CACHE_MAX_ENTRIES
+            if overflow > 0:
+                evicted = [k.decode("utf-8") for k, _ in self.redis.zpopmin(INDEX_KEY, overflow)]
+                self.redis.delete(*[KEY_PREFIX + k for k in evicted])
+                logging.debug(f"llm_cache - evicted {len(evicted)} entries")
+        except RedisError as e:
+            logging.warning(f"llm_cache - redis set failed: {e}")
+
+    def bypass(self):
+        self._count("bypassed")
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        shared = {}
+        try:
+            shared = {k.decode("utf-8"): int(v) for k, v in self.redis.hgetall(STATS_KEY).items()}
+        except RedisError as e:
+            logging.warning(f"llm_cache - redis stats failed: {e}")
+        return {"process": dict(self._stats), "shared": shared}
+
+    def _remember(self, key: str, value: str):
+        with self._lock:
+            self._lru[key] = value
+            self._lru.move_to_end(key)
+            while len(self._lru) > LLM_CACHE_LRU_SIZE:
+                self._lru.popitem(last=False)
+
+    def _count(self, name: str):
+        self._stats[name] += 1
+        try:
+            self.redis.hincrby(STATS_KEY, name, 1)
+        except RedisError:
+            pass
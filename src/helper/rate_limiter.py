@@ -0,0 +1,358 @@
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from typing import Dict, Optional
+
+from redis.exceptions import RedisError
+
+from .logger import getLogger
+
+logging = getLogger()
+
+# limits per bucket, a bucket is "<provider>:<model>" and is matched by its full name, then by its provider.
+# e.g. BB_RATE_LIMITS='{"openai:gpt-4o": {"rpm": 500, "tpm": 30000, "concurrency": 8}, "dify": {"concurrency": 4}}'
+# 0 means unlimited
+DEFAULT_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 30000, "concurrency": 8},
+    "dify": {"rpm": 0, "tpm": 0, "concurrency": 4},
+}
+RATE_LIMITS = {**DEFAULT_LIMITS, **json.loads(os.getenv("BB_RATE_LIMITS", "{}"))}
+RATE_LIMIT_ENABLED = os.getenv("BB_RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# slots of every bucket that batch work may not take, so an interview never waits behind wiki generation
+INTERACTIVE_RESERVE = int(os.getenv("BB_RATE_LIMIT_INTERACTIVE_RESERVE", 1))
+MAX_WAIT = float(os.getenv("BB_RATE_LIMIT_MAX_WAIT", 300))
+LEASE_TTL = int(os.getenv("BB_RATE_LIMIT_LEASE_TTL", 600))
+BACKOFF_BASE = float(os.getenv("BB_RATE_LIMIT_BACKOFF_BASE", 1))
+BACKOFF_MAX = float(os.getenv("BB_RATE_LIMIT_BACKOFF_MAX", 60))
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+LANES = (INTERACTIVE, BATCH)
+
+KEY_PREFIX = "llm_limit:"
+STATS_KEY = "llm_limit_stats"
+WAITS_KEY = "llm_limit_waits:"
+WAIT_SAMPLES = 1000
+
+# KEYS: inflight, requests this minute, requests last minute, tokens this minute, tokens last minute, backoff until, interactive waiters
+# ARGV: now, lease, lease ttl, concurrency, rpm, tpm, tokens, elapsed share of the minute, lane, interactive reserve
+# returns {1, 0} when the lease was taken, otherwise {0, seconds to wait}
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+redis.call('ZREMRANGEBYSCORE', KEYS[7], '-inf', now)
+
+local backoff = tonumber(redis.call('GET', KEYS[6]) or '0')
+if backoff > now then
+    return {0, tostring(backoff - now)}
+end
+
+local concurrency = tonumber(ARGV[4])
+if ARGV[9] == 'batch' then
+    if redis.call('ZCARD', KEYS[7]) > 0 then
+        return {0, '0.2'}
+    end
+    if concurrency > 0 then
+        concurrency = math.max(concurrency - tonumber(ARGV[10]), 1)
+    end
+end
+if concurrency > 0 and redis.call('ZCARD', KEYS[1]) >= concurrency then
+    return {0, '0.1'}
+end
+
+-- sliding window estimate from the current and the previous minute
+local share = tonumber(ARGV[8])
+local function used(current, previous)
+    return tonumber(redis.call('GET', current) or '0') + tonumber(redis.call('GET', previous) or '0') * (1 - share)
+end
+local function wait(current, previous, limit, amount)
+    local previous_count = tonumber(redis.call('GET', previous) or '0')
+    local over = used(current, previous) + amount - limit
+    if previous_count > 0 then
+        return math.min(over / previous_count * 60, (1 - share) * 60) + 0.05
+    end
+    return (1 - share) * 60 + 0.05
+end
+
+local rpm = tonumber(ARGV[5])
+if rpm > 0 and used(KEYS[2], KEYS[3]) + 1 > rpm then
+    return {0, tostring(wait(KEYS[2], KEYS[3], rpm, 1))}
+end
+local tpm = tonumber(ARGV[6])
+local tokens = tonumber(ARGV[7])
+-- a single request bigger than the budget is let through once the window is empty
+if tpm > 0 and used(KEYS[4], KEYS[5]) > 0 and used(KEYS[4], KEYS[5]) + tokens > tpm then
+    return {0, tostring(wait(KEYS[4], KEYS[5], tpm, tokens))}
+end
+
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[2])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], 120)
+redis.call('INCRBY', KEYS[4], tokens)
+redis.call('EXPIRE', KEYS[4], 120)
+return {1, '0'}
+"""
+
+DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds of an OpenAI reset header like "1s", "6m0s" or "20ms", or of a plain number."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def bucket_limits(bucket: str) -> Dict[str, int]:
+    limits = RATE_LIMITS.get(bucket) or RATE_LIMITS.get(bucket.split(":")[0]) or {}
+    return {"rpm": int(limits.get("rpm", 0)), "tpm": int(limits.get("tpm", 0)), "concurrency": int(limits.get("concurrency", 0))}
+
+
+class RateLimitedError(Exception):
+    """The provider could not be called within `BB_RATE_LIMIT_MAX_WAIT` seconds."""
+
+
+class RateLimiterSingleton:
+    """
+    Shared limiter for provider calls: requests/min, tokens/min and requests in flight per bucket,
+    kept in Redis so the API and all workers draw from the same budget.
+
+    Interactive calls (follow-up analysis, transcription) go first, batch calls (wikis, summaries) only
+    start while no interactive call waits and never take the last `BB_RATE_LIMIT_INTERACTIVE_RESERVE` slots.
+    Rate limit responses of the provider pause the whole bucket until the reset it reports.
+    When Redis is down calls are not limited.
+    """
+    _instance = None
+    _redis = None
+    _script = None
+    _waits: Dict[str, deque] = None
+    _stats: Dict[str, int] = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(RateLimiterSingleton, cls).__new__(cls, *args, **kwargs)
+            cls._instance._waits = defaultdict(lambda: deque(maxlen=WAIT_SAMPLES))
+            cls._instance._stats = defaultdict(int)
+        return cls._instance
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            # imported lazily, the cli uses the agent without a server environment
+            from src.server.utils import get_redis
+            self._redis = get_redis()
+        return self._redis
+
+    @property
+    def script(self):
+        if self._script is None:
+            self._script = self.redis.register_script(ACQUIRE_SCRIPT)
+        return self._script
+
+    def _keys(self, bucket: str, now: float):
+        minute = int(now // 60)
+        prefix = f"{KEY_PREFIX}{bucket}:"
+        return [prefix + "inflight", f"{prefix}requests:{minute}", f"{prefix}requests:{minute - 1}",
+                f"{prefix}tokens:{minute}", f"{prefix}tokens:{minute - 1}", prefix + "backoff", prefix + "waiting"]
+
+    @asynccontextmanager
+    async def limit(self, bucket: str, tokens: int = 0, lane: str = INTERACTIVE):
+        """Waits for a slot of `bucket` and holds it for the duration of the call."""
+        if not RATE_LIMIT_ENABLED:
+            yield
+            return
+
+        lease = uuid.uuid4().hex
+        start = time.monotonic()
+        counters = []
+        acquired = await self._acquire(bucket, tokens, lane, lease, counters)
+        waited = time.monotonic() - start
+        await asyncio.to_thread(self._record_wait, bucket, lane, waited, counters)
+        try:
+            yield
+        finally:
+            if acquired:
+                await asyncio.to_thread(self._release, bucket, lease)
+
+    async def _acquire(self, bucket: str, tokens: int, lane: str, lease: str, counters: list) -> bool:
+        """Redis is called in a thread, the event loop keeps serving other requests meanwhile."""
+        limits = bucket_limits(bucket)
+        deadline = time.monotonic() + MAX_WAIT
+        while True:
+            try:
+                taken, wait = await asyncio.to_thread(self._try_acquire, bucket, tokens, lane, lease, limits)
+                if taken:
+                    return True
+            except RedisError as e:
+                logging.warning(f"rate_limiter - redis failed, not limiting {bucket}: {e}")
+                return False
+
+            if not counters:
+                counters.append(f"{bucket}:{lane}:throttled")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                counters.append(f"{bucket}:{lane}:gave_up")
+                try:
+                    await asyncio.to_thread(self._give_up, bucket, lease, counters)
+                except RedisError as e:
+                    logging.warning(f"rate_limiter - redis failed, not limiting {bucket}: {e}")
+                    # counted by the failed give up already
+                    counters.clear()
+                    return False
+                raise RateLimitedError(f"no capacity for {bucket} within {MAX_WAIT}s")
+            await asyncio.sleep(min(float(wait), remaining, 1.0))
+
+    def _try_acquire(self, bucket: str, tokens: int, lane: str, lease: str, limits: Dict[str, int]):
+        now = time.time()
+        keys = self._keys(bucket, now)
+        if lane == INTERACTIVE:
+            # announce the waiting call so batch calls step back
+            self.redis.zadd(keys[6], {lease: now + 5})
+        taken, wait = self.script(keys=keys, args=[now, lease, LEASE_TTL, limits["concurrency"], limits["rpm"], limits["tpm"],
+                                                   tokens, (now % 60) / 60, lane, INTERACTIVE_RESERVE])
+        if taken and lane == INTERACTIVE:
+            self.redis.zrem(keys[6], lease)
+        return taken, wait
+
+    def _give_up(self, bucket: str, lease: str, counters: list):
+        pipe = self.redis.pipeline()
+        pipe.zrem(self._keys(bucket, time.time())[6], lease)
+        self._count(pipe, counters)
+        pipe.execute()
+
+    def _release(self, bucket: str, lease: str):
+        try:
+            self.redis.zrem(self._keys(bucket, time.time())[0], lease)
+        except RedisError as e:
+            logging.warning(f"rate_limiter - release failed for {bucket}: {e}")
+
+    async def record_tokens(self, bucket: str, estimated: int, actual: int):
+        """Corrects the token budget of the current minute by the difference between estimate and usage."""
+        if not RATE_LIMIT_ENABLED or actual is None or actual == estimated:
+            return
+        await asyncio.to_thread(self._record_tokens, bucket, actual - estimated)
+
+    def _record_tokens(self, bucket: str, difference: int):
+        try:
+            key = self._keys(bucket, time.time())[3]
+            pipe = self.redis.pipeline()
+            pipe.incrby(key, difference)
+            pipe.expire(key, 120)
+            pipe.execute()
+        except RedisError as e:
+            logging.warning(f"rate_limiter - token correction failed for {bucket}: {e}")
+
+    async def observe(self, bucket: str, status: int, headers) -> float:
+        """
+        Adapts to the rate limit headers of a response. Returns the seconds the bucket is paused,
+        0 if the provider still has capacity.
+        """
+        if not RATE_LIMIT_ENABLED or headers is None:
+            return 0
+        return await asyncio.to_thread(self._observe, bucket, status, {k.lower(): v for k, v in headers.items()})
+
+    def _observe(self, bucket: str, status: int, headers: Dict[str, str]) -> float:
+        pause = 0
+        if status == 429:
+            penalty = self._incr_penalty(bucket)
+            retry_after_ms = parse_duration(headers.get("retry-after-ms"))
+            pause = (retry_after_ms / 1000 if retry_after_ms else parse_duration(headers.get("retry-after"))) \
+                or min(BACKOFF_BASE * 2 ** penalty, BACKOFF_MAX)
+            try:
+                self._count(self.redis, [f"{bucket}:rate_limited"])
+            except RedisError:
+                pass
+        else:
+            # the provider told us the budget is used up, wait for the reset instead of provoking a 429
+            for kind in ("requests", "tokens"):
+                if headers.get(f"x-ratelimit-remaining-{kind}") == "0":
+                    pause = max(pause, parse_duration(headers.get(f"x-ratelimit-reset-{kind}")) or 0)
+            if status < 400:
+                self._reset_penalty(bucket)
+
+        if pause > 0:
+            pause = min(pause, BACKOFF_MAX)
+            logging.warning(f"rate_limiter - pausing {bucket} for {pause:.1f}s after status {status}")
+            try:
+                # never shorten a pause another call already set
+                key, until = self._keys(bucket, time.time())[5], time.time() + pause
+                if until > float(self.redis.get(key) or 0):
+                    self.redis.set(key, until, ex=int(pause) + 1)
+            except RedisError as e:
+                logging.warning(f"rate_limiter - backoff failed for {bucket}: {e}")
+        return pause
+
+    def _incr_penalty(self, bucket: str) -> int:
+        try:
+            key = f"{KEY_PREFIX}{bucket}:penalty"
+            pipe = self.redis.pipeline()
+            pipe.incr(key)
+            pipe.expire(key, int(BACKOFF_MAX * 10))
+            penalty, _ = pipe.execute()
+            return penalty - 1
+        except RedisError:
+            return 0
+
+    def _reset_penalty(self, bucket: str):
+        try:
+            self.redis.delete(f"{KEY_PREFIX}{bucket}:penalty")
+        except RedisError:
+            pass
+
+    def _record_wait(self, bucket: str, lane: str, waited: float, counters: list):
+        """Stores the wait and the counters of an acquire in one round trip."""
+        ms = round(waited * 1000, 1)
+        self._waits[f"{bucket}:{lane}"].append(ms)
+        try:
+            pipe = self.redis.pipeline()
+            self._count(pipe, [*counters, f"{bucket}:{lane}:acquired"])
+            pipe.hincrbyfloat(STATS_KEY, f"{bucket}:{lane}:wait_ms", ms)
+            pipe.lpush(f"{WAITS_KEY}{bucket}:{lane}", ms)
+            pipe.ltrim(f"{WAITS_KEY}{bucket}:{lane}", 0, WAIT_SAMPLES - 1)
+            pipe.execute()
+        except RedisError:
+            pass
+
+    def _count(self, client, names: list):
+        """Counts `names` in this process and on `client`, a pipeline or the connection."""
+        for name in names:
+            self._stats[name] += 1
+            client.hincrby(STATS_KEY, name, 1)
+
+    def get_stats(self) -> Dict:
+        """Counters and queue wait percentiles per bucket and lane, of this process and of all processes."""
+        def summary(samples):
+            ordered = sorted(samples)
+            if not ordered:
+                return {"count": 0}
+            pick = lambda p: ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]  # noqa: E731
+            return {"count": len(ordered), "p50_ms": pick(50), "p95_ms": pick(95), "p99_ms": pick(99), "max_ms": ordered[-1]}
+
+        shared, shared_waits = {}, {}
+        try:
+            shared = {k.decode("utf-8"): float(v) for k, v in self.redis.hgetall(STATS_KEY).items()}
+            for key in self.redis.scan_iter(f"{WAITS_KEY}*"):
+                name = key.decode("utf-8")[len(WAITS_KEY):]
+                shared_waits[name] = summary(float(v) for v in self.redis.lrange(key, 0, -1))
+        except RedisError as e:
+            logging.warning(f"rate_limiter - redis stats failed: {e}")
+
+        return {
+            "limits": RATE_LIMITS,
+            "process": {"counters": dict(self._stats), "waits": {name: summary(samples) for name, samples in self._waits.items()}},
+            "shared": {"counters": shared, "waits": shared_waits},
+        }
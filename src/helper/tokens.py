@@ -0,0 +1,35 @@
+from functools import lru_cache
+
+from .logger import getLogger
+
+logging = getLogger()
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    try:
+        return len(_get_encoding(model).encode(text))
+    except Exception as e:
+        # tiktoken downloads its vocabularies on first use, fall back to ~4 chars per token
+        logging.warning(f"count_tokens - falling back to estimate: {e}")
+        return len(text) // 4 + 1
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    try:
+        encoding = _get_encoding(model)
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens])
+    except Exception as e:
+        logging.warning(f"truncate_tokens - falling back to estimate: {e}")
+        return text[:max_tokens * 4]
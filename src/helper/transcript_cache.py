@@ -0,0 +1,142 @@
+from dataclasses import asdict, dataclass
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from src.datamodel.interview import TranscriptCache
+from src.datamodel.manager.sqldb_manager import SessionLocal
+
+from .logger import getLogger
+
+logging = getLogger()
+
+TRANSCRIPT_CACHE_ENABLED = os.getenv("BB_TRANSCRIPT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+TRANSCRIPT_CACHE_TTL = int(os.getenv("BB_TRANSCRIPT_CACHE_TTL", 60 * 60 * 24 * 7))
+
+KEY_PREFIX = "transcript_cache:"
+STATS_KEY = "transcript_cache_stats"
+
+
+def audio_hash(path: str) -> str:
+    """sha256 of the recording's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as audio_file:
+        for block in iter(lambda: audio_file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class CachedTranscript:
+    transcript: str
+    # whisper requests and milliseconds the transcript took, saved by every hit
+    stt_calls: int
+    stt_ms: int
+
+
+class TranscriptCacheSingleton:
+    """
+    Transcripts by content hash of the recording, whisper model and language. `get` and `set` block on Redis
+    and the database, run them in a thread from async code.
+
+    Redis holds the recent entries for `BB_TRANSCRIPT_CACHE_TTL` seconds, the `transcript_cache`
+    table keeps all of them, entries found there are written back to Redis.
+    """
+    _instance = None
+    _redis = None
+    _stats: Dict[str, int] = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(TranscriptCacheSingleton, cls).__new__(cls, *args, **kwargs)
+            cls._instance._stats = {"redis_hits": 0, "db_hits": 0, "misses": 0, "stores": 0,
+                                    "whisper_calls_saved": 0, "stt_ms_saved": 0}
+        return cls._instance
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            from src.server.utils import get_redis
+            self._redis = get_redis()
+        return self._redis
+
+    def get(self, audio_hash: str, model: str, language: str) -> Optional[CachedTranscript]:
+        key = self._key(audio_hash, model, language)
+        try:
+            value = self.redis.get(key)
+            if value is not None:
+                cached = CachedTranscript(**json.loads(value))
+                self._hit("redis_hits", cached)
+                return cached
+        except RedisError as e:
+            logging.warning(f"transcript_cache - redis get failed: {e}")
+
+        db = SessionLocal()
+        try:
+            stored = db.query(TranscriptCache).filter_by(audio_hash=audio_hash, model=model, language=language).one_or_none()
+        except SQLAlchemyError as e:
+            logging.warning(f"transcript_cache - db get failed: {e}")
+            stored = None
+        finally:
+            db.close()
+
+        if stored is None:
+            self._count("misses")
+            return None
+
+        # a silent recording was cached with no whisper call
+        cached = CachedTranscript(transcript=stored.transcript, stt_calls=stored.stt_calls if stored.stt_calls is not None else 1,
+                                  stt_ms=stored.stt_ms or 0)
+        self._store_redis(key, cached)
+        self._hit("db_hits", cached)
+        return cached
+
+    def set(self, audio_hash: str, model: str, language: str, cached: CachedTranscript):
+        self._count("stores")
+        self._store_redis(self._key(audio_hash, model, language), cached)
+
+        db = SessionLocal()
+        try:
+            db.add(TranscriptCache(audio_hash=audio_hash, model=model, language=language, **asdict(cached)))
+            db.commit()
+        except IntegrityError:
+            # another worker transcribed the same recording at the same time
+            db.rollback()
+        except SQLAlchemyError as e:
+            logging.warning(f"transcript_cache - db set failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        shared = {}
+        try:
+            shared = {k.decode("utf-8"): int(v) for k, v in self.redis.hgetall(STATS_KEY).items()}
+        except RedisError as e:
+            logging.warning(f"transcript_cache - redis stats failed: {e}")
+        return {"process": dict(self._stats), "shared": shared}
+
+    def _key(self, audio_hash: str, model: str, language: str) -> str:
+        return f"{KEY_PREFIX}{model}:{language}:{audio_hash}"
+
+    def _store_redis(self, key: str, cached: CachedTranscript):
+        try:
+            self.redis.setex(key, TRANSCRIPT_CACHE_TTL, json.dumps(asdict(cached), ensure_ascii=False))
+        except RedisError as e:
+            logging.warning(f"transcript_cache - redis set failed: {e}")
+
+    def _hit(self, tier: str, cached: CachedTranscript):
+        self._count(tier)
+        self._count("whisper_calls_saved", cached.stt_calls)
+        self._count("stt_ms_saved", cached.stt_ms)
+
+    def _count(self, name: str, amount: int = 1):
+        self._stats[name] += amount
+        try:
+            self.redis.hincrby(STATS_KEY, name, amount)
+        except RedisError:
+            pass
@@ -1,12 +1,13 @@
 import json
 from logging import getLogger
 import re
-from typing import List
+from typing import Callable, List
 from sqlalchemy.orm import Session
 
 
 from src.agent import AgentSingleton
-from src.datamodel.interview import AdditionalQuestion, Cost, Interview, Question, RawResponse, Response, UserModel, Wiki
+from src.datamodel.interview import Cost, Interview, RawResponse, UserModel, Wiki
+from src.datamodel.manager.db_helper import history_pairs, select_history
 from src.datamodel.prompt import PromptModel
 from src.helper.file import get_wiki_path
 from src.helper.utils import build_wiki_from_data
@@ -39,18 +40,13 @@ def cleanup_md(wiki: str):
 
 
 def generate_summary(user_interview_id: int, db: Session):
-    responses = db.query(Response).filter_by(user_interview_id=user_interview_id).all()
+    pairs = history_pairs(db.execute(select_history(user_interview_id)).all())
 
-    if not responses:
+    if not pairs:
         return "No responses found for this user interview."
 
     conversation: List[str] = []
-    for answer in responses:
-        if not answer.is_additional:
-            question = db.query(Question).get(answer.question_id)
-        else:
-            question = db.query(AdditionalQuestion).get(answer.additional_question_id)
-
+    for question, answer in pairs:
         conversation.append(f"system: {question.text}")
         conversation.append(f"user: {answer.text}\n{answer.audio_text}")
 
@@ -66,7 +62,9 @@ def generate_summary(user_interview_id: int, db: Session):
     # return summary
 
 
-async def generate_wiki(user: UserModel, interview_id: int, user_interview_id: int, prompt: PromptModel, db: Session):
+async def generate_wiki(user: UserModel, interview_id: int, user_interview_id: int, prompt: PromptModel, db: Session,
+                        on_chunk: Callable[[str], None] | None = None):
+    """Generates and saves the wiki of one prompt, `on_chunk` gets its text while it is streamed."""
     summary = generate_summary(user_interview_id, db)
 
     interview = db.query(Interview).filter_by(id=interview_id).one_or_none()
@@ -80,7 +78,8 @@ async def generate_wiki(user: UserModel, interview_id: int, user_interview_id: i
     wiki = await agent.generate_wiki(business_segment=business_segment,
                                      history=summary,
                                      prompt=prompt,
-                                     generate_conversation=False)
+                                     generate_conversation=False,
+                                     on_chunk=on_chunk)
 
     wiki_filepath = save_wiki(
         wiki=wiki.content,
@@ -118,7 +117,9 @@ async def generate_wiki(user: UserModel, interview_id: int, user_interview_id: i
     return wm
 
 
-async def generate_dify_wiki(user: UserModel, interview_id: int, user_interview_id: int, interview_date: str, dify_id: int, db: Session):
+async def generate_dify_wiki(user: UserModel, interview_id: int, user_interview_id: int, interview_date: str, dify_id: int, db: Session,
+                             on_chunk: Callable[[str], None] | None = None):
+    """Generates and saves the wiki of a Dify prompt, `on_chunk` gets its text while it is streamed."""
     summary = generate_summary(user_interview_id, db)
 
     logging.debug(f"generate_wiki - {summary}")
@@ -136,7 +137,8 @@ async def generate_dify_wiki(user: UserModel, interview_id: int, user_interview_
                                                history=summary,
                                                prompt_id=dify_id,
                                                interview_date=interview_date,
-                                               generate_conversation_string=True)
+                                               generate_conversation_string=True,
+                                               on_chunk=on_chunk)
 
     logging.info(f"generate_wiki - {wiki_data}")
 
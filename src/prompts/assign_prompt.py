@@ -77,3 +77,8 @@ def assign_prompts(dify=True) -> list[PromptModel]:
         save_counter(prompt_usage)
 
     return least_used_prompts
+
+
+def get_prompts(prompt_ids: list[str]) -> list[PromptModel]:
+    """The prompts assigned to a user interview before, a retried wiki generation keeps them."""
+    return [prompt for prompt in prompts if prompt.id in prompt_ids]
@@ -29,6 +29,19 @@ Beispiel für eine JSON-Rückgabe
 ```
 """
 
+# HISTORY
+
+p_history_summary = """Du fasst den bisherigen Verlauf eines Interviews im Berufsfeld {business_segment} fortlaufend zusammen.
+
+Bisherige Zusammenfassung:
+{summary}
+
+Neue Frage-Antwort-Paare:
+{turns}
+
+Aktualisiere die Zusammenfassung so, dass sie alle bisher genannten Fakten, Themen, Beispiele und Einschätzungen der befragten Person enthält. Wiederhole keine Formulierungen der Fragen, sondern halte nur die Inhalte der Antworten fest. Die Zusammenfassung darf höchstens {max_words} Wörter lang sein. Antworte ausschließlich mit der aktualisierten Zusammenfassung.
+"""
+
 # WIKI
 
 p_wiki = """
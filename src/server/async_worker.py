@@ -0,0 +1,252 @@
+"""
+Worker that runs the jobs of the RQ queues as tasks of one long-lived event loop.
+
+`rq worker` forks a work horse for every job, which imports the tasks again, builds new `AgentSingleton`
+HTTP clients and waits on one provider call at a time. This worker imports the tasks once, keeps the clients
+and their connections warm across jobs and runs up to `BB_ASYNC_WORKER_CONCURRENCY` jobs at once, at most
+`BB_ASYNC_WORKER_JOB_LIMIT` of the same function unless `BB_ASYNC_WORKER_LIMITS` sets another limit for it.
+Jobs with a `user_interview_id` argument run one after the other per user interview, in the order they were
+dequeued, like they do in a single `rq worker`. That only holds within one worker, so it replaces `rq worker`
+on its queues instead of running next to it. Jobs keep their RQ bookkeeping (registries, results, retries,
+webhooks, failed jobs, `rq info`).
+
+    python -m src.server.async_worker [--with-scheduler] [queue ...]
+
+SIGTERM or SIGINT stops taking jobs and waits for the running ones, a second signal cancels them.
+Blocking code in a job (sync database sessions, file io) holds up every other job of the loop while it runs.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import signal
+import sys
+import traceback
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Set
+
+from redis.exceptions import ConnectionError as RedisConnectionError, RedisError
+from rq import Queue, SimpleWorker
+from rq.exceptions import DequeueTimeout
+from rq.executions import Execution
+from rq.job import Job, JobStatus, Retry
+from rq.timeouts import JobTimeoutException
+from rq.utils import now
+from rq.worker import WorkerStatus
+
+from src.helper.logger import getLogger
+from src.server.utils import get_redis
+
+logging = getLogger()
+
+ASYNC_WORKER_CONCURRENCY = int(os.getenv("BB_ASYNC_WORKER_CONCURRENCY", 32))
+ASYNC_WORKER_JOB_LIMIT = int(os.getenv("BB_ASYNC_WORKER_JOB_LIMIT", 8))
+# in-flight jobs per function name, e.g. BB_ASYNC_WORKER_LIMITS='{"generate_wikis": 2, "background_analyse": 16}'
+DEFAULT_JOB_LIMITS = {"generate_wikis": 2}
+ASYNC_WORKER_LIMITS = {**DEFAULT_JOB_LIMITS, **json.loads(os.getenv("BB_ASYNC_WORKER_LIMITS", "{}"))}
+# seconds a dequeue blocks, also how long a stop request may wait for it
+DEQUEUE_TIMEOUT = 1
+
+
+class AsyncWorker(SimpleWorker):
+    """
+    `SimpleWorker` whose jobs run concurrently. Every job has its own RQ execution, which is set as the
+    worker's current one around the synchronous bookkeeping of `BaseWorker`, that never awaits in between.
+    """
+
+    def __init__(self, *args, concurrency: int = ASYNC_WORKER_CONCURRENCY, limits: Dict[str, int] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.concurrency = concurrency
+        self.limits = {**ASYNC_WORKER_LIMITS, **(limits or {})}
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        # locks of the user interviews with jobs running or waiting, and how many jobs use each
+        self._interviews: Dict[int, asyncio.Lock] = {}
+        self._interview_jobs: Dict[int, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopping = False
+
+    def stop(self):
+        if self._stopping:
+            logging.warning(f"async_worker - cancelling {len(self._tasks)} running jobs")
+            for task in self._tasks:
+                task.cancel()
+            return
+        self._stopping = True
+        logging.info(f"async_worker - stopping, waiting for {len(self._tasks)} running jobs")
+
+    async def run(self, with_scheduler: bool = False):
+        self.bootstrap()
+        if with_scheduler:
+            # enqueues scheduled jobs and retries with an interval, in a process of its own like in `rq worker`
+            self._start_scheduler()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stop)
+
+        capacity = asyncio.Semaphore(self.concurrency)
+        try:
+            while not self._stopping:
+                await capacity.acquire()
+                result = await self.dequeue()
+                if result is None:
+                    capacity.release()
+                    continue
+                task = asyncio.create_task(self.run_job(*result, capacity))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            self.teardown()
+
+    async def dequeue(self):
+        """Next (job, queue) of the worker's queues, None if there was none within `DEQUEUE_TIMEOUT`."""
+        try:
+            if self.should_run_maintenance_tasks:
+                await asyncio.to_thread(self.run_maintenance_tasks)
+            self.heartbeat()
+            return await asyncio.to_thread(Queue.dequeue_any, self.queues, DEQUEUE_TIMEOUT, connection=self.connection,
+                                           job_class=self.job_class, serializer=self.serializer)
+        except DequeueTimeout:
+            return None
+        except RedisConnectionError as e:
+            logging.error(f"async_worker - redis unavailable: {e}")
+            await asyncio.sleep(DEQUEUE_TIMEOUT)
+            return None
+
+    @asynccontextmanager
+    async def slot(self, job: Job):
+        """
+        Waits until no other job of the user interview runs, then for a slot of the job's function. Analyses of one
+        user interview change its question plan and history and must see the changes of the previous answer.
+        """
+        name = job.func_name.rsplit(".", 1)[-1]
+        if name not in self._slots:
+            self._slots[name] = asyncio.Semaphore(self.limits.get(name, ASYNC_WORKER_JOB_LIMIT))
+        async with self.interview_slot(job_interview(job)), self._slots[name]:
+            yield
+
+    @asynccontextmanager
+    async def interview_slot(self, user_interview_id: Optional[int]):
+        if user_interview_id is None:
+            yield
+            return
+        lock = self._interviews.setdefault(user_interview_id, asyncio.Lock())
+        self._interview_jobs[user_interview_id] = self._interview_jobs.get(user_interview_id, 0) + 1
+        try:
+            # waiters get the lock in the order they asked for it, which is the order of the queue
+            async with lock:
+                yield
+        finally:
+            self._interview_jobs[user_interview_id] -= 1
+            if not self._interview_jobs[user_interview_id]:
+                del self._interview_jobs[user_interview_id]
+                del self._interviews[user_interview_id]
+
+    async def run_job(self, job: Job, queue: Queue, capacity: asyncio.Semaphore):
+        try:
+            await self.perform_job_async(job, queue)
+        finally:
+            capacity.release()
+            if len(self._tasks) <= 1:
+                self.set_state(WorkerStatus.IDLE)
+
+    async def perform_job_async(self, job: Job, queue: Queue):
+        """
+        `perform_job` of `BaseWorker` for a job that is awaited instead of run in a work horse. The job is
+        registered as started before it waits for a slot of its function, RQ fails jobs that stay dequeued
+        but unregistered for long.
+        """
+        execution = self.prepare_execution(job)
+        self.prepare_job_execution(job, remove_from_intermediate_queue=len(self.queues) == 1)
+        heartbeats = asyncio.create_task(self.maintain_execution(job, execution))
+        timeout = job.timeout or self.queue_class.DEFAULT_TIMEOUT
+        try:
+            try:
+                async with self.slot(job):
+                    job.started_at = now()
+                    return_value = await asyncio.wait_for(self.call(job), None if timeout == -1 else timeout)
+            except asyncio.TimeoutError:
+                raise JobTimeoutException(f"Task exceeded maximum timeout value ({timeout} seconds)")
+        except BaseException as e:
+            heartbeats.cancel()
+            self.execution = execution
+            self.fail_job(job, queue, sys.exc_info())
+            if isinstance(e, (asyncio.CancelledError, KeyboardInterrupt, SystemExit)):
+                raise
+            return
+        heartbeats.cancel()
+
+        self.execution = execution
+        self.handle_execution_ended(job, queue, job.success_callback_timeout)
+        job._result = return_value
+        if isinstance(return_value, Retry):
+            self.handle_job_retry(job=job, queue=queue, retry=return_value, started_job_registry=queue.started_job_registry,
+                                  execution=execution)
+            return
+        job._status = JobStatus.FINISHED
+        try:
+            job.execute_success_callback(self.death_penalty_class, return_value)
+        except Exception:
+            self.fail_job(job, queue, sys.exc_info())
+            return
+        self.handle_job_success(job=job, queue=queue, started_job_registry=queue.started_job_registry)
+        job.send_webhooks(JobStatus.FINISHED)
+        self.log.info(f"Worker {self.name}: {job.origin}: Job OK ({job.id})")
+
+    async def call(self, job: Job):
+        if inspect.iscoroutinefunction(job.func):
+            return await job.func(*job.args, **job.kwargs)
+        # a blocking function would stall every other job of the loop
+        return await asyncio.to_thread(job.func, *job.args, **job.kwargs)
+
+    def fail_job(self, job: Job, queue: Queue, exc_info):
+        job._status = JobStatus.FAILED
+        self.handle_execution_ended(job, queue, job.failure_callback_timeout)
+        exc_string = "".join(traceback.format_exception(*exc_info))
+        try:
+            job.execute_failure_callback(self.death_penalty_class, *exc_info)
+        except Exception:
+            exc_info = sys.exc_info()
+            exc_string = "".join(traceback.format_exception(*exc_info))
+        self.handle_exception(job, *exc_info)
+        self.handle_job_failure(job=job, exc_string=exc_string, queue=queue, started_job_registry=queue.started_job_registry)
+
+    async def maintain_execution(self, job: Job, execution: Execution):
+        """Heartbeats of a running job, without them RQ would consider it abandoned."""
+        while True:
+            await asyncio.sleep(self.job_monitoring_interval)
+            self.execution = execution
+            try:
+                self.maintain_heartbeats(job)
+            except RedisError as e:
+                logging.warning(f"async_worker - heartbeat of job {job.id} failed: {e}")
+
+
+def job_interview(job: Job) -> Optional[int]:
+    """The `user_interview_id` argument of the job, None for jobs without one."""
+    try:
+        arguments = inspect.signature(job.func).bind_partial(*job.args, **job.kwargs).arguments
+    except (TypeError, ValueError):
+        return None
+    return arguments.get("user_interview_id")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queues", nargs="*", default=["default"])
+    parser.add_argument("--concurrency", type=int, default=ASYNC_WORKER_CONCURRENCY, help="jobs in flight")
+    parser.add_argument("--with-scheduler", action="store_true", help="run the RQ scheduler")
+    args = parser.parse_args()
+
+    # imported once for all jobs, a work horse of `rq worker` pays for this on every job
+    import src.server.tasks.task_worker  # noqa: F401
+
+    redis = get_redis()
+    worker = AsyncWorker([Queue(name, connection=redis) for name in args.queues], connection=redis,
+                         concurrency=args.concurrency)
+    asyncio.run(worker.run(with_scheduler=args.with_scheduler))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,11 @@ from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
 from literalai import Optional
-from sqlalchemy.orm import Session as DB
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.datamodel.interview import User
 from src.helper.logger import getLogger
-from src.server.utils import get_db
+from src.server.utils import get_async_db
 
 
 SECRET_KEY = os.getenv('SECRET_KEY', "easysecret")
@@ -18,7 +18,7 @@ SECRET_KEY = os.getenv('SECRET_KEY', "easysecret")
 logging = getLogger()
 
 
-async def get_current_user(request: Request, db: DB = Depends(get_db)) -> User:
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_async_db)) -> User:
     # first check if request has an jwt
     user = await get_current_user_by_jwt(request, db=db)
 
@@ -62,7 +62,7 @@ class OptionalHTTPBearer(HTTPBearer):
 get_credentials = OptionalHTTPBearer()
 
 
-async def get_current_user_by_jwt(request: Request, db: DB = Depends(get_db)) -> Optional[User]:
+async def get_current_user_by_jwt(request: Request, db: AsyncSession = Depends(get_async_db)) -> Optional[User]:
     try:
         credentials: HTTPAuthorizationCredentials = await get_credentials(request=request)
     except Exception as err:
@@ -88,7 +88,7 @@ async def get_current_user_by_jwt(request: Request, db: DB = Depends(get_db)) ->
             logging.error("Token does not contain a subscriber.")
             raise HTTPException(status_code=401, detail="Token does not contain a subscriber.")
 
-        user = db.query(User).get(subscriber)
+        user = await db.get(User, int(subscriber))
         if user is None:
             logging.error("User from token not found.")
             raise HTTPException(status_code=403, detail="User from token not found.")
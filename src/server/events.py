@@ -0,0 +1,124 @@
+import json
+import os
+from typing import Any, Dict
+
+from fastapi import Request
+from redis.exceptions import RedisError
+
+from src.helper.logger import getLogger
+from src.server import wiki_generation
+from src.server.utils import get_async_redis, get_redis
+
+logging = getLogger()
+
+EVENT_HEARTBEAT = float(os.getenv("BB_EVENT_HEARTBEAT", 15))
+
+QUESTION_ADDED = "question_added"
+AUDIO_READY = "audio_ready"
+TRANSCRIPT_READY = "transcript_ready"
+WIKI_READY = "wiki_ready"
+WIKI_CHUNK = "wiki_chunk"
+WIKI_FAILED = "wiki_failed"
+WIKIS_FINISHED = "wikis_finished"
+
+redis = get_redis()
+
+
+def get_channel(user_interview_id: int):
+    return f"user_interview_events:{user_interview_id}"
+
+
+def publish_event(user_interview_id: int, event: str, data: Dict[str, Any] = {}):
+    """Publishes an interview event from any process, a failing publish never fails the caller."""
+    message = json.dumps({"event": event, "user_interview_id": user_interview_id, "data": data}, default=str)
+    try:
+        redis.publish(get_channel(user_interview_id), message)
+        logging.debug(f"publish_event - {event} for {user_interview_id}")
+    except RedisError as e:
+        logging.error(f"Failed to publish {event} for {user_interview_id}: {e}")
+
+
+async def event_stream(user_interview_id: int, request: Request):
+    """Relays the events of one user interview as server-sent events until the client disconnects."""
+    client = get_async_redis()
+    pubsub = client.pubsub()
+    await pubsub.subscribe(get_channel(user_interview_id))
+
+    try:
+        # tells the client the stream is live, events published before this point are not replayed
+        yield "event: connected\ndata: {}\n\n"
+        while not await request.is_disconnected():
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=EVENT_HEARTBEAT)
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+
+            payload = message["data"].decode("utf-8")
+            event = json.loads(payload)["event"]
+            yield f"event: {event}\ndata: {payload}\n\n"
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+        await client.aclose()
+
+
+async def wiki_stream(user_interview_id: int, request: Request):
+    """
+    Relays the wiki generation of one user interview as server-sent events: the text streamed so far,
+    then wiki_chunk, wiki_ready or wiki_failed per prompt and finally wikis_finished. Chunks a client already
+    got with the snapshot are dropped, so the text per prompt is exactly the concatenation of the received chunks.
+    A wiki_failed discards the text streamed for its prompt.
+    """
+    client = get_async_redis()
+    pubsub = client.pubsub()
+    # subscribe before the snapshot is read, nothing published in between gets lost
+    await pubsub.subscribe(get_channel(user_interview_id))
+
+    def sse(event: str, data: Dict[str, Any]):
+        payload = json.dumps({"event": event, "user_interview_id": user_interview_id, "data": data}, default=str)
+        return f"event: {event}\ndata: {payload}\n\n"
+
+    try:
+        yield "event: connected\ndata: {}\n\n"
+        generation = await wiki_generation.get_generation_async(client, user_interview_id)
+        if generation is None or generation["status"] in ["finished", "failed"]:
+            yield sse(WIKIS_FINISHED, {"status": generation["status"] if generation else None})
+            return
+
+        sent: Dict[str, int] = {}
+        for prompt_id, text in (await wiki_generation.get_partials_async(client, user_interview_id)).items():
+            sent[prompt_id] = len(text)
+            yield sse(WIKI_CHUNK, {"prompt_id": prompt_id, "offset": 0, "text": text})
+
+        while not await request.is_disconnected():
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=EVENT_HEARTBEAT)
+            if message is None:
+                # the worker may have died without announcing the end
+                generation = await wiki_generation.get_generation_async(client, user_interview_id)
+                if generation is None or generation["status"] in ["finished", "failed"]:
+                    yield sse(WIKIS_FINISHED, {"status": generation["status"] if generation else None})
+                    return
+                yield ": keepalive\n\n"
+                continue
+
+            event = json.loads(message["data"].decode("utf-8"))
+            data = event["data"]
+            if event["event"] == WIKI_CHUNK:
+                skip = sent.get(data["prompt_id"], 0) - data["offset"]
+                if skip >= len(data["text"]):
+                    continue
+                if skip > 0:
+                    data = {**data, "offset": data["offset"] + skip, "text": data["text"][skip:]}
+                sent[data["prompt_id"]] = data["offset"] + len(data["text"])
+            elif event["event"] == WIKI_FAILED:
+                sent.pop(data["prompt_id"], None)
+            elif event["event"] not in [WIKI_READY, WIKIS_FINISHED]:
+                continue
+
+            yield sse(event["event"], data)
+            if event["event"] == WIKIS_FINISHED:
+                return
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+        await client.aclose()
@@ -1,13 +1,16 @@
 
 
+import os
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
+from src.agent import AgentSingleton
+from src.helper.file import get_audio_path
 from src.helper.logger import getLogger
 from src.datamodel.interview import Interview, InterviewCreate, InterviewModel, Question
 from src.server.auth.user_middleware import OptionalHTTPBearer, get_current_user
-from src.server.tasks.task_worker import create_question_audio
+from src.server.tasks.task_worker import create_questions_audio
 from src.server.utils import get_db
 
 from src.server.queue_setup import q
@@ -16,6 +19,7 @@ from src.server.queue_setup import q
 interview_router = APIRouter()
 
 logging = getLogger()
+agent = AgentSingleton()
 
 
 @interview_router.post("/interviews/",
@@ -27,24 +31,30 @@ def create_interview(interview: InterviewCreate, db: Session = Depends(get_db)):
     new_interview.business_segment = interview.business_segment
     new_interview.title = interview.title
     db.add(new_interview)
-    db.commit()
-    db.refresh(new_interview)
+    db.flush()
 
     counter = 0
+    new_questions = []
     # Create questions and associate them with the interview
     for category, questions in interview.questions.items():
         for question_text in questions:
-            new_question = Question(
+            audio_path = get_audio_path("global", agent.tts_cache_filename(question_text))
+            new_questions.append(Question(
                 text=question_text,
                 category=category,
                 order=counter,
-                interview_id=new_interview.id
-            )
-            db.add(new_question)
-            db.commit()
-            db.refresh(new_question)
+                interview_id=new_interview.id,
+                audio=audio_path if os.path.exists(audio_path) else None
+            ))
             counter += 1
-            q.enqueue(create_question_audio, *(new_question.id, new_interview.id, question_text))
+
+    db.add_all(new_questions)
+    db.flush()
+    missing_audio = [(question.id, question.text) for question in new_questions if question.audio is None]
+    db.commit()
+
+    if missing_audio:
+        q.enqueue(create_questions_audio, *(missing_audio, new_interview.id))
 
     return new_interview
 
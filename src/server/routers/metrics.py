@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends
+
+from src.helper.llm_cache import LLMCacheSingleton
+from src.helper.logger import getLogger
+from src.helper.rate_limiter import RateLimiterSingleton
+from src.helper.transcript_cache import TranscriptCacheSingleton
+from src.server import speculation
+from src.server.auth.user_middleware import OptionalHTTPBearer, get_current_user
+
+
+metrics_router = APIRouter()
+
+logging = getLogger()
+
+
+@metrics_router.get("/metrics/llm",
+                    operation_id="llm_metrics",
+                    dependencies=[Depends(get_current_user), Depends(OptionalHTTPBearer())],)
+def llm_metrics():
+    """Cache hits and rate limiter queue waits of the provider calls, of this process and of all processes."""
+    return {
+        "cache": LLMCacheSingleton().get_stats(),
+        "rate_limits": RateLimiterSingleton().get_stats(),
+        "transcripts": TranscriptCacheSingleton().get_stats(),
+        "speculative_analysis": speculation.get_stats(),
+    }
@@ -1,26 +1,37 @@
 
 
 import asyncio
+import base64
+import binascii
+from datetime import datetime
 import os
-from typing import List
+from typing import List, Literal, Optional
 from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile, status
-from fastapi.responses import JSONResponse
-from sqlalchemy import desc
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.requests import ClientDisconnect
+from sqlalchemy import delete, desc, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, noload, selectinload
 from sqlalchemy.orm.exc import NoResultFound
 
 
 from src.helper.logger import getLogger
-from src.datamodel.audio import AudioModel
+from src.datamodel.audio import AudioModel, SegmentModel, UploadCreate, UploadModel
 from src.datamodel.error import ErrorModel
-from src.datamodel.interview import AdditionalQuestion, AdditionalQuestionModel, Interview, InterviewState, InterviewStateType, Question, QuestionModel, Response, ResponseModel, User, UserInterview, UserInterviewCreate, UserInterviewModel, UserInterviewPosition, UserModel
-from src.datamodel.interview_status import InterviewStatusModel
+from src.datamodel.interview import AdditionalQuestion, AdditionalQuestionModel, AnswerSegment, Interview, InterviewState, InterviewStateType, Question, QuestionModel, Response, ResponseModel, Transcription, TranscriptionModel, TranscriptionStatusType, User, UserInterview, UserInterviewCreate, UserInterviewModel, UserInterviewPage, UserInterviewPosition, UserInterviewSummaryModel, UserModel, Wiki
+from src.datamodel.interview_status import InterviewStatusModel, WikiGenerationStatusModel
+from src.datamodel.manager.db_helper import history_pairs, page_user_interviews, select_history
+from src.datamodel.manager.question_plan import build_question_plan, ensure_question_plan_async, plan_question, select_next_plan_question, select_plan_question_at, update_plan_response
+from src.datamodel.manager.sqldb_manager import SessionLocal
+from src.datamodel.prompt import PromptModel
 from src.helper.file import get_audio_path
-from src.helper.wiki import generate_dify_wiki, generate_wiki
-from src.prompts.assign_prompt import assign_prompts
+from src.prompts.assign_prompt import assign_prompts, get_prompts
 from src.server.auth.user_middleware import OptionalHTTPBearer, get_current_user
-from src.server.tasks.task_worker import background_analyse
-from src.server.utils import get_db
+from src.server.events import event_stream, wiki_stream
+from src.server import uploads, wiki_generation
+from src.server.speculation import SPECULATIVE_ANALYSIS
+from src.server.tasks.task_worker import background_analyse, generate_wikis, transcribe_response, transcribe_segment
+from src.server.utils import get_async_db, get_db
 
 from src.server.queue_setup import q
 
@@ -36,6 +47,12 @@ logging = getLogger()
 
 DIFY_ENABLED = bool(os.getenv("DIFY_ENABLED", False))
 logging.info(f"DIFY_ENABLED: {DIFY_ENABLED}")
+WIKI_JOB_TIMEOUT = int(os.getenv("BB_WIKI_JOB_TIMEOUT", 900))
+
+
+async def get_user_interview_with_state(user_interview_id: int, db: AsyncSession):
+    result = await db.execute(select(UserInterview).options(selectinload(UserInterview.interview_state)).filter(UserInterview.id == user_interview_id))
+    return result.scalar_one_or_none()
 
 
 @user_interview_router.get("/",
@@ -47,7 +64,9 @@ def get_user_interviews(user=Depends(get_current_user), states: List[InterviewSt
     """
     Fetches all interviews that have been started by a given user, regardless of the interview status.
     """
-    user_interviews = db.query(UserInterview).join(InterviewState).filter(UserInterview.user_id == user.id, InterviewState.state.in_(states)).order_by(desc(UserInterview.createdAt)).all()
+    user_interviews = db.query(UserInterview).join(InterviewState) \
+        .options(selectinload(UserInterview.interview_state), selectinload(UserInterview.responses)) \
+        .filter(UserInterview.user_id == user.id, InterviewState.state.in_(states)).order_by(desc(UserInterview.createdAt)).all()
     if not user_interviews:
         raise HTTPException(status_code=404, detail="No interviews found for this user.")
 
@@ -58,6 +77,68 @@ def get_user_interviews(user=Depends(get_current_user), states: List[InterviewSt
     return interviews
 
 
+@user_interview_router.get("/page",
+                           operation_id="user_interviews_page",
+                           name="page",
+                           response_model=UserInterviewPage,
+                           dependencies=[Depends(OptionalHTTPBearer())],
+                           responses={
+                               400: {"model": ErrorModel, "description": "Bad Request"}
+                           })
+async def get_user_interviews_page(user=Depends(get_current_user),
+                                   states: List[InterviewStateType] = Query(default=[InterviewStateType.completed, InterviewStateType.stopped]),
+                                   limit: int = Query(default=20, ge=1, le=100),
+                                   cursor: Optional[str] = None,
+                                   projection: Literal["summary", "full"] = "summary",
+                                   include_responses: bool = False,
+                                   db: AsyncSession = Depends(get_async_db)):
+    """
+    Pages through the interviews of a user, newest first. Pass `next_cursor` of a page as `cursor` to get the next one.
+    The summary projection never touches responses, the full projection only loads them with `include_responses`.
+    """
+    if projection == "summary":
+        query = select(UserInterview.id, UserInterview.title, InterviewState.state, UserInterview.selected_wiki, UserInterview.createdAt)
+    else:
+        query = select(UserInterview).options(selectinload(UserInterview.interview_state),
+                                              selectinload(UserInterview.responses) if include_responses else noload(UserInterview.responses))
+
+    query = query.join(InterviewState, InterviewState.user_interview_id == UserInterview.id) \
+        .filter(UserInterview.user_id == user.id, InterviewState.state.in_(states))
+
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": "Invalid cursor"}
+        )
+
+    result = await db.execute(page_user_interviews(query, limit, after))
+    rows = result.all() if projection == "summary" else result.scalars().all()
+
+    next_cursor = encode_cursor(rows[limit - 1].createdAt, rows[limit - 1].id) if len(rows) > limit else None
+    rows = rows[:limit]
+
+    if projection == "summary":
+        items = [UserInterviewSummaryModel.model_validate(row) for row in rows]
+    else:
+        items = [UserInterviewModel.model_validate(row) for row in rows]
+
+    return UserInterviewPage(items=items, next_cursor=next_cursor)
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{id}".encode("utf-8")).decode("utf-8")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor.encode("utf-8")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(id)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(str(e))
+
+
 @user_interview_router.get("/{user_interview_id}",
                            operation_id="user_interviews_id",
                            name="getById",
@@ -101,6 +182,7 @@ def create_user_interview(user_interview: UserInterviewCreate, user=Depends(get_
         state=InterviewStateType.active
     )
     db.add(new_interview_state)
+    build_question_plan(db, new_user_interview.id)
     db.commit()
     db.refresh(new_interview_state)
 
@@ -112,17 +194,15 @@ def create_user_interview(user_interview: UserInterviewCreate, user=Depends(get_
                            name="state",
                            response_model=UserInterviewPosition,
                            dependencies=[Depends(get_current_user), Depends(OptionalHTTPBearer())])
-def get_state_by_user_interview_id(user_interview_id: int, db: Session = Depends(get_db)):
+async def get_state_by_user_interview_id(user_interview_id: int, db: AsyncSession = Depends(get_async_db)):
     try:
-        state = db.query(InterviewState).filter(InterviewState.user_interview_id == user_interview_id).one()
-        interview_id = db.query(UserInterview).filter(UserInterview.id == user_interview_id).one().interview_id
-        num_questions = db.query(Question).filter(Question.interview_id == interview_id).count()
-        num_add_questions = db.query(AdditionalQuestion).filter(AdditionalQuestion.user_interview_id == user_interview_id).count()
+        state = (await db.execute(select(InterviewState).filter(InterviewState.user_interview_id == user_interview_id))).scalar_one()
+        num_questions = await ensure_question_plan_async(db, user_interview_id)
         logging.debug(f"get_state_by_user_interview_id - {state}")
         if state:
             new_user_state = UserInterviewPosition(step=state.step,
                                                    state=state.state,
-                                                   num_questions=num_add_questions + num_questions)
+                                                   num_questions=num_questions)
             return new_user_state
         else:
             return JSONResponse(
@@ -140,53 +220,209 @@ def get_state_by_user_interview_id(user_interview_id: int, db: Session = Depends
                            operation_id="user_interviews_history",
                            name="history",
                            dependencies=[Depends(get_current_user), Depends(OptionalHTTPBearer())])  # , response_model=[{"question": QuestionModel, "response": ResponseModel}] | any)
-def get_history_by_user_interview_id(user_interview_id: int, db: Session = Depends(get_db)):
-    responses = db.query(Response).filter(Response.user_interview_id == user_interview_id).all()
+async def get_history_by_user_interview_id(user_interview_id: int, db: AsyncSession = Depends(get_async_db)):
+    rows = (await db.execute(select_history(user_interview_id))).all()
     rets = []
-    for resp in responses:
-        if resp.is_additional:
-            question = db.query(AdditionalQuestion).filter(AdditionalQuestion.id == resp.additional_question_id).first()
-        else:
-            question = db.query(Question).filter(Question.id == resp.question_id).first()
+    for question, resp in history_pairs(rows):
         rets.append({"question": question, "response": resp})
     return rets
 
 
+@user_interview_router.get("/{user_interview_id}/events",
+                           operation_id="user_interviews_events",
+                           name="events",
+                           dependencies=[Depends(OptionalHTTPBearer())])
+def get_events(user_interview_id: int, request: Request, user=Depends(get_current_user)):
+    """
+    Server-sent events for one user interview: question_added, audio_ready, transcript_ready, wiki_chunk, wiki_ready, wiki_failed and wikis_finished.
+    """
+    # the stream is long-lived, don't keep a request scoped session open for it
+    with SessionLocal() as db:
+        user_interview = db.query(UserInterview).filter(UserInterview.id == user_interview_id, UserInterview.user_id == user.id).first()
+    if not user_interview:
+        raise HTTPException(status_code=404, detail=f"Interviews not found with id={user_interview_id}.")
+
+    return StreamingResponse(event_stream(user_interview_id, request),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @user_interview_router.post("/upload_audio",
                             operation_id="user_interviews_upload_audio",
                             name="upload_audio",
                             response_model=AudioModel,
                             dependencies=[Depends(OptionalHTTPBearer())])
-def upload_audio(request: Request, file: UploadFile = File(...),
-                 interview_id: int = Form(...), question_id: int = Form(...), user=Depends(get_current_user)):
+async def upload_audio(request: Request, file: UploadFile = File(...),
+                       interview_id: int = Form(...), question_id: int = Form(...),
+                       db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    filename = uploads.answer_filename(interview_id, question_id, user.id)
     try:
-        # filename = f"a_ui{interview_id}_q{question_id}_u{user.id}{get_extension(file)}"
-        filename = f"a_ui{interview_id}_q{question_id}_u{user.id}.webm"
-        file_location = get_audio_path("user", filename, user)
-        with open(file_location, "wb+") as file_object:
-            file_object.write(file.file.read())
-
-        # filename = filename.replace('.webm', '.mp3')
-        # output_path = get_audio_path("user", filename, user)
-        # command = ['ffmpeg', '-y', '-i', file_location, '-codec:a', 'libmp3lame', '-q:a', '2', output_path]
-        # try:
-        #     subprocess.run(command, check=True)
-        # except subprocess.CalledProcessError as e:
-        #     raise HTTPException(status_code=500, detail=str(e))
-
-        return AudioModel(url=filename, user_id=user.id, interview_id=interview_id, question_id=question_id)
+        digest = await uploads.save_upload(file, get_audio_path("user", filename, user))
+        await discard_open_segments(db, interview_id, filename)
+        return AudioModel(url=filename, user_id=user.id, interview_id=interview_id, question_id=question_id, sha256=digest)
+    except uploads.UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
     except Exception as e:
         logging.error(f"failed to upload: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def discard_open_segments(db: AsyncSession, user_interview_id: int, recording: str):
+    """The whole recording replaces the segments of the answer in progress, submitted answers keep theirs."""
+    await db.execute(delete(AnswerSegment).where(AnswerSegment.user_interview_id == user_interview_id,
+                                                 AnswerSegment.recording == recording,
+                                                 AnswerSegment.response_id.is_(None)))
+    await db.commit()
+
+
+def get_own_upload(upload_id: str, user: UserModel):
+    upload = uploads.get_upload(upload_id)
+    if not upload or upload["user_id"] != user.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+
+def upload_model(upload) -> UploadModel:
+    return UploadModel(upload_id=upload["upload_id"], offset=uploads.get_offset(upload), size=upload["size"],
+                       max_size=uploads.UPLOAD_MAX_BYTES)
+
+
+def upload_conflict(e: uploads.UploadConflictError):
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT,
+        content={"message": str(e), "offset": e.offset}
+    )
+
+
+@user_interview_router.post("/uploads",
+                            operation_id="user_interviews_create_upload",
+                            name="create_upload",
+                            response_model=UploadModel,
+                            dependencies=[Depends(OptionalHTTPBearer())])
+def create_upload(upload: UploadCreate, user=Depends(get_current_user)):
+    """
+    Starts a resumable upload of an answer's recording. The chunks are sent with `PUT /uploads/<id>?offset=<n>`,
+    `GET /uploads/<id>` tells where to resume after a broken connection, `POST /uploads/<id>/complete` finishes it.
+    """
+    if upload.size is not None and upload.size > uploads.UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Upload exceeds {uploads.UPLOAD_MAX_BYTES} bytes")
+    return upload_model(uploads.create_upload(user.id, upload.interview_id, upload.question_id, upload.size))
+
+
+@user_interview_router.get("/uploads/{upload_id}",
+                           operation_id="user_interviews_get_upload",
+                           name="get_upload",
+                           response_model=UploadModel,
+                           dependencies=[Depends(OptionalHTTPBearer())])
+def get_upload(upload_id: str, user=Depends(get_current_user)):
+    return upload_model(get_own_upload(upload_id, user))
+
+
+@user_interview_router.put("/uploads/{upload_id}",
+                           operation_id="user_interviews_upload_chunk",
+                           name="upload_chunk",
+                           response_model=UploadModel,
+                           dependencies=[Depends(OptionalHTTPBearer())])
+async def upload_chunk(upload_id: str, request: Request, offset: int = Query(...), user=Depends(get_current_user)):
+    """Appends the request body at `offset`, a mismatching offset is answered with 409 and the current one."""
+    upload = await asyncio.to_thread(get_own_upload, upload_id, user)
+    try:
+        await uploads.append_chunk(upload, offset, request.stream())
+    except uploads.UploadConflictError as e:
+        return upload_conflict(e)
+    except uploads.UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except ClientDisconnect:
+        logging.info(f"upload_chunk - client left upload {upload_id} at offset {uploads.get_offset(upload)}")
+    return upload_model(upload)
+
+
+@user_interview_router.post("/uploads/{upload_id}/complete",
+                            operation_id="user_interviews_complete_upload",
+                            name="complete_upload",
+                            response_model=AudioModel,
+                            dependencies=[Depends(OptionalHTTPBearer())])
+async def complete_upload(upload_id: str, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    upload = await asyncio.to_thread(get_own_upload, upload_id, user)
+    try:
+        upload = await uploads.complete_upload(upload)
+    except uploads.UploadConflictError as e:
+        return upload_conflict(e)
+    await discard_open_segments(db, upload["interview_id"], upload["filename"])
+    return AudioModel(url=upload["filename"], user_id=user.id, interview_id=upload["interview_id"],
+                      question_id=upload["question_id"], sha256=upload["sha256"])
+
+
+@user_interview_router.post("/{user_interview_id}/segments",
+                            operation_id="user_interviews_upload_segment",
+                            name="upload_segment",
+                            response_model=SegmentModel,
+                            dependencies=[Depends(OptionalHTTPBearer())])
+async def upload_segment(user_interview_id: int, file: UploadFile = File(...), question_id: int = Form(...),
+                         index: int = Form(..., ge=0, lt=uploads.UPLOAD_MAX_SEGMENTS),
+                         db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    """
+    Uploads a segment of an answer while the user is still speaking, it is transcribed right away.
+    Every segment has to be playable on its own, they are sent in order and index 0 starts the answer over.
+    An index more than one past the last segment of the answer is rejected.
+    `url` is submitted as the answer's audio. Uploading the whole recording afterwards is optional and replaces the segments.
+    """
+    user_interview = await db.get(UserInterview, user_interview_id)
+    if not user_interview or user_interview.user_id != user.id:
+        raise HTTPException(status_code=404, detail=f"Interviews not found with id={user_interview_id}.")
+
+    recording = uploads.answer_filename(user_interview_id, question_id, user.id)
+    if index > 0:
+        last = (await db.execute(select(func.max(AnswerSegment.index)).where(AnswerSegment.user_interview_id == user_interview_id,
+                                                                             AnswerSegment.recording == recording,
+                                                                             AnswerSegment.response_id.is_(None)))).scalar()
+        following = 0 if last is None else last + 1
+        if index > following:
+            raise HTTPException(status_code=400, detail=f"Segment {index} skips ahead, the next segment of the answer is {following}")
+    filename = uploads.segment_filename(recording, index)
+    try:
+        await uploads.save_upload(file, get_audio_path("user", filename, user))
+    except uploads.UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+
+    if index == 0:
+        await db.execute(delete(AnswerSegment).where(AnswerSegment.user_interview_id == user_interview_id, AnswerSegment.recording == recording,
+                                                     AnswerSegment.response_id.is_(None)))
+        # the whole recording of an earlier answer to the question would stand in for failed segments
+        whole_recording = get_audio_path("user", recording, user)
+        if os.path.exists(whole_recording):
+            os.remove(whole_recording)
+    segment = (await db.execute(select(AnswerSegment).filter(AnswerSegment.user_interview_id == user_interview_id,
+                                                             AnswerSegment.recording == recording,
+                                                             AnswerSegment.index == index,
+                                                             AnswerSegment.response_id.is_(None)))).scalar_one_or_none()
+    if segment is None:
+        segment = AnswerSegment(user_interview_id=user_interview_id, recording=recording, index=index, audio=filename)
+        db.add(segment)
+    segment.status = TranscriptionStatusType.pending
+    segment.transcript = None
+    segment.error = None
+    await db.commit()
+
+    user_question = None
+    if SPECULATIVE_ANALYSIS:
+        # the answer belongs to the current question, later segments may arrive after the client moved on
+        state = (await db.execute(select(InterviewState).filter(InterviewState.user_interview_id == user_interview_id))).scalar_one_or_none()
+        question = plan_question((await db.execute(select_plan_question_at(user_interview_id, state.step))).first()) if state else None
+        if question is not None and question.id == question_id:
+            user_question = question.text.strip()
+
+    await asyncio.to_thread(q.enqueue, transcribe_segment, segment.id, user.id, user_question)
+    return SegmentModel(url=recording, index=index, status=segment.status.value)
+
+
 @user_interview_router.post("/{user_interview_id}/submit_answer",
                             operation_id="user_interviews_submit_answer",
                             name="submit_answer",
                             response_model=ResponseModel,
                             dependencies=[Depends(OptionalHTTPBearer())])
-async def submit_answer(user_interview_id: int, response: ResponseModel, db: Session = Depends(get_db), user: UserModel = Depends(get_current_user)):
-    user_interview = db.query(UserInterview).filter(UserInterview.id == user_interview_id).first()
+async def submit_answer(user_interview_id: int, response: ResponseModel, db: AsyncSession = Depends(get_async_db), user: UserModel = Depends(get_current_user)):
+    user_interview = await get_user_interview_with_state(user_interview_id, db)
     if not user_interview or user_interview.interview_state.state != InterviewStateType.active:
         raise HTTPException(status_code=400, detail="User interview is not active")
 
@@ -205,43 +441,74 @@ async def submit_answer(user_interview_id: int, response: ResponseModel, db: Ses
             new_response.additional_question_id = response.additional_question_id
 
         db.add(new_response)
-        db.commit()
+        await db.execute(update_plan_response(user_interview_id, response.is_additional, response.additional_question_id if response.is_additional else response.question_id, skipped=True))
+        await db.commit()
+        await db.refresh(new_response)
     else:
-        transcript = ''
-        if len(response.audio.strip()) > 0:
-            file_path = get_audio_path("user", os.path.basename(response.audio), user)
-            transcript = await agent.stt(file_path)
-        else:
-            transcript = ''
-
         new_response = Response(
             user_interview_id=user_interview_id,
             text=response.text,
             audio=response.audio,
-            audio_text=transcript,
+            audio_text="",
             skipped=response.skipped,
             is_additional=response.is_additional)
 
         if not response.is_additional:
-            current_question = db.query(Question).filter_by(id=response.question_id).first()
+            current_question = await db.get(Question, response.question_id)
             new_response.question_id = response.question_id
         else:
-            current_question = db.query(AdditionalQuestion).filter_by(id=response.additional_question_id).first()
+            current_question = await db.get(AdditionalQuestion, response.additional_question_id)
             new_response.additional_question_id = response.additional_question_id
 
         if not current_question:
             raise HTTPException(status_code=404, detail="Question not found")
 
         db.add(new_response)
-        db.commit()
-        db.refresh(new_response)
+        has_audio = len((response.audio or "").strip()) > 0
+        if has_audio:
+            # whisper runs in the worker, which then chains into background_analyse
+            db.add(Transcription(response=new_response, status=TranscriptionStatusType.pending))
+            await db.flush()
+            # the answer's segments are transcribed with it, a later answer to the question starts new ones
+            await db.execute(update(AnswerSegment).where(AnswerSegment.user_interview_id == user_interview_id,
+                                                         AnswerSegment.recording == os.path.basename(response.audio),
+                                                         AnswerSegment.response_id.is_(None)).values(response_id=new_response.id))
+
+        await db.execute(update_plan_response(user_interview_id, response.is_additional, current_question.id, skipped=False))
+        await db.commit()
+        await db.refresh(new_response)
 
-        final_answer = f"{response.text.strip()}\n{transcript.strip()}"
         final_question = f"{current_question.text}".strip()
 
-        q.enqueue(background_analyse, *(final_question, final_answer, user_interview_id, new_response.id))
+        if has_audio:
+            await asyncio.to_thread(q.enqueue, transcribe_response, *(new_response.id, user.id, final_question))
+            return ResponseModel.model_validate(new_response).model_copy(update={"transcription_status": TranscriptionStatusType.pending})
+
+        final_answer = f"{response.text.strip()}\n"
+        await asyncio.to_thread(q.enqueue, background_analyse, *(final_question, final_answer, user_interview_id, new_response.id))
+
+    return ResponseModel.model_validate(new_response)
+
+
+@user_interview_router.get("/{user_interview_id}/responses/{response_id}/transcription",
+                           operation_id="user_interviews_transcription",
+                           name="transcription",
+                           response_model=TranscriptionModel,
+                           dependencies=[Depends(get_current_user), Depends(OptionalHTTPBearer())])
+async def get_transcription(user_interview_id: int, response_id: int, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(Response).options(selectinload(Response.transcription)).filter(Response.id == response_id, Response.user_interview_id == user_interview_id))
+    response = result.scalar_one_or_none()
+    if not response:
+        raise HTTPException(status_code=404, detail="Response not found")
 
-    return new_response
+    if not response.transcription:
+        # answers without audio never had to be transcribed
+        return TranscriptionModel(response_id=response.id, status=TranscriptionStatusType.done, audio_text=response.audio_text, error=None)
+
+    return TranscriptionModel(response_id=response.id,
+                              status=response.transcription.status,
+                              audio_text=response.audio_text,
+                              error=response.transcription.error)
 
 
 @user_interview_router.get("/{user_interview_id}/current_question",
@@ -253,8 +520,8 @@ async def submit_answer(user_interview_id: int, response: ResponseModel, db: Ses
                                400: {"model": ErrorModel, "description": "Bad Request"},
                                404: {"model": ErrorModel, "description": "Not Found"}
                            })
-def get_current_question(user_interview_id: int, db: Session = Depends(get_db)):
-    user_interview = db.query(UserInterview).filter(UserInterview.id == user_interview_id).first()
+async def get_current_question(user_interview_id: int, db: AsyncSession = Depends(get_async_db)):
+    user_interview = await get_user_interview_with_state(user_interview_id, db)
 
     if not user_interview or user_interview.interview_state.state not in [InterviewStateType.active, InterviewStateType.paused]:
         return JSONResponse(
@@ -272,20 +539,20 @@ def get_current_question(user_interview_id: int, db: Session = Depends(get_db)):
 
     state = user_interview.interview_state
 
-    questions = db.query(Question).filter_by(interview_id=user_interview.interview_id).order_by(Question.order).all()
-    if not questions:
+    row = (await db.execute(select_plan_question_at(user_interview_id, state.step))).first()
+    if row is None and await ensure_question_plan_async(db, user_interview_id) > 0:
+        row = (await db.execute(select_plan_question_at(user_interview_id, state.step))).first()
+
+    if row is None:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
             content={"message": "No questions found",
                      "current_status": user_interview.interview_state.state}
         )
 
-    additional_questions = db.query(AdditionalQuestion).filter_by(user_interview_id=user_interview.id).order_by(AdditionalQuestion.order).all()
-    all_questions = questions + additional_questions
-
-    logging.info(f"get_current_question - {all_questions}")
+    question = plan_question(row)
+    logging.info(f"get_current_question - {question}")
 
-    question = all_questions[state.step]
     return question
 
 
@@ -298,8 +565,8 @@ def get_current_question(user_interview_id: int, db: Session = Depends(get_db)):
                                 400: {"model": ErrorModel, "description": "Bad Request"},
                                 404: {"model": ErrorModel, "description": "Not Found"}
                             })
-def get_next_question(user_interview_id: int, db: Session = Depends(get_db)):
-    user_interview = db.query(UserInterview).filter(UserInterview.id == user_interview_id).first()
+async def get_next_question(user_interview_id: int, db: AsyncSession = Depends(get_async_db)):
+    user_interview = await get_user_interview_with_state(user_interview_id, db)
 
     if not user_interview:
         return JSONResponse(
@@ -315,36 +582,27 @@ def get_next_question(user_interview_id: int, db: Session = Depends(get_db)):
             content={"message": "User interview is not active"}
         )
 
-    questions = db.query(Question).filter(Question.interview_id == user_interview.interview_id).order_by(Question.order).all()
-    additional_questions = db.query(AdditionalQuestion).filter_by(user_interview_id=user_interview.id).order_by(AdditionalQuestion.order).all()
-    all_questions = questions + additional_questions
-
     state = user_interview.interview_state
 
-    logging.debug(f'get_next_question - step: {state.step}, length: {len(all_questions)}')
-
-    while state.step < len(all_questions) - 1:
-        state.step += 1
-        next_question = all_questions[state.step]
-        response_exists = db.query(Response).filter(
-            ((Response.question_id == next_question.id) | (Response.additional_question_id == next_question.id)) & (Response.user_interview_id == user_interview_id)
-        ).one_or_none()
+    logging.debug(f'get_next_question - step: {state.step}')
 
-        # Check if a response exists. If not, return the next question.
-        # This happens when a question has been skipped by the AI.
-        if response_exists is None:
-            state.category = next_question.category
-            db.commit()
-            return next_question
+    # the plan knows which questions were answered or skipped by the AI, so this is one seek
+    row = (await db.execute(select_next_plan_question(user_interview_id, state.step))).first()
+    if row is None and await ensure_question_plan_async(db, user_interview_id) > 0:
+        row = (await db.execute(select_next_plan_question(user_interview_id, state.step))).first()
 
-    # When all questions are checked and no further unanswered questions are found
-    if state.step >= len(all_questions) - 1:
+    if row is None:
         logging.debug('get_next_question - interview completed 🎉')
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
             content={"message": "No more questions"}
         )
 
+    state.step = row.QuestionPlanItem.position
+    state.category = row.QuestionPlanItem.category
+    await db.commit()
+    return plan_question(row)
+
 
 @user_interview_router.post("/{user_interview_id}/pause",
                             operation_id="user_interviews_pause",
@@ -377,37 +635,103 @@ def pause_user_interview(user_interview_id: int, db: Session = Depends(get_db)):
                             responses={
                                 400: {"model": ErrorModel, "description": "Bad Request"}
                             })
-async def stop_user_interview(user_interview_id: int, user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
-    user_interview = db.query(UserInterview).filter(UserInterview.id == user_interview_id).first()
-    if not user_interview or user_interview.interview_state.state == InterviewStateType.stopped:
+async def stop_user_interview(user_interview_id: int, user: UserModel = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    user_interview = await get_user_interview_with_state(user_interview_id, db)
+    if not user_interview:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": "User interview is already stopped",
+                     "current_status": None}
+        )
+
+    # repeated stop requests get the handle of the generation that is already running
+    generation = await asyncio.to_thread(wiki_generation.get_current_generation, user_interview_id)
+    if generation and generation["status"] != "failed":
+        return InterviewStatusModel(status="stopped", wikis=[], job_id=generation["job_id"])
+
+    if user_interview.interview_state.state == InterviewStateType.stopped and generation is None:
         return JSONResponse(
             status_code=status.HTTP_400_BAD_REQUEST,
             content={"message": "User interview is already stopped",
                      "current_status": user_interview.interview_state.state}
         )
 
+    # a failed generation may be retried with its prompts, the wikis it saved are kept
+    previous = list(generation["progress"]) if generation else []
+    done = wiki_generation.done_prompts(generation)
+    if generation:
+        await asyncio.to_thread(wiki_generation.clear_generation, user_interview_id)
+
+    generation, created = await asyncio.to_thread(wiki_generation.start_generation, user_interview_id)
+    if not created:
+        return InterviewStatusModel(status="stopped", wikis=[], job_id=generation["job_id"])
+
     user_interview.interview_state.state = InterviewStateType.stopped
-    db.commit()
+    await db.commit()
+
+    prompts = get_prompts(previous) or assign_prompts(DIFY_ENABLED)
+    await asyncio.to_thread(enqueue_wikis, user, user_interview_id, generation["job_id"], prompts, done)
+
+    return InterviewStatusModel(status="stopped", wikis=[], job_id=generation["job_id"])
+
+
+def enqueue_wikis(user: UserModel, user_interview_id: int, job_id: str, prompts: List[PromptModel], done: List[str]):
+    """Registers the prompts of the generation and enqueues the ones that are not done yet, blocks on Redis."""
+    wiki_generation.set_prompts(user_interview_id, [prompt.id for prompt in prompts], done=done)
+    q.enqueue(generate_wikis,
+              *(user.id, user.username, user_interview_id, [prompt.model_dump() for prompt in prompts if prompt.id not in done], DIFY_ENABLED),
+              job_id=job_id,
+              job_timeout=WIKI_JOB_TIMEOUT)
+
+
+@user_interview_router.get("/{user_interview_id}/wikis/status",
+                           operation_id="user_interviews_wikis_status",
+                           name="wikis_status",
+                           response_model=WikiGenerationStatusModel,
+                           dependencies=[Depends(get_current_user), Depends(OptionalHTTPBearer())],
+                           responses={
+                               404: {"model": ErrorModel, "description": "Not Found"}
+                           })
+def get_wikis_status(user_interview_id: int, db: Session = Depends(get_db)):
+    generation = wiki_generation.get_generation(user_interview_id)
+    if not generation:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "No wiki generation found for user interview."}
+        )
+
+    # the worker may have died without updating the progress
+    generation = wiki_generation.check_job(user_interview_id, generation)
+
+    wikis = []
+    if generation["status"] in ["finished", "failed"]:
+        wikis = db.query(Wiki).filter(Wiki.user_interview_id == user_interview_id).order_by(desc(Wiki.createdAt)).all()
+
+    return WikiGenerationStatusModel(job_id=generation["job_id"],
+                                     status=generation["status"],
+                                     progress=generation["progress"],
+                                     wikis=wikis)
+
+
+@user_interview_router.get("/{user_interview_id}/wikis/stream",
+                           operation_id="user_interviews_wikis_stream",
+                           name="wikis_stream",
+                           dependencies=[Depends(OptionalHTTPBearer())])
+def stream_wikis(user_interview_id: int, request: Request, user=Depends(get_current_user)):
+    """
+    Server-sent events of the running wiki generation: wiki_chunk with the text streamed so far and every
+    following piece, wiki_ready once a wiki is saved, wiki_failed if its generation failed and wikis_finished
+    when the stream ends.
+    Chunks are only produced with `BB_WIKI_STREAMING` enabled, the saved wiki is the authoritative text.
+    """
+    with SessionLocal() as db:
+        user_interview = db.query(UserInterview).filter(UserInterview.id == user_interview_id, UserInterview.user_id == user.id).first()
+    if not user_interview:
+        raise HTTPException(status_code=404, detail=f"Interviews not found with id={user_interview_id}.")
 
-    prompts = assign_prompts(DIFY_ENABLED)
-
-    tasks = [
-        (generate_dify_wiki(user=user,
-                            interview_id=user_interview.interview_id,
-                            user_interview_id=user_interview.id,
-                            interview_date=user_interview.createdAt.strftime("%Y-%m-%dT%H:%M"),
-                            dify_id=int(value.id),
-                            db=db)
-         if DIFY_ENABLED else
-         generate_wiki(user=user,
-                       interview_id=user_interview.interview_id,
-                       user_interview_id=user_interview.id,
-                       prompt=value,
-                       db=db)) for value in prompts]
-
-    wiki_models = await asyncio.gather(*tasks)
-
-    return InterviewStatusModel(status="stopped", wikis=wiki_models)
+    return StreamingResponse(wiki_stream(user_interview_id, request),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @user_interview_router.post("/{user_interview_id}/continue",
@@ -16,6 +16,7 @@ from src.server.routers.file import file_router
 from src.server.routers.interviews import interview_router
 from src.server.routers.user_interviews import user_interview_router
 from src.server.routers.rating import rating_router
+from src.server.routers.metrics import metrics_router
 from src.server.auth.auth import auth_router
 
 
@@ -45,6 +46,7 @@ api.include_router(interview_router)
 api.include_router(user_interview_router)
 api.include_router(wiki_router)
 api.include_router(rating_router)
+api.include_router(metrics_router)
 
 
 if os.getenv("ENVIRONMENT") == "local":
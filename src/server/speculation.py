@@ -0,0 +1,145 @@
+import asyncio
+from difflib import SequenceMatcher
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Dict, Optional
+
+from redis.exceptions import RedisError
+
+from src.helper.logger import getLogger
+from src.server.utils import get_redis
+
+logging = getLogger()
+
+SPECULATIVE_ANALYSIS = os.getenv("BB_SPECULATIVE_ANALYSIS", "false").lower() in ("1", "true", "yes")
+# word level similarity of the final and the partial answer above which the partial answer's analysis is kept
+SPECULATIVE_SIMILARITY = float(os.getenv("BB_SPECULATIVE_SIMILARITY", 0.9))
+# how long the final analysis waits for a matching speculation that is still running
+SPECULATIVE_WAIT_SECONDS = float(os.getenv("BB_SPECULATIVE_WAIT_SECONDS", 30))
+SPECULATION_TTL = 60 * 60
+POLL_SECONDS = 0.25
+
+STATS_KEY = "speculative_analysis_stats"
+
+redis = get_redis()
+
+
+def get_key(user_interview_id: int, question: str):
+    digest = hashlib.sha256(question.strip().lower().encode("utf-8")).hexdigest()[:16]
+    return f"speculative_analysis:{user_interview_id}:{digest}"
+
+
+def fingerprint(inputs: Dict) -> str:
+    """Content address of everything the analysis gets besides the answer."""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def similarity(a: str, b: str) -> float:
+    return SequenceMatcher(None, a.split(), b.split(), autojunk=False).ratio()
+
+
+def matches(speculation: Dict, inputs: Dict, message: str) -> bool:
+    return speculation["fingerprint"] == fingerprint(inputs) and similarity(speculation["message"], message) >= SPECULATIVE_SIMILARITY
+
+
+def get_speculation(user_interview_id: int, question: str) -> Optional[Dict]:
+    data = redis.get(get_key(user_interview_id, question))
+    return json.loads(data) if data else None
+
+
+def _save(user_interview_id: int, question: str, speculation: Dict):
+    redis.set(get_key(user_interview_id, question), json.dumps(speculation), ex=SPECULATION_TTL)
+
+
+def start(user_interview_id: int, question: str, inputs: Dict, message: str) -> Optional[Dict]:
+    """Registers a speculation on a partial answer, None if the current one would be kept for `message` anyway."""
+    current = get_speculation(user_interview_id, question)
+    if current and matches(current, inputs, message):
+        return None
+    if current and current["status"] == "done":
+        # a running speculation counts itself once it finishes
+        _wasted(current)
+    speculation = {"id": uuid.uuid4().hex, "status": "running", "fingerprint": fingerprint(inputs), "message": message}
+    _save(user_interview_id, question, speculation)
+    _count("started")
+    return speculation
+
+
+def finish(user_interview_id: int, question: str, speculation: Dict, result: Dict, ms: int):
+    speculation.update(status="done", result=result, tokens=result["data"]["total_tokens"], ms=ms)
+    current = get_speculation(user_interview_id, question)
+    if not current or current["id"] != speculation["id"]:
+        # replaced by a later speculation or rejected by the final analysis while running
+        _wasted(speculation)
+        return
+    _save(user_interview_id, question, speculation)
+
+
+def fail(user_interview_id: int, question: str, speculation: Dict):
+    current = get_speculation(user_interview_id, question)
+    if current and current["id"] == speculation["id"]:
+        redis.delete(get_key(user_interview_id, question))
+
+
+async def take(user_interview_id: int, question: str, inputs: Dict, message: str) -> Optional[Dict]:
+    """
+    Result of the speculation for the final answer `message`, waits for it if it is still running.
+    None if there is none or it was made for other inputs or an answer that is not close enough.
+    """
+    key = get_key(user_interview_id, question)
+    speculation = get_speculation(user_interview_id, question)
+    if speculation is None:
+        return None
+    if not matches(speculation, inputs, message):
+        logging.info(f"speculation - discarded analysis of the partial answer to '{question}', "
+                     f"same inputs: {speculation['fingerprint'] == fingerprint(inputs)}, "
+                     f"similarity: {similarity(speculation['message'], message):.2f}")
+        redis.delete(key)
+        _count("misses")
+        if speculation["status"] == "done":
+            _wasted(speculation)
+        return None
+
+    start_wait = time.monotonic()
+    while speculation["status"] == "running" and time.monotonic() - start_wait < SPECULATIVE_WAIT_SECONDS:
+        await asyncio.sleep(POLL_SECONDS)
+        speculation = get_speculation(user_interview_id, question)
+        if speculation is None:
+            # the speculation failed
+            return None
+    redis.delete(key)
+    if speculation["status"] != "done":
+        _count("misses")
+        return None
+
+    waited_ms = int((time.monotonic() - start_wait) * 1000)
+    _count("hits")
+    _count("latency_saved_ms", max(speculation["ms"] - waited_ms, 0))
+    logging.info(f"speculation - kept analysis of the partial answer to '{question}', waited {waited_ms}ms")
+    return speculation["result"]
+
+
+def get_stats() -> Dict:
+    try:
+        stats = {k.decode("utf-8"): int(v) for k, v in redis.hgetall(STATS_KEY).items()}
+    except RedisError as e:
+        logging.warning(f"speculation - redis stats failed: {e}")
+        return {}
+    decided = stats.get("hits", 0) + stats.get("misses", 0)
+    stats["hit_rate"] = round(stats.get("hits", 0) / decided, 3) if decided else None
+    return stats
+
+
+def _wasted(speculation: Dict):
+    _count("wasted")
+    _count("wasted_tokens", speculation.get("tokens", 0))
+
+
+def _count(name: str, amount: int = 1):
+    try:
+        redis.hincrby(STATS_KEY, name, amount)
+    except RedisError:
+        pass
@@ -1,9 +1,24 @@
+import asyncio
 import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+from sqlalchemy import update
 
-from src.datamodel.interview import AdditionalQuestion, Cost, Question, RawResponse, Response
-from src.datamodel.manager.db_helper import generate_history, get_user_interview_state
+from src.audio.preprocess import AUDIO_PREPROCESS_ENABLED, AudioChunk, preprocess_audio, remove_chunks, stitch_transcripts
+from src.datamodel.interview import AdditionalQuestion, AnswerSegment, AudioStats, Cost, Question, RawResponse, Response, Transcription, TranscriptionStatusType, UserInterview, UserModel
+from src.datamodel.prompt import PromptModel
+from src.datamodel.manager.db_helper import get_user_interview_state
+from src.datamodel.manager.question_plan import append_to_plan, update_plan_response
 from src.helper.file import get_audio_path
+from src.helper.history import build_history
+from src.helper.transcript_cache import TRANSCRIPT_CACHE_ENABLED, CachedTranscript, TranscriptCacheSingleton, audio_hash
+from src.helper.wiki import generate_dify_wiki, generate_wiki
+from src.server import speculation, uploads, wiki_generation
+from src.server.speculation import SPECULATIVE_ANALYSIS
+from src.server.events import AUDIO_READY, QUESTION_ADDED, TRANSCRIPT_READY, WIKI_CHUNK, WIKI_FAILED, WIKI_READY, WIKIS_FINISHED, publish_event
+from src.server.queue_setup import q
 
 from ...agent import AgentSingleton
 from ...helper.logger import getLogger
@@ -13,33 +28,344 @@ load_dotenv()
 
 logging = getLogger()
 agent = AgentSingleton()
+transcript_cache = TranscriptCacheSingleton()
 
+TTS_CONCURRENCY = int(os.getenv("BB_TTS_CONCURRENCY", 4))
+TTS_RETRIES = int(os.getenv("BB_TTS_RETRIES", 2))
+STT_CONCURRENCY = int(os.getenv("BB_STT_CONCURRENCY", 4))
+# how long a submitted answer waits for segment jobs that are still running before it transcribes their segments itself
+SEGMENT_WAIT_SECONDS = float(os.getenv("BB_SEGMENT_WAIT_SECONDS", 60))
+SEGMENT_POLL_SECONDS = 0.25
+WIKI_STREAMING = os.getenv("BB_WIKI_STREAMING", "false").lower() in ("1", "true", "yes")
+# seconds between two wiki_chunk events of one wiki, tokens arriving in between are sent together
+WIKI_STREAM_INTERVAL = float(os.getenv("BB_WIKI_STREAM_INTERVAL", 0.25))
 
-async def create_question_audio(question_id, interview_id, text, is_additional=False):
-    # Set the appropriate file prefix and database model based on `is_additional`
-    file_prefix = 'aq' if is_additional else 'q'
+
+async def synthesize_question_audio(items: List[Tuple[int, str]], is_additional=False, user_interview_id: int = None) -> List[Dict]:
+    """
+    Generates the audio for (question_id, text) pairs with bounded concurrency and writes all
+    audio paths back in one bulk update. Returns the written {"id", "audio"} mappings.
+    """
     db_model = AdditionalQuestion if is_additional else Question
+    semaphore = asyncio.Semaphore(TTS_CONCURRENCY)
+
+    # Identical texts share one file in the global audio dir, synthesize each file once
+    paths: Dict[str, str] = {}
+    for _, text in items:
+        paths.setdefault(get_audio_path("global", agent.tts_cache_filename(text)), text)
+
+    async def synthesize(path: str, text: str):
+        for attempt in range(TTS_RETRIES + 1):
+            try:
+                async with semaphore:
+                    return await agent.cached_tts(text, path)
+            except Exception as e:
+                logging.warning(f"tts attempt {attempt + 1} failed for '{text}': {e}")
+                if attempt < TTS_RETRIES:
+                    await asyncio.sleep(2 ** attempt)
+        logging.error(f"Giving up on tts for '{text}'.")
+        return None
 
-    # Construct file name and path
-    filename = f'{file_prefix}_i{interview_id}_q{question_id}.mp3'
-    path = get_audio_path("global", filename)
+    results = await asyncio.gather(*[synthesize(path, text) for path, text in paths.items()])
+    done = {path for path in results if path}
 
-    # Generate text-to-speech and log the output path
-    new_path = await agent.tts(text, path)
-    logging.info(f"{file_prefix.upper()} i{interview_id}/q{question_id}/{text} saved to {new_path}")
+    mappings = []
+    for question_id, text in items:
+        path = get_audio_path("global", agent.tts_cache_filename(text))
+        if path in done:
+            mappings.append({"id": question_id, "audio": path})
+
+    if not mappings:
+        return mappings
 
-    # Update the database with the new audio path
     db = SessionLocal()
     try:
-        question = db.query(db_model).filter(db_model.id == question_id).first()
-        if question:
-            question.audio = path
-            db.commit()
-            logging.info(f"Updated {file_prefix} question {question_id} with new audio path: {question.audio}.")
+        db.execute(update(db_model), mappings)
+        db.commit()
+        logging.info(f"Updated audio of {len(mappings)}/{len(items)} {db_model.__tablename__}.")
+        if user_interview_id is not None:
+            publish_event(user_interview_id, AUDIO_READY, {"is_additional": is_additional, "questions": mappings})
+    except Exception as e:
+        logging.error(f"Error updating {db_model.__tablename__} audio: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+    return mappings
+
+
+async def create_questions_audio(items: List[Tuple[int, str]], interview_id, is_additional=False):
+    logging.info(f"Generating audio for {len(items)} questions of i{interview_id}")
+    await synthesize_question_audio(items, is_additional)
+
+
+async def create_question_audio(question_id, interview_id, text, is_additional=False):
+    await create_questions_audio([(question_id, text)], interview_id, is_additional)
+
+
+async def prepare_audio(stats: AudioStats, file_path: str) -> List[AudioChunk]:
+    """
+    Preprocesses the recording for whisper and records the savings on `stats`.
+    Returns the chunks to transcribe, none for a silent recording and the original file if preprocessing fails.
+    """
+    stats.audio_bytes = os.path.getsize(file_path)
+    original = [AudioChunk(path=file_path, start_ms=0, end_ms=0)]
+    if not AUDIO_PREPROCESS_ENABLED:
+        return original
+    try:
+        audio = await asyncio.to_thread(preprocess_audio, file_path)
+    except Exception as e:
+        logging.warning(f"Preprocessing {file_path} failed, transcribing the original: {e}")
+        return original
+
+    stats.processed_bytes = audio.processed_bytes
+    stats.audio_duration = audio.audio_duration
+    stats.processed_duration = audio.processed_duration
+    stats.preprocess_ms = audio.preprocess_ms
+    return audio.chunks
+
+
+async def transcribe_chunks(chunks: List[AudioChunk]) -> str:
+    """
+    Transcribes the chunks of one recording concurrently and joins the transcripts in order.
+    Raises if whisper fails on any chunk, an empty or partial transcript would be analysed as the answer.
+    """
+    semaphore = asyncio.Semaphore(STT_CONCURRENCY)
+
+    async def transcribe(chunk: AudioChunk):
+        async with semaphore:
+            return await agent.stt(chunk.path, raise_errors=True)
+
+    transcripts = await asyncio.gather(*[transcribe(chunk) for chunk in chunks])
+    return stitch_transcripts(transcripts, chunks)
+
+
+async def transcribe_recording(stats: AudioStats, file_path: str) -> str:
+    """
+    Transcribes a recording, a recording that was transcribed before is taken from the transcript cache.
+    Raises if whisper fails.
+    """
+    digest = None
+    if TRANSCRIPT_CACHE_ENABLED:
+        digest = uploads.get_audio_hash(file_path) or await asyncio.to_thread(audio_hash, file_path)
+        cached = await asyncio.to_thread(transcript_cache.get, digest, **agent.stt_settings)
+        if cached:
+            logging.info(f"Transcript of {file_path} is cached, skipping stt.")
+            return cached.transcript
+
+    chunks = await prepare_audio(stats, file_path)
+    try:
+        if not chunks:
+            logging.info(f"{file_path} is silent, skipping stt.")
+            transcript = ""
+        else:
+            start = time.perf_counter()
+            transcript = await transcribe_chunks(chunks)
+            stats.stt_ms = int((time.perf_counter() - start) * 1000)
+    finally:
+        remove_chunks(chunks, file_path)
+
+    if digest:
+        await asyncio.to_thread(transcript_cache.set, digest,
+                                cached=CachedTranscript(transcript=transcript, stt_calls=len(chunks), stt_ms=stats.stt_ms or 0),
+                                **agent.stt_settings)
+    return transcript
+
+
+def claim_segment(db, segment_id: int, statuses: List[TranscriptionStatusType]) -> bool:
+    """Marks a segment as processing if it is in one of `statuses`, False if another job got it first."""
+    claimed = db.execute(update(AnswerSegment)
+                         .where(AnswerSegment.id == segment_id, AnswerSegment.status.in_(statuses))
+                         .values(status=TranscriptionStatusType.processing)).rowcount
+    db.commit()
+    return claimed == 1
+
+
+async def transcribe_segment_audio(segment: AnswerSegment, user_id: int):
+    """Transcribes a claimed segment, the caller commits the result."""
+    file_path = get_audio_path("user", segment.audio, UserModel(id=user_id, username=""))
+    try:
+        segment.transcript = await transcribe_recording(segment, file_path)
+        segment.status = TranscriptionStatusType.done
+        segment.error = None
+    except Exception as e:
+        logging.warning(f"Transcribing segment {segment.index} of {segment.recording} failed: {e}")
+        segment.status = TranscriptionStatusType.failed
+        segment.error = str(e)
+
+
+async def transcribe_segment(segment_id: int, user_id: int, user_question: str = None):
+    """
+    Transcribes a segment uploaded while the user is still answering, unless the submitted answer took it over.
+    With `user_question` the answer so far is analysed speculatively.
+    """
+    db = SessionLocal()
+    try:
+        if not claim_segment(db, segment_id, [TranscriptionStatusType.pending]):
+            return
+        segment = db.get(AnswerSegment, segment_id)
+        if segment is None:
+            return
+        await transcribe_segment_audio(segment, user_id)
+        db.commit()
+        logging.info(f"Transcribed segment {segment.index} of {segment.recording}.")
+        if user_question and segment.status == TranscriptionStatusType.done:
+            q.enqueue(speculative_analyse, segment.user_interview_id, segment.recording, user_question)
+    finally:
+        db.close()
+
+
+async def transcribe_segments(db, transcription: Transcription, segments: List[AnswerSegment], user_id: int, file_path: str) -> str:
+    """
+    Joins the transcripts of the segments uploaded while the user was answering, segments whose job did not finish are
+    transcribed here. If a segment can't be transcribed or is missing the whole recording is, if it was uploaded.
+    """
+    missing = sorted(set(range(segments[-1].index + 1)) - {segment.index for segment in segments})
+    if missing:
+        if not os.path.exists(file_path):
+            raise RuntimeError(f"Segments {missing} of {segments[0].recording} are missing")
+        logging.warning(f"Segments {missing} of {segments[0].recording} are missing, transcribing the whole recording.")
+        return await transcribe_recording(transcription, file_path)
+
+    start = time.perf_counter()
+    deadline = time.monotonic() + SEGMENT_WAIT_SECONDS
+    for segment in segments:
+        while segment.status == TranscriptionStatusType.processing and time.monotonic() < deadline:
+            await asyncio.sleep(SEGMENT_POLL_SECONDS)
+            db.refresh(segment)
+
+    # a job still processing after the deadline is taken for dead
+    open_statuses = [TranscriptionStatusType.pending, TranscriptionStatusType.processing, TranscriptionStatusType.failed]
+    remaining = [segment for segment in segments if segment.status != TranscriptionStatusType.done and claim_segment(db, segment.id, open_statuses)]
+    if remaining:
+        logging.info(f"Transcribing {len(remaining)}/{len(segments)} segments of {segments[0].recording} after submit.")
+        await asyncio.gather(*[transcribe_segment_audio(segment, user_id) for segment in remaining])
+        db.commit()
+
+    failed = [segment for segment in segments if segment.status != TranscriptionStatusType.done]
+    if failed:
+        if not os.path.exists(file_path):
+            raise RuntimeError(f"Segment {failed[0].index} of {failed[0].recording} failed: {failed[0].error}")
+        logging.warning(f"{len(failed)} segments of {failed[0].recording} failed, transcribing the whole recording.")
+        return await transcribe_recording(transcription, file_path)
+
+    for name in ["audio_bytes", "processed_bytes", "audio_duration", "processed_duration", "preprocess_ms"]:
+        setattr(transcription, name, sum(getattr(segment, name) or 0 for segment in segments))
+    # only the time whisper took after the answer was submitted, the segments hold their own stt_ms
+    transcription.stt_ms = int((time.perf_counter() - start) * 1000)
+    return " ".join(segment.transcript.strip() for segment in segments if segment.transcript and segment.transcript.strip())
+
+
+async def transcribe_response(response_id: int, user_id: int, question_text: str):
+    db = SessionLocal()
+    try:
+        response = db.query(Response).filter(Response.id == response_id).one_or_none()
+        if not response or not response.transcription:
+            logging.error(f"No pending transcription found for response {response_id}.")
+            return
+
+        transcription = response.transcription
+        transcription.status = TranscriptionStatusType.processing
+        # committing releases the connection while whisper is running
+        db.commit()
+
+        recording = os.path.basename(response.audio)
+        file_path = get_audio_path("user", recording, UserModel(id=user_id, username=""))
+        segments = db.query(AnswerSegment) \
+            .filter(AnswerSegment.response_id == response.id) \
+            .order_by(AnswerSegment.index).all()
+        if segments:
+            transcript = await transcribe_segments(db, transcription, segments, user_id, file_path)
         else:
-            logging.error(f"No question found with ID {question_id}.")
+            transcript = await transcribe_recording(transcription, file_path)
+
+        response.audio_text = transcript
+        transcription.status = TranscriptionStatusType.done
+        db.commit()
+        logging.info(f"Transcribed response {response_id}.")
+        publish_event(response.user_interview_id, TRANSCRIPT_READY, {"response_id": response.id, "audio_text": transcript})
+
+        final_answer = f"{(response.text or '').strip()}\n{transcript.strip()}"
+        q.enqueue(background_analyse, *(question_text, final_answer, response.user_interview_id, response.id))
     except Exception as e:
-        logging.error(f"Error updating {file_prefix} question: {e}")
+        logging.error(f"Error in transcribe_response: {e}")
+        db.rollback()
+        transcription = db.query(Transcription).filter(Transcription.response_id == response_id).one_or_none()
+        if transcription:
+            transcription.status = TranscriptionStatusType.failed
+            transcription.error = str(e)
+            db.commit()
+    finally:
+        db.close()
+
+
+async def analysis_inputs(db, user_interview_id: int, user_question: str) -> Optional[Dict]:
+    """Everything the follow-up analysis of an answer to `user_question` gets besides the answer."""
+    user_interview_state = get_user_interview_state(user_interview_id, user_question, db)
+    if user_interview_state is None:
+        return None
+
+    history = await build_history(user_interview_state.answered_questions,
+                                  user_interview_id,
+                                  user_interview_state.business_segment,
+                                  db)
+    return {
+        "business_segment": user_interview_state.business_segment,
+        "question": user_question,
+        "history": history,
+        "mandatory_upcoming_questions": [question.text for question in user_interview_state.unanswered_mandatory_questions],
+        "optional_upcoming_questions": [question.text for question in user_interview_state.unanswered_optional_questions],
+        "skipped_questions": [question.text for question in user_interview_state.skipped_questions],
+    }
+
+
+async def speculative_analyse(user_interview_id: int, recording: str, user_question: str):
+    """
+    Analyses the answer transcribed so far while the user is still speaking, the final analysis keeps the result
+    if its answer is close enough.
+    """
+    db = SessionLocal()
+    try:
+        segments = db.query(AnswerSegment) \
+            .filter(AnswerSegment.user_interview_id == user_interview_id, AnswerSegment.recording == recording,
+                    AnswerSegment.response_id.is_(None)) \
+            .order_by(AnswerSegment.index).all()
+        partial = []
+        for position, segment in enumerate(segments):
+            if segment.index != position or segment.status != TranscriptionStatusType.done:
+                break
+            partial.append((segment.transcript or "").strip())
+        transcript = " ".join(text for text in partial if text)
+        # a later segment's job analyses the longer answer
+        if not transcript or len(partial) < len(segments):
+            return
+
+        inputs = await analysis_inputs(db, user_interview_id, user_question)
+        if inputs is None:
+            return
+        # the same message the final analysis gets for an answer without text
+        message = f"\n{transcript}"
+        started = speculation.start(user_interview_id, user_question, inputs, message)
+        if started is None:
+            return
+
+        start = time.perf_counter()
+        try:
+            analysed = await agent.dify_analyse(message=message, **inputs)
+        except Exception:
+            speculation.fail(user_interview_id, user_question, started)
+            raise
+        # dify errors come back as None, a final analysis must not wait for a speculation that never finishes
+        if analysed is None or analysed.get("data", {}).get("status") != "succeeded":
+            speculation.fail(user_interview_id, user_question, started)
+            logging.warning(f"Speculative analysis of {recording} failed: {analysed}")
+            return
+        speculation.finish(user_interview_id, user_question, started, analysed, int((time.perf_counter() - start) * 1000))
+        db.add(Cost(tokens=analysed["data"]["total_tokens"], model="zy_followup_questions_speculative", user_interview_id=user_interview_id))
+        db.commit()
+        logging.info(f"Speculative analysis of {len(segments)} segments of {recording} done.")
+    except Exception as e:
+        logging.error(f"Error in speculative_analyse: {e}")
         db.rollback()
     finally:
         db.close()
@@ -52,29 +378,16 @@ async def background_analyse(user_question: str, user_answer: str, user_intervie
     db = SessionLocal()
 
     try:
-        user_interview_state = get_user_interview_state(user_interview_id, user_question)
-
-        unanswered_mandatory_questions_list = []
-        for question in user_interview_state['unanswered_mandatory_questions']:
-            unanswered_mandatory_questions_list.append(question['text'])
-
-        unanswered_optional_questions_list = []
-        for question in user_interview_state['unanswered_optional_questions']:
-            unanswered_optional_questions_list.append(question['text'])
-
-        skipped_questions_list = []
-        for question in user_interview_state['skipped_questions']:
-            skipped_questions_list.append(question['text'])
-
-        analysed = await agent.dify_analyse(
-            business_segment=user_interview_state['business_segment'],
-            question=user_question,
-            message=user_answer,
-            history=generate_history(user_interview_state["answered_questions"]),
-            mandatory_upcoming_questions=unanswered_mandatory_questions_list,
-            optional_upcoming_questions=unanswered_optional_questions_list,
-            skipped_questions=skipped_questions_list
-        )
+        inputs = await analysis_inputs(db, user_interview_id, user_question)
+        if inputs is None:
+            logging.error(f"User interview {user_interview_id} not found.")
+            return
+
+        analysed = await speculation.take(user_interview_id, user_question, inputs, user_answer) if SPECULATIVE_ANALYSIS else None
+        # a kept speculation recorded its cost when it ran
+        speculated = analysed is not None
+        if not speculated:
+            analysed = await agent.dify_analyse(message=user_answer, **inputs)
         logging.info(f"submit_answer - {analysed}")
 
         raw_response = RawResponse(
@@ -86,40 +399,128 @@ async def background_analyse(user_question: str, user_answer: str, user_intervie
         )
         db.add(raw_response)
 
-        cost = Cost(
-            tokens=analysed["data"]["total_tokens"],
-            model="zy_followup_questions",
-            user_interview_id=user_interview_id
-        )
-        db.add(cost)
-
-        db.commit()
+        if not speculated:
+            cost = Cost(
+                tokens=analysed["data"]["total_tokens"],
+                model="zy_followup_questions",
+                user_interview_id=user_interview_id
+            )
+            db.add(cost)
 
+        # follow-ups and skipped optional questions are written in one transaction
         json_rr = json.loads(analysed["data"]["outputs"]["text"])
-        for add_q in json_rr['additional_questions']:
-            additional_question = AdditionalQuestion(
-                text=add_q,
-                user_interview_id=user_interview_id,
-                response_id=response_id
-            )
-            db.add(additional_question)
-            db.commit()
-            db.refresh(additional_question)
-            await create_question_audio(
-                additional_question.id,
-                user_interview_id,
-                add_q,
-                True)
-
-        for skip_q in json_rr['removed_optional_questions']:
-            a_q = db.query(AdditionalQuestion).filter(AdditionalQuestion.text == skip_q, AdditionalQuestion.user_interview_id == user_interview_id).one_or_none()
-            skipped_r = Response(user_interview_id=user_interview_id, additional_question_id=a_q.id, skipped=True, is_additional=True, by_user=False)
+        additional_questions = [AdditionalQuestion(text=add_q, user_interview_id=user_interview_id, response_id=response_id)
+                                for add_q in json_rr['additional_questions']]
+        db.add_all(additional_questions)
+        db.flush()
+        append_to_plan(db, user_interview_id, additional_questions)
+
+        removed = json_rr.get('removed_optional_questions', [])
+        skipped = db.query(AdditionalQuestion).filter(AdditionalQuestion.text.in_(removed), AdditionalQuestion.user_interview_id == user_interview_id).all() if removed else []
+        for a_q in skipped:
             logging.debug(f"Skipped additional question: {a_q.id}")
-            db.add(skipped_r)
+            db.add(Response(user_interview_id=user_interview_id, additional_question_id=a_q.id, skipped=True, is_additional=True, by_user=False))
+            db.execute(update_plan_response(user_interview_id, True, a_q.id, skipped=True))
+
+        items = [(a_q.id, a_q.text) for a_q in additional_questions]
         db.commit()
 
+        if items:
+            publish_event(user_interview_id, QUESTION_ADDED, {"questions": [{"id": id, "text": text} for id, text in items]})
+            await synthesize_question_audio(items, is_additional=True, user_interview_id=user_interview_id)
+
     except Exception as e:
         logging.error(f"Error in background_analyse: {e}")
         db.rollback()
     finally:
         db.close()
+
+
+class WikiStreamRelay:
+    """Collects the chunks of a streamed wiki and publishes them as `wiki_chunk` events, at most one per interval."""
+
+    def __init__(self, user_interview_id: int, prompt_id: str):
+        self.user_interview_id = user_interview_id
+        self.prompt_id = str(prompt_id)
+        self.offset = 0
+        self.buffer: List[str] = []
+        self.started = time.monotonic()
+        self.flushed = 0.0
+
+    def __call__(self, text: str):
+        if not self.offset and not self.buffer:
+            logging.info(f"wiki_stream - first chunk of {self.user_interview_id}/{self.prompt_id} after {time.monotonic() - self.started:.2f}s")
+        self.buffer.append(text)
+        if time.monotonic() - self.flushed >= WIKI_STREAM_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        text = "".join(self.buffer)
+        self.buffer = []
+        self.flushed = time.monotonic()
+        wiki_generation.append_partial(self.user_interview_id, self.prompt_id, text)
+        publish_event(self.user_interview_id, WIKI_CHUNK, {"prompt_id": self.prompt_id, "offset": self.offset, "text": text})
+        self.offset += len(text)
+
+    def close(self):
+        """The wiki is persisted, the streamed text is no longer needed."""
+        self.flush()
+        wiki_generation.clear_partial(self.user_interview_id, self.prompt_id)
+
+
+async def generate_wikis(user_id: int, username: str, user_interview_id: int, prompts: List[Dict], dify: bool):
+    db = SessionLocal()
+    user = UserModel(id=user_id, username=username)
+    try:
+        user_interview = db.query(UserInterview).filter(UserInterview.id == user_interview_id).one()
+        interview_date = user_interview.createdAt.strftime("%Y-%m-%dT%H:%M")
+        wiki_generation.update_status(user_interview_id, "running")
+
+        async def run(prompt: PromptModel):
+            wiki_generation.update_status(user_interview_id, "running", prompt.id)
+            # the prompt id the saved wiki gets
+            wiki_prompt_id = f"dify_{prompt.id}" if dify else prompt.id
+            relay = WikiStreamRelay(user_interview_id, wiki_prompt_id) if WIKI_STREAMING else None
+            try:
+                if dify:
+                    wiki = await generate_dify_wiki(user=user,
+                                                    interview_id=user_interview.interview_id,
+                                                    user_interview_id=user_interview_id,
+                                                    interview_date=interview_date,
+                                                    dify_id=int(prompt.id),
+                                                    db=db,
+                                                    on_chunk=relay)
+                else:
+                    wiki = await generate_wiki(user=user,
+                                               interview_id=user_interview.interview_id,
+                                               user_interview_id=user_interview_id,
+                                               prompt=prompt,
+                                               db=db,
+                                               on_chunk=relay)
+                if relay:
+                    relay.close()
+                publish_event(user_interview_id, WIKI_READY, {"wiki_id": wiki.id, "prompt_id": wiki.prompt_id})
+                wiki_generation.update_status(user_interview_id, "done", prompt.id)
+                return wiki
+            except Exception as e:
+                logging.error(f"Error generating wiki {prompt.id} for {user_interview_id}: {e}")
+                db.rollback()
+                wiki_generation.update_status(user_interview_id, "failed", prompt.id)
+                # the text streamed so far is never completed
+                wiki_generation.clear_partial(user_interview_id, wiki_prompt_id)
+                publish_event(user_interview_id, WIKI_FAILED, {"prompt_id": wiki_prompt_id})
+                return None
+
+        wikis = await asyncio.gather(*[run(PromptModel.model_validate(prompt)) for prompt in prompts])
+        status = "finished" if all(wikis) else "failed"
+        wiki_generation.update_status(user_interview_id, status)
+        publish_event(user_interview_id, WIKIS_FINISHED, {"status": status})
+    except Exception as e:
+        logging.error(f"Error in generate_wikis: {e}")
+        db.rollback()
+        wiki_generation.update_status(user_interview_id, "failed")
+        publish_event(user_interview_id, WIKIS_FINISHED, {"status": "failed"})
+    finally:
+        db.close()
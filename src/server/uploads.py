@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import AsyncIterator, Dict, Optional
+
+from src.datamodel.interview import UserModel
+from src.helper.file import get_audio_path
+from src.helper.logger import getLogger
+from src.helper.transcript_cache import audio_hash
+from src.server.utils import get_redis
+
+logging = getLogger()
+
+UPLOAD_MAX_BYTES = int(os.getenv("BB_UPLOAD_MAX_BYTES", 100 * 1024 * 1024))
+UPLOAD_CHUNK_BYTES = int(os.getenv("BB_UPLOAD_CHUNK_BYTES", 1024 * 1024))
+UPLOAD_TTL = int(os.getenv("BB_UPLOAD_TTL", 60 * 60 * 24))
+# segments of one answer, their index is below this
+UPLOAD_MAX_SEGMENTS = int(os.getenv("BB_UPLOAD_MAX_SEGMENTS", 1000))
+# released by the request that holds it, expires in case that request dies
+UPLOAD_LOCK_TTL = 300
+
+redis = get_redis()
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+class UploadConflictError(Exception):
+    """The upload is not at the state the request expects, `offset` is where it actually is."""
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+
+def get_key(upload_id: str):
+    return f"upload:{upload_id}"
+
+
+def get_lock_key(upload_id: str):
+    return f"upload_lock:{upload_id}"
+
+
+def get_hash_key(path: str):
+    return f"audio_hash:{path}"
+
+
+def answer_filename(interview_id: int, question_id: int, user_id: int) -> str:
+    return f"a_ui{interview_id}_q{question_id}_u{user_id}.webm"
+
+
+def segment_filename(recording: str, index: int) -> str:
+    base, extension = os.path.splitext(recording)
+    return f"{base}.seg{index}{extension}"
+
+
+def get_audio_hash(path: str) -> Optional[str]:
+    """sha256 of an uploaded recording, computed while it was uploaded."""
+    digest = redis.get(get_hash_key(path))
+    return digest.decode("utf-8") if digest else None
+
+
+async def read_chunks(file) -> AsyncIterator[bytes]:
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        yield chunk
+
+
+async def write_stream(chunks: AsyncIterator[bytes], path: str, append: bool = False, limit: int = UPLOAD_MAX_BYTES, digest=None) -> int:
+    """
+    Writes the chunks to `path` in blocks of `BB_UPLOAD_CHUNK_BYTES`, file io runs in a thread so the event loop stays free.
+    Raises `UploadTooLargeError` before the file would grow past `limit`, blocks written until then are kept.
+    Returns the size of the file.
+    """
+    audio_file = await asyncio.to_thread(open, path, "ab" if append else "wb")
+    try:
+        size = await asyncio.to_thread(audio_file.tell)
+        block = bytearray()
+        async for chunk in chunks:
+            if size + len(block) + len(chunk) > limit:
+                raise UploadTooLargeError(f"Upload exceeds {limit} bytes")
+            block.extend(chunk)
+            if len(block) >= UPLOAD_CHUNK_BYTES:
+                size += await _write_block(audio_file, block, digest)
+                block = bytearray()
+        if block:
+            size += await _write_block(audio_file, block, digest)
+        return size
+    finally:
+        await asyncio.to_thread(audio_file.close)
+
+
+async def _write_block(audio_file, block: bytearray, digest) -> int:
+    await asyncio.to_thread(audio_file.write, block)
+    if digest is not None:
+        digest.update(block)
+    return len(block)
+
+
+def publish_audio(part_path: str, path: str, digest: str):
+    """Moves a finished upload to its final path, readers see either the old or the new recording."""
+    redis.delete(get_hash_key(path))
+    os.replace(part_path, path)
+    redis.set(get_hash_key(path), digest, ex=UPLOAD_TTL)
+
+
+async def save_upload(file, path: str) -> str:
+    """Streams an uploaded file to `path` and returns its sha256."""
+    part_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+    digest = hashlib.sha256()
+    try:
+        size = await write_stream(read_chunks(file), part_path, digest=digest)
+        await asyncio.to_thread(publish_audio, part_path, path, digest.hexdigest())
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    logging.info(f"save_upload - {path}: {size}B")
+    return digest.hexdigest()
+
+
+def remove_stale_parts(directory: str):
+    """Removes parts of uploads that were given up, their state in redis expired after `BB_UPLOAD_TTL`."""
+    deadline = time.time() - UPLOAD_TTL
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(".part") and entry.stat().st_mtime < deadline:
+                os.remove(entry.path)
+
+
+def create_upload(user_id: int, interview_id: int, question_id: int, size: int = None) -> Dict:
+    upload = {"upload_id": uuid.uuid4().hex, "user_id": user_id, "interview_id": interview_id,
+              "question_id": question_id, "size": size, "sha256": None}
+    part_path = get_part_path(upload)
+    remove_stale_parts(os.path.dirname(part_path))
+    open(part_path, "wb").close()
+    _save(upload)
+    return upload
+
+
+def get_upload(upload_id: str) -> Optional[Dict]:
+    data = redis.get(get_key(upload_id))
+    return json.loads(data) if data else None
+
+
+def _save(upload: Dict):
+    redis.set(get_key(upload["upload_id"]), json.dumps(upload), ex=UPLOAD_TTL)
+
+
+def _lock(upload: Dict) -> bool:
+    return bool(redis.set(get_lock_key(upload["upload_id"]), 1, nx=True, ex=UPLOAD_LOCK_TTL))
+
+
+def _unlock(upload: Dict):
+    redis.delete(get_lock_key(upload["upload_id"]))
+
+
+def get_part_path(upload: Dict) -> str:
+    return get_audio_path("user", f"upload_{upload['upload_id']}.part", UserModel(id=upload["user_id"], username=""))
+
+
+def get_offset(upload: Dict) -> int:
+    """Bytes received so far, the part file only ever holds complete chunks."""
+    if upload["sha256"]:
+        return upload["size"]
+    part_path = get_part_path(upload)
+    return os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+
+async def append_chunk(upload: Dict, offset: int, chunks: AsyncIterator[bytes]) -> int:
+    """Appends the chunks of a request at `offset`, which has to be the current end of the upload. Returns the new offset."""
+    if not await asyncio.to_thread(_lock, upload):
+        raise UploadConflictError("Another chunk of this upload is being written", get_offset(upload))
+    try:
+        current = get_offset(upload)
+        if upload["sha256"]:
+            raise UploadConflictError("Upload is already completed", current)
+        if offset != current:
+            raise UploadConflictError(f"Upload is at offset {current}", current)
+        limit = min(upload["size"], UPLOAD_MAX_BYTES) if upload["size"] else UPLOAD_MAX_BYTES
+        offset = await write_stream(chunks, get_part_path(upload), append=True, limit=limit)
+        await asyncio.to_thread(_save, upload)
+        return offset
+    finally:
+        await asyncio.to_thread(_unlock, upload)
+
+
+async def complete_upload(upload: Dict) -> Dict:
+    """Publishes the received recording under the answer's filename, completing twice is a no-op."""
+    if upload["sha256"]:
+        return upload
+    if not await asyncio.to_thread(_lock, upload):
+        raise UploadConflictError("A chunk of this upload is being written", get_offset(upload))
+    try:
+        part_path = get_part_path(upload)
+        size = get_offset(upload)
+        if size == 0 or (upload["size"] and size != upload["size"]):
+            raise UploadConflictError(f"Upload is incomplete at offset {size}", size)
+
+        digest = await asyncio.to_thread(audio_hash, part_path)
+        filename = answer_filename(upload["interview_id"], upload["question_id"], upload["user_id"])
+        await asyncio.to_thread(publish_audio, part_path, get_audio_path("user", filename, UserModel(id=upload["user_id"], username="")), digest)
+
+        upload.update(size=size, sha256=digest, filename=filename)
+        await asyncio.to_thread(_save, upload)
+        logging.info(f"complete_upload - {upload['upload_id']} -> {filename}: {size}B")
+        return upload
+    finally:
+        await asyncio.to_thread(_unlock, upload)
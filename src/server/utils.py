@@ -3,7 +3,8 @@ import decimal
 import os
 from fastapi import UploadFile
 from redis import Redis
-from src.datamodel.manager.sqldb_manager import SessionLocal
+from redis.asyncio import Redis as AsyncRedis
+from src.datamodel.manager.sqldb_manager import AsyncSessionLocal, SessionLocal
 from src.helper.utils import get_env_prop
 
 
@@ -15,6 +16,11 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def alchemy_encoder(obj):
     """JSON encoder function for SQLAlchemy special classes."""
     if isinstance(obj, datetime.date):
@@ -33,6 +39,16 @@ def get_redis():
     )
 
 
+def get_async_redis():
+    host = get_env_prop("REDIS_HOST")
+    port = get_env_prop("REDIS_PORT")
+
+    return AsyncRedis(
+        host=host,
+        port=port
+    )
+
+
 def get_extension(file: UploadFile):
     _, file_extension = os.path.splitext(file.filename)
     return file_extension
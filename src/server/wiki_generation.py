@@ -0,0 +1,146 @@
+import json
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from src.helper.logger import getLogger
+from src.server.queue_setup import q
+from src.server.utils import get_redis
+
+logging = getLogger()
+
+WIKI_GENERATION_TTL = int(os.getenv("BB_WIKI_GENERATION_TTL", 60 * 60 * 24))
+# seconds between registering a generation and enqueueing its job, a job missing for longer is gone
+ENQUEUE_GRACE_SECONDS = 60
+
+redis = get_redis()
+
+
+def get_key(user_interview_id: int):
+    return f"wiki_generation:{user_interview_id}"
+
+
+def get_partial_key(user_interview_id: int, prompt_id: str = None):
+    """Key of the text streamed for one prompt, without a prompt the set of prompts that are streaming."""
+    if prompt_id is None:
+        return f"wiki_partial:{user_interview_id}"
+    return f"wiki_partial:{user_interview_id}:{prompt_id}"
+
+
+def get_generation(user_interview_id: int) -> Optional[Dict]:
+    data = redis.get(get_key(user_interview_id))
+    return json.loads(data) if data else None
+
+
+async def get_generation_async(client, user_interview_id: int) -> Optional[Dict]:
+    """`get_generation` on an async Redis client, for readers on the event loop."""
+    data = await client.get(get_key(user_interview_id))
+    return json.loads(data) if data else None
+
+
+def start_generation(user_interview_id: int) -> tuple[Dict, bool]:
+    """
+    Registers the wiki generation of a user interview. Only the first caller creates it,
+    concurrent callers get the already registered generation and `False`.
+    """
+    generation = {"job_id": f"wiki_{user_interview_id}_{uuid.uuid4().hex[:8]}", "status": "queued", "progress": {},
+                  "created": time.time()}
+    created = redis.set(get_key(user_interview_id), json.dumps(generation), nx=True, ex=WIKI_GENERATION_TTL)
+    if not created:
+        return get_generation(user_interview_id), False
+    return generation, True
+
+
+def clear_generation(user_interview_id: int):
+    for prompt_id in get_partials(user_interview_id):
+        clear_partial(user_interview_id, prompt_id)
+    redis.delete(get_key(user_interview_id))
+
+
+def _save(user_interview_id: int, generation: Dict):
+    redis.set(get_key(user_interview_id), json.dumps(generation), ex=WIKI_GENERATION_TTL)
+
+
+def set_prompts(user_interview_id: int, prompt_ids: List[str], done: List[str] = ()):
+    """Prompts of the generation, `done` are the ones a previous attempt already generated."""
+    generation = get_generation(user_interview_id)
+    generation["progress"] = {prompt_id: "done" if prompt_id in done else "pending" for prompt_id in prompt_ids}
+    _save(user_interview_id, generation)
+
+
+def done_prompts(generation: Optional[Dict]) -> List[str]:
+    return [prompt_id for prompt_id, status in (generation or {}).get("progress", {}).items() if status == "done"]
+
+
+def check_job(user_interview_id: int, generation: Optional[Dict]) -> Optional[Dict]:
+    """
+    Stores a queued or running generation as failed if its job failed or is gone. RQ kills the job at its
+    timeout and a dying worker leaves it behind, neither updates the generation.
+    """
+    if generation is None or generation["status"] not in ["queued", "running"]:
+        return generation
+    job = q.fetch_job(generation["job_id"])
+    if job is None:
+        # the job is enqueued right after the generation is registered
+        if time.time() - generation.get("created", 0) < ENQUEUE_GRACE_SECONDS:
+            return generation
+    elif not job.is_failed:
+        return generation
+    logging.warning(f"Wiki generation {generation['job_id']} of {user_interview_id} lost its job, marking it failed")
+    generation["status"] = "failed"
+    update_status(user_interview_id, "failed")
+    return generation
+
+
+def get_current_generation(user_interview_id: int) -> Optional[Dict]:
+    return check_job(user_interview_id, get_generation(user_interview_id))
+
+
+def update_status(user_interview_id: int, status: str, prompt_id: str = None):
+    """Sets the state of one prompt if `prompt_id` is given, otherwise the state of the whole generation."""
+    generation = get_generation(user_interview_id)
+    if generation is None:
+        logging.error(f"No wiki generation registered for {user_interview_id}")
+        return
+    if prompt_id is None:
+        generation["status"] = status
+    else:
+        generation["progress"][prompt_id] = status
+    _save(user_interview_id, generation)
+
+
+def append_partial(user_interview_id: int, prompt_id: str, text: str):
+    """Appends streamed text of a wiki that is still generated, every prompt has a single writer."""
+    key = get_partial_key(user_interview_id, prompt_id)
+    pipe = redis.pipeline()
+    pipe.append(key, text.encode("utf-8"))
+    pipe.expire(key, WIKI_GENERATION_TTL)
+    pipe.sadd(get_partial_key(user_interview_id), prompt_id)
+    pipe.expire(get_partial_key(user_interview_id), WIKI_GENERATION_TTL)
+    pipe.execute()
+
+
+def get_partials(user_interview_id: int) -> Dict[str, str]:
+    """Text streamed so far per prompt of wikis that are still generated."""
+    prompt_ids = sorted(prompt_id.decode("utf-8") for prompt_id in redis.smembers(get_partial_key(user_interview_id)))
+    if not prompt_ids:
+        return {}
+    values = redis.mget([get_partial_key(user_interview_id, prompt_id) for prompt_id in prompt_ids])
+    return {prompt_id: value.decode("utf-8") for prompt_id, value in zip(prompt_ids, values) if value}
+
+
+async def get_partials_async(client, user_interview_id: int) -> Dict[str, str]:
+    """`get_partials` on an async Redis client, for readers on the event loop."""
+    prompt_ids = sorted(prompt_id.decode("utf-8") for prompt_id in await client.smembers(get_partial_key(user_interview_id)))
+    if not prompt_ids:
+        return {}
+    values = await client.mget([get_partial_key(user_interview_id, prompt_id) for prompt_id in prompt_ids])
+    return {prompt_id: value.decode("utf-8") for prompt_id, value in zip(prompt_ids, values) if value}
+
+
+def clear_partial(user_interview_id: int, prompt_id: str):
+    pipe = redis.pipeline()
+    pipe.delete(get_partial_key(user_interview_id, prompt_id))
+    pipe.srem(get_partial_key(user_interview_id), prompt_id)
+    pipe.execute()